@@ -14,6 +14,8 @@ import os
 import environ
 from pathlib import Path
 
+from health_linkr_app.db import database_settings, replica_settings
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -50,6 +52,23 @@ EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD', default='your-app-specific-pass
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploaded media is stored once per distinct content, see health_linkr_app.storage
+STORAGES = {
+    'default': {
+        'BACKEND': 'health_linkr_app.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Profile photo processing
+PROFILE_PHOTO_SIZES = (64, 128, 256)
+IMAGE_WORKERS = env.int('IMAGE_WORKERS', default=2)
+# 'nginx' (X-Accel-Redirect), 'apache' (X-Sendfile) or '' to stream from Django
+SENDFILE_BACKEND = env('SENDFILE_BACKEND', default='')
+SENDFILE_URL_PREFIX = env('SENDFILE_URL_PREFIX', default='/protected-media/')
+
 INSTALLED_APPS = [
     'health_linkr_app',
     'django.contrib.admin',
@@ -58,15 +77,60 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
+# Cache (locmem by default; point CACHE_URL at redis/memcached when running several processes)
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://?MAX_ENTRIES=20000'),
+}
+
+# How long the slots picked for a booking stay reserved while the form is filled in.
+# Holds live in the default cache; sweep_slot_holds needs it shared (not locmem)
+SLOT_HOLD_SECONDS = env.int('SLOT_HOLD_SECONDS', default=300)
+
+# Redirects answering POSTs that carry an idempotency key are replayed to retries for
+# IDEMPOTENCY_TTL seconds; a duplicate arriving mid-request waits up to
+# IDEMPOTENCY_WAIT_SECONDS for the first to finish. Keys live in the default cache,
+# so retries are only recognised across worker processes when it is shared (not locmem)
+IDEMPOTENCY_TTL = env.int('IDEMPOTENCY_TTL', default=24 * 60 * 60)
+IDEMPOTENCY_LOCK_SECONDS = env.int('IDEMPOTENCY_LOCK_SECONDS', default=30)
+IDEMPOTENCY_WAIT_SECONDS = env.float('IDEMPOTENCY_WAIT_SECONDS', default=5.0)
+
+# How long a freed slot stays reserved for the waitlisted patient it was offered to
+WAITLIST_OFFER_SECONDS = env.int('WAITLIST_OFFER_SECONDS', default=3600)
+
+# Rendered appointment cards are cached per (appointment, updated_at)
+APPOINTMENT_CARD_TIMEOUT = env.int('APPOINTMENT_CARD_TIMEOUT', default=24 * 60 * 60)
+
 # Session settings
 SESSION_COOKIE_AGE = 30 * 60  # 30 minutes in seconds
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 SESSION_SAVE_EVERY_REQUEST = True
+SESSION_IDLE_SECONDS = 30 * 60
+# 'django.contrib.sessions.backends.cache' or '.signed_cookies' keep sessions out of the
+# database; forced logouts then rely on the revocation list in SESSION_CACHE_ALIAS, which
+# must be a cache shared by all workers (not locmem)
+SESSION_ENGINE = env('SESSION_ENGINE', default='django.contrib.sessions.backends.db')
+SESSION_CACHE_ALIAS = env('SESSION_CACHE_ALIAS', default='default')
+
+# Expired session sweeping (sweep_sessions command, or every SESSION_SWEEP_INTERVAL
+# seconds in-process when set); skipped during SESSION_SWEEP_PEAK_HOURS ("08:00-18:00")
+SESSION_SWEEP_INTERVAL = env.int('SESSION_SWEEP_INTERVAL', default=0)
+SESSION_SWEEP_PEAK_HOURS = env('SESSION_SWEEP_PEAK_HOURS', default='')
+SESSION_SWEEP_CHUNK_SIZE = env.int('SESSION_SWEEP_CHUNK_SIZE', default=500)
+SESSION_SWEEP_PAUSE = env.float('SESSION_SWEEP_PAUSE', default=0.1)
+# Logs of sessions that cannot be checked server-side (signed cookies) are closed after this
+SESSION_LOG_MAX_AGE = env.int('SESSION_LOG_MAX_AGE', default=12 * 60 * 60)
+
+# Addresses or CIDR ranges of our reverse proxies; X-Forwarded-For is only
+# followed through these when resolving the client IP
+TRUSTED_PROXIES = env.list('TRUSTED_PROXIES', default=[])
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'health_linkr_app.middleware.RequestProfilingMiddleware',
+    'health_linkr_app.middleware.NPlusOneMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -75,16 +139,27 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'health_linkr_app.middleware.AuthRequiredMiddleware',
     'health_linkr_app.middleware.SessionExpiryMiddleware',
+    'health_linkr_app.middleware.ReplicaRoutingMiddleware',
+    'health_linkr_app.middleware.HashingPoolBusyMiddleware',
+    'health_linkr_app.middleware.StatementTimeoutMiddleware',
 ]
 
 ROOT_URLCONF = 'health_linkr.urls'
 
+# Compiled templates are kept in memory unless TEMPLATE_CACHE is off
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if env.bool('TEMPLATE_CACHE', default=True):
+    TEMPLATE_LOADERS = [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -102,17 +177,57 @@ WSGI_APPLICATION = 'health_linkr.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connections persist for DB_CONN_MAX_AGE seconds with health checks, or come
+# from the psycopg 3 pool when DB_POOL is set (psycopg[pool] must be installed in
+# place of psycopg2); see health_linkr_app.db
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': env('PG_DATABASE'),
-        'USER': env('PG_USER'),
-        'PASSWORD': env('PG_PASSWORD'),
-        'HOST': env('PG_HOST'),
-        'PORT': env('PG_PORT'),
-    }
+    'default': database_settings(env),
 }
 
+# Read replicas ("host" or "host:port"); read-only views and admin changelists
+# read from them unless the session wrote within REPLICA_PIN_SECONDS
+DATABASES.update(replica_settings(DATABASES['default'], env.list('DB_REPLICA_HOSTS', default=[])))
+DATABASE_ROUTERS = ['health_linkr_app.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = env.int('REPLICA_PIN_SECONDS', default=30)
+REPLICA_VIEWS = env.list('REPLICA_VIEWS', default=[])
+
+# Per-view statement timeouts in milliseconds, keyed by URL name
+STATEMENT_TIMEOUTS = env.dict('STATEMENT_TIMEOUTS', cast={'value': int}, default={})
+
+# Fraction of requests profiled (0 disables); aggregates are flushed to the cache
+# every PROFILING_FLUSH_EVERY samples or PROFILING_FLUSH_SECONDS
+PROFILING_SAMPLE_RATE = env.float('PROFILING_SAMPLE_RATE', default=0.0)
+PROFILING_FLUSH_EVERY = env.int('PROFILING_FLUSH_EVERY', default=20)
+PROFILING_FLUSH_SECONDS = env.int('PROFILING_FLUSH_SECONDS', default=10)
+PROFILING_HEADER = env.bool('PROFILING_HEADER', default=False)
+
+# N+1 detection: 'raise' (set in test_settings), 'log' for staging, or 'off'.
+# A relation lazily loaded NPLUSONE_THRESHOLD times in one request is reported unless
+# it matches an "app_label.Model.field" pattern in NPLUSONE_ALLOWLIST.
+NPLUSONE_MODE = env('NPLUSONE_MODE', default='off')
+NPLUSONE_THRESHOLD = env.int('NPLUSONE_THRESHOLD', default=2)
+NPLUSONE_ALLOWLIST = env.list('NPLUSONE_ALLOWLIST', default=[])
+
+
+# Password hashing
+# Hashes run on a bounded thread pool (health_linkr_app.passwords); stored hashes
+# are upgraded on login whenever PASSWORD_HASH_ITERATIONS changes. Queueing counters
+# are served to admins at /internal/password-hashing/ and logged when a hash is rejected.
+
+PASSWORD_HASHERS = [
+    'health_linkr_app.passwords.TunedPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASH_ITERATIONS = env.int('PASSWORD_HASH_ITERATIONS', default=1_000_000)
+PASSWORD_HASH_WORKERS = env.int('PASSWORD_HASH_WORKERS', default=os.cpu_count() or 1)
+PASSWORD_HASH_QUEUE_SIZE = env.int('PASSWORD_HASH_QUEUE_SIZE', default=64)
+PASSWORD_HASH_QUEUE_TIMEOUT = env.float('PASSWORD_HASH_QUEUE_TIMEOUT', default=5.0)
+
+AUTHENTICATION_BACKENDS = ['health_linkr_app.passwords.PooledModelBackend']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -0,0 +1,36 @@
+"""Settings for the test suite: SQLite, so tests run without a PostgreSQL server
+
+    python manage.py test --settings=health_linkr.test_settings
+"""
+import os
+
+for name in ('PG_DATABASE', 'PG_USER', 'PG_PASSWORD', 'PG_HOST', 'PG_PORT'):
+    os.environ.setdefault(name, '')
+
+from .settings import *  # noqa: E402,F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test.sqlite3',
+    },
+    # A second alias so replica routing is exercised; it mirrors the test database
+    'replica_1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+# Some migrations use PostgreSQL-only SQL; build the test schema from the models
+MIGRATION_MODULES = {'health_linkr_app': None}
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+# Hashing a million PBKDF2 rounds per created user would dominate the run
+PASSWORD_HASH_ITERATIONS = 1000
+
+# Fail any test whose request lazily loads a relation in a loop
+NPLUSONE_MODE = 'raise'
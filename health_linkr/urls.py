@@ -15,11 +15,17 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from health_linkr_app.views import media_blob
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    re_path(
+        r'^%scas/[0-9a-f]{2}/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(?P<ext>\.[A-Za-z0-9]+)?$' % settings.MEDIA_URL.lstrip('/'),
+        media_blob,
+        name='media_blob'
+    ),
     path('', include('health_linkr_app.urls')),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
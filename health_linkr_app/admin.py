@@ -1,14 +1,63 @@
+from datetime import timedelta
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
 from django.db import transaction
 from django.contrib.auth.models import Permission
-from django.db.models import Q
+from django.db.models import Count, Q
+from django.utils import timezone
 from django.utils.html import format_html
 from .models import (
     User, Role, PatientProfile, DoctorProfile, Clinic,
     Service, ScheduleSlot, Appointment, Notification,
-    SessionLog, AuditTrail
+    SessionLog, AuditTrail, AppointmentDailyStat, WaitlistEntry, UserAgent, SearchDocument
 )
+from .forms import BulkRescheduleForm, OnboardingImportForm
+from .allocation import SlotAllocationError
+from .caching import invalidate_appointments
+from .importer import OnboardingImportError, import_file
+from .rescheduling import reschedule_absence
+from .revocation import revoke, revoke_sessions
+from .search import search_ids
+from .stats import period_totals, record_change, record_queryset_removal, record_queryset_transition
+from .waitlist import offer_freed_slots_on_commit
+
+class ChoiceLabelsMixin:
+    """Select the relations that foreign key choice labels (__str__) follow"""
+
+    choice_select_related = {
+        'doctor': ('user',),
+        'service': ('clinic',),
+        'slot': ('doctor__user',),
+        'offered_slot': ('doctor__user',),
+    }
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        related = self.choice_select_related.get(db_field.name)
+        if formfield is not None and related and hasattr(formfield, 'queryset'):
+            formfield.queryset = formfield.queryset.select_related(*related)
+        return formfield
+
+class IndexedSearchMixin:
+    """Answer changelist searches from the search index (search.py) instead of ILIKE scans"""
+
+    search_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=search_ids(search_term, self.search_kind)), False
+
+class ServiceListFilter(admin.RelatedFieldListFilter):
+    """Service filter whose labels (which name the clinic) come from one query"""
+
+    def field_choices(self, field, request, model_admin):
+        ordering = self.field_admin_ordering(field, request, model_admin) or ('name',)
+        return [(service.pk, str(service)) for service in Service.objects.select_related('clinic').order_by(*ordering)]
 
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
@@ -24,6 +73,51 @@ class CustomUserAdmin(UserAdmin):
         }),
         ('Important dates', {'fields': ('last_login', 'date_joined')}),
     )
+    change_list_template = 'admin/health_linkr_app/user/change_list.html'
+    actions = ['force_logout']
+
+    def force_logout(self, request, queryset):
+        """Bulk action to end every open session of the selected users"""
+        revoked = revoke(users=queryset)
+        self.message_user(request, f'{revoked} sessions were revoked.')
+    force_logout.short_description = 'Log out selected users everywhere'
+
+    def get_urls(self):
+        urls = [
+            path('import/', self.admin_site.admin_view(self.import_view), name='health_linkr_app_user_import'),
+        ]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        """Bulk onboarding of patients or doctors from an uploaded file"""
+        if not request.user.is_superuser:
+            return redirect('admin:index')
+        if request.method == 'POST':
+            form = OnboardingImportForm(request.POST, request.FILES)
+            if form.is_valid():
+                upload = form.cleaned_data['file']
+                try:
+                    result = import_file(
+                        upload.file, upload.name, form.cleaned_data['kind'],
+                        clinic=form.cleaned_data['clinic'],
+                        dry_run=form.cleaned_data['dry_run']
+                    )
+                except OnboardingImportError as e:
+                    form.add_error(None, str(e))
+                    context = dict(self.admin_site.each_context(request), form=form, opts=self.model._meta,
+                                   title='Import users')
+                    return TemplateResponse(request, 'admin/health_linkr_app/user/import.html', context)
+                verb = 'validated' if form.cleaned_data['dry_run'] else 'imported'
+                self.message_user(request, f'{result.created} users {verb}, {result.skipped} rows skipped.')
+                if not result.errors:
+                    return redirect('admin:health_linkr_app_user_changelist')
+                context = dict(self.admin_site.each_context(request), form=form, errors=result.errors,
+                               opts=self.model._meta, title='Import users')
+                return TemplateResponse(request, 'admin/health_linkr_app/user/import.html', context)
+        else:
+            form = OnboardingImportForm()
+        context = dict(self.admin_site.each_context(request), form=form, opts=self.model._meta, title='Import users')
+        return TemplateResponse(request, 'admin/health_linkr_app/user/import.html', context)
 
 @admin.register(Role)
 class RoleAdmin(admin.ModelAdmin):
@@ -33,25 +127,87 @@ class RoleAdmin(admin.ModelAdmin):
 @admin.register(PatientProfile)
 class PatientProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'full_name', 'gender', 'phone')
+    list_select_related = ('user',)
+    # Served by trigram indexes on PostgreSQL (migration 0017), so ILIKE '%term%' does not scan
     search_fields = ('full_name', 'phone')
     list_filter = ('gender',)
 
 @admin.register(Clinic)
-class ClinicAdmin(admin.ModelAdmin):
+class ClinicAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('name', 'address', 'contact_number', 'is_active')
     search_fields = ('name', 'address')
+    search_kind = SearchDocument.CLINIC
     list_filter = ('is_active',)
+    actions = ['force_logout_doctors']
+
+    def force_logout_doctors(self, request, queryset):
+        """Bulk action to end every open session of the selected clinics' doctors"""
+        revoked = revoke(clinics=queryset)
+        self.message_user(request, f'{revoked} sessions were revoked.')
+    force_logout_doctors.short_description = "Log out selected clinics' doctors"
 
 @admin.register(DoctorProfile)
-class DoctorProfileAdmin(admin.ModelAdmin):
+class DoctorProfileAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('user', 'specialty', 'clinic', 'is_active')
+    list_select_related = ('user', 'clinic')
     search_fields = ('user__username', 'specialty')
+    search_kind = SearchDocument.DOCTOR
     list_filter = ('specialty', 'clinic', 'is_active')
+    actions = ['reschedule_absence']
+
+    def get_urls(self):
+        urls = [
+            path('<int:doctor_id>/reschedule/', self.admin_site.admin_view(self.reschedule_view),
+                 name='health_linkr_app_doctorprofile_reschedule'),
+        ]
+        return urls + super().get_urls()
+
+    def reschedule_absence(self, request, queryset):
+        """Bulk action to move a doctor's appointments out of an absence"""
+        if queryset.count() != 1:
+            self.message_user(request, 'Select exactly one doctor to reschedule.', level='warning')
+            return None
+        return redirect('admin:health_linkr_app_doctorprofile_reschedule', doctor_id=queryset.get().pk)
+    reschedule_absence.short_description = 'Reschedule appointments for an absence'
+
+    def reschedule_view(self, request, doctor_id):
+        """Preview and apply a bulk reschedule of a doctor's appointments"""
+        if not request.user.is_superuser:
+            return redirect('admin:index')
+        doctor = self.get_object(request, doctor_id)
+        if doctor is None:
+            return redirect('admin:health_linkr_app_doctorprofile_changelist')
+        plan = None
+        apply = False
+        form = BulkRescheduleForm(request.POST or None)
+        if request.method == 'POST' and form.is_valid():
+            apply = 'apply' in request.POST
+            try:
+                plan = reschedule_absence(
+                    doctor, form.cleaned_data['start_date'], form.cleaned_data['end_date'], apply=apply,
+                    include_colleagues=form.cleaned_data['include_colleagues']
+                )
+            except SlotAllocationError as e:
+                self.message_user(request, str(e), level='error')
+            else:
+                if apply:
+                    self.message_user(
+                        request,
+                        f'{len(plan.moves)} appointments rescheduled, {len(plan.unassigned)} could not be moved.'
+                    )
+                    if not plan.unassigned:
+                        return redirect('admin:health_linkr_app_doctorprofile_changelist')
+        context = dict(self.admin_site.each_context(request), form=form, plan=plan, applied=apply and plan is not None,
+                       doctor=doctor,
+                       opts=self.model._meta, title=f'Reschedule appointments for {doctor}')
+        return TemplateResponse(request, 'admin/health_linkr_app/doctorprofile/reschedule.html', context)
 
 @admin.register(Service)
-class ServiceAdmin(admin.ModelAdmin):
+class ServiceAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('name', 'clinic', 'duration_minutes', 'fee', 'is_active')
+    list_select_related = ('clinic',)
     search_fields = ('name',)
+    search_kind = SearchDocument.SERVICE
     list_filter = ('clinic', 'is_active')
     ordering = ['name']
     
@@ -73,8 +229,9 @@ class ServiceAdmin(admin.ModelAdmin):
         return request.user.is_superuser
 
 @admin.register(ScheduleSlot)
-class ScheduleSlotAdmin(admin.ModelAdmin):
+class ScheduleSlotAdmin(ChoiceLabelsMixin, admin.ModelAdmin):
     list_display = ('doctor', 'start_time', 'end_time', 'is_booked', 'is_available')
+    list_select_related = ('doctor__user',)
     search_fields = ('doctor__user__username',)
     list_filter = ('is_booked', 'is_available')
     date_hierarchy = 'start_time'
@@ -116,10 +273,11 @@ class ScheduleSlotAdmin(admin.ModelAdmin):
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 @admin.register(Appointment)
-class AppointmentAdmin(admin.ModelAdmin):
+class AppointmentAdmin(ChoiceLabelsMixin, admin.ModelAdmin):
     list_display = ('patient_name', 'doctor_name', 'service_name', 'formatted_datetime', 'colored_status', 'notes_preview')
-    list_filter = ('status', 'datetime', 'service')
+    list_filter = ('status', 'datetime', ('service', ServiceListFilter))
     search_fields = ('patient__full_name', 'doctor__user__username', 'notes')
+    list_select_related = ('patient', 'doctor__user', 'service')
     date_hierarchy = 'datetime'
     list_per_page = 20
     actions = ['mark_as_confirmed', 'mark_as_completed', 'mark_as_cancelled']
@@ -176,6 +334,24 @@ class AppointmentAdmin(admin.ModelAdmin):
         }),
     )
 
+    def changelist_view(self, request, extra_context=None):
+        """Counts per status above the list, read from the daily rollup table"""
+        today = timezone.localdate()
+        filters = {}
+        if not request.user.is_superuser and hasattr(request.user, 'doctor_profile'):
+            filters['doctor'] = request.user.doctor_profile
+        totals = period_totals([
+            ('Last 30 days', today - timedelta(days=30), today - timedelta(days=1)),
+            ('Today', today, today),
+            ('Next 7 days', today + timedelta(days=1), today + timedelta(days=7)),
+        ], **filters)
+        extra_context = {
+            **(extra_context or {}),
+            'status_labels': [label for _, label in Appointment.STATUS_CHOICES],
+            'status_totals': [(period, list(counts.values())) for period, counts in totals.items()],
+        }
+        return super().changelist_view(request, extra_context)
+
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
@@ -223,6 +399,7 @@ class AppointmentAdmin(admin.ModelAdmin):
         return self.get_fields(request)
 
     def save_model(self, request, obj, form, change):
+        old_obj = None
         if change:
             old_obj = self.model.objects.get(pk=obj.pk)
             old_status = old_obj.status
@@ -258,6 +435,17 @@ class AppointmentAdmin(admin.ModelAdmin):
                 )
         
         super().save_model(request, obj, form, change)
+        record_change(old_obj, obj)
+        if obj.freed_slots:
+            offer_freed_slots_on_commit(obj.freed_slots)
+
+    def delete_model(self, request, obj):
+        record_change(obj, None)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        record_queryset_removal(queryset)
+        super().delete_queryset(request, queryset)
 
     class Media:
         css = {
@@ -266,8 +454,11 @@ class AppointmentAdmin(admin.ModelAdmin):
 
     def mark_as_confirmed(self, request, queryset):
         """Bulk action to mark appointments as confirmed"""
-        updated = queryset.update(status='CONFIRMED')
-        for appointment in queryset:
+        with transaction.atomic():
+            record_queryset_transition(queryset, 'CONFIRMED')
+            invalidate_appointments(queryset.values_list('patient_id', 'doctor_id'))
+            updated = queryset.update(status='CONFIRMED', updated_at=timezone.now())
+        for appointment in queryset.select_related('patient__user', 'doctor__user'):
             Notification.objects.create(
                 user=appointment.patient.user,
                 type='IN_APP',
@@ -279,8 +470,11 @@ class AppointmentAdmin(admin.ModelAdmin):
 
     def mark_as_completed(self, request, queryset):
         """Bulk action to mark appointments as completed"""
-        updated = queryset.update(status='COMPLETED')
-        for appointment in queryset:
+        with transaction.atomic():
+            record_queryset_transition(queryset, 'COMPLETED')
+            invalidate_appointments(queryset.values_list('patient_id', 'doctor_id'))
+            updated = queryset.update(status='COMPLETED', updated_at=timezone.now())
+        for appointment in queryset.select_related('patient__user', 'doctor__user'):
             Notification.objects.create(
                 user=appointment.patient.user,
                 type='IN_APP',
@@ -292,16 +486,21 @@ class AppointmentAdmin(admin.ModelAdmin):
 
     def mark_as_cancelled(self, request, queryset):
         """Bulk action to mark appointments as cancelled"""
+        freed_slots = []
         with transaction.atomic():
-            for appointment in queryset:
+            record_queryset_transition(queryset, 'CANCELLED')
+            for appointment in queryset.select_related('slot', 'patient__user', 'doctor__user'):
                 appointment.status = 'CANCELLED'
                 appointment.save()  # This will trigger the save method to free up slots
+                freed_slots.extend(appointment.freed_slots)
                 Notification.objects.create(
                     user=appointment.patient.user,
                     type='IN_APP',
                     title='Appointment Cancelled',
                     message=f'Your appointment with Dr. {appointment.doctor.user.get_full_name()} scheduled for {appointment.datetime.strftime("%B %d, %Y at %I:%M %p")} has been cancelled.'
                 )
+            # Offer all freed slots to the waitlist in one pass
+            offer_freed_slots_on_commit(freed_slots)
         self.message_user(request, f'{queryset.count()} appointments were successfully cancelled.')
     mark_as_cancelled.short_description = 'Mark selected appointments as cancelled'
 
@@ -325,23 +524,81 @@ class AppointmentAdmin(admin.ModelAdmin):
                         ]
         return super().formfield_for_choice_field(db_field, request, **kwargs)
 
+@admin.register(AppointmentDailyStat)
+class AppointmentDailyStatAdmin(admin.ModelAdmin):
+    list_display = ('date', 'clinic', 'doctor', 'service', 'status', 'count')
+    list_filter = ('status', 'clinic')
+    date_hierarchy = 'date'
+    list_select_related = ('clinic', 'doctor__user', 'service__clinic')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(ChoiceLabelsMixin, admin.ModelAdmin):
+    list_display = ('patient', 'doctor', 'service', 'window_start', 'window_end', 'priority', 'status', 'offered_at')
+    list_filter = ('status', 'doctor__clinic')
+    list_editable = ('priority',)
+    search_fields = ('patient__full_name', 'doctor__user__first_name', 'doctor__user__last_name')
+    list_select_related = ('patient', 'doctor__user', 'service')
+    raw_id_fields = ('patient', 'offered_slot')
+
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
     list_display = ('user', 'type', 'title', 'sent_at', 'read_flag')
+    list_select_related = ('user',)
     search_fields = ('user__username', 'title', 'message')
     list_filter = ('type', 'read_flag')
     date_hierarchy = 'sent_at'
 
 @admin.register(SessionLog)
 class SessionLogAdmin(admin.ModelAdmin):
-    list_display = ('user', 'login_time', 'logout_time', 'is_expired', 'ip_address')
+    list_display = ('user', 'login_time', 'logout_time', 'is_expired', 'ip_address', 'user_agent')
+    list_select_related = ('user', 'user_agent')
     search_fields = ('user__username', 'ip_address')
-    list_filter = ('is_expired',)
+    list_filter = ('is_expired', 'user_agent__device_type', 'user_agent__browser', 'user_agent__os')
+    raw_id_fields = ('user_agent',)
     date_hierarchy = 'login_time'
+    actions = ['force_logout', 'force_logout_ip_addresses']
+
+    def force_logout(self, request, queryset):
+        """Bulk action to end the selected sessions"""
+        revoked = revoke_sessions(queryset)
+        self.message_user(request, f'{revoked} sessions were revoked.')
+    force_logout.short_description = 'Log out selected sessions'
+
+    def force_logout_ip_addresses(self, request, queryset):
+        """Bulk action to end every open session from the selected sessions' IP addresses"""
+        addresses = set(queryset.exclude(ip_address=None).values_list('ip_address', flat=True))
+        revoked = revoke(ip_addresses=addresses)
+        self.message_user(request, f'{revoked} sessions from {len(addresses)} IP addresses were revoked.')
+    force_logout_ip_addresses.short_description = 'Log out every session from these IP addresses'
+
+@admin.register(UserAgent)
+class UserAgentAdmin(admin.ModelAdmin):
+    list_display = ('browser', 'browser_version', 'os', 'device_type', 'session_count', 'first_seen')
+    list_filter = ('device_type', 'browser', 'os')
+    search_fields = ('raw',)
+    readonly_fields = ('digest', 'raw', 'browser', 'browser_version', 'os', 'device_type', 'first_seen')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(session_total=Count('session_logs'))
+
+    def session_count(self, obj):
+        return obj.session_total
+    session_count.short_description = 'Sessions'
+    session_count.admin_order_field = 'session_total'
+
+    def has_add_permission(self, request):
+        return False
 
 @admin.register(AuditTrail)
 class AuditTrailAdmin(admin.ModelAdmin):
     list_display = ('user', 'action', 'model_name', 'timestamp', 'ip_address')
+    list_select_related = ('user',)
     search_fields = ('user__username', 'action', 'model_name')
     list_filter = ('action', 'model_name')
     date_hierarchy = 'timestamp'
@@ -391,6 +648,9 @@ admin.site.register(Clinic, ClinicAdmin)
 admin.site.register(Service, ServiceAdmin)
 admin.site.register(ScheduleSlot, ScheduleSlotAdmin)
 admin.site.register(Appointment, AppointmentAdmin)
+admin.site.register(AppointmentDailyStat, AppointmentDailyStatAdmin)
+admin.site.register(WaitlistEntry, WaitlistEntryAdmin)
 admin.site.register(Notification, NotificationAdmin)
 admin.site.register(SessionLog, SessionLogAdmin)
+admin.site.register(UserAgent, UserAgentAdmin)
 admin.site.register(AuditTrail, AuditTrailAdmin)
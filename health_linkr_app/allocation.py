@@ -0,0 +1,128 @@
+from collections import deque
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .caching import invalidate_slots
+from .models import ScheduleSlot
+
+
+class SlotAllocationError(Exception):
+    """Raised when a run of slots can no longer be claimed"""
+
+
+def service_duration(service, slot=None):
+    """Time an appointment for a service needs; a single slot when there is no service"""
+    if service is not None and service.duration_minutes:
+        return timedelta(minutes=service.duration_minutes)
+    if slot is not None:
+        return slot.end_time - slot.start_time
+    return timedelta(0)
+
+
+def free_slots(doctor, after=None):
+    return ScheduleSlot.objects.filter(
+        doctor=doctor,
+        is_booked=False,
+        is_available=True,
+        start_time__gt=after or timezone.now()
+    ).order_by('start_time')
+
+
+def iter_runs(slots, duration):
+    """Sliding window over time-ordered slots
+
+    Yields, for each slot that starts one, the shortest run of back-to-back
+    slots covering ``duration``. Each slot enters and leaves the window once,
+    so the scan is linear in the number of slots.
+    """
+    window = deque()
+    for slot in slots:
+        if window and slot.start_time != window[-1].end_time:
+            window.clear()
+        window.append(slot)
+        while window and window[-1].end_time - window[0].start_time >= duration:
+            yield list(window)
+            window.popleft()
+
+
+def find_runs(doctor, duration, after=None, limit=None):
+    """Runs of free slots for a doctor long enough for ``duration``, earliest first"""
+    runs = []
+    for run in iter_runs(free_slots(doctor, after).iterator(), duration):
+        runs.append(run)
+        if limit and len(runs) >= limit:
+            break
+    return runs
+
+
+def find_run(first_slot, duration, exclude_ids=()):
+    """The run of free slots starting at ``first_slot`` that covers ``duration``, or None"""
+    slots = ScheduleSlot.objects.filter(
+        doctor_id=first_slot.doctor_id,
+        is_booked=False,
+        is_available=True,
+        start_time__gte=first_slot.start_time,
+        start_time__lt=first_slot.start_time + max(duration, timedelta(microseconds=1))
+    ).exclude(pk__in=exclude_ids).order_by('start_time')
+    run = next(iter_runs(slots, duration), None)
+    if run is None or run[0].pk != first_slot.pk:
+        return None
+    return run
+
+
+def contiguous_minutes(slots):
+    """Map each slot id to the minutes of back-to-back free time starting at it"""
+    minutes = {}
+    run_end = next_start = None
+    for slot in reversed(list(slots)):
+        if run_end is None or slot.end_time != next_start:
+            run_end = slot.end_time
+        minutes[slot.pk] = int((run_end - slot.start_time).total_seconds() // 60)
+        next_start = slot.start_time
+    return minutes
+
+
+def claim(run):
+    """Mark every slot in a run as booked with one UPDATE, or none of them"""
+    ids = [slot.pk for slot in run]
+    with transaction.atomic():
+        claimed = ScheduleSlot.objects.filter(
+            pk__in=ids, is_booked=False, is_available=True
+        ).update(is_booked=True)
+        if claimed != len(ids):
+            # Someone else booked part of the run; undo the partial claim
+            raise SlotAllocationError('The selected time is no longer available.')
+    for slot in run:
+        slot.is_booked = True
+    invalidate_slots({slot.doctor_id for slot in run})
+
+
+def allocate(appointment, run):
+    """Claim a run of slots and attach it to an appointment, saving the appointment"""
+    claim(run)
+    appointment.slot = run[0]
+    appointment.datetime = run[0].start_time
+    appointment.save()
+    appointment.slots.set(run)
+
+
+def release(appointment):
+    """Free every slot held by an appointment with one UPDATE; returns the freed slots
+
+    The appointment no longer covers the slots afterwards, so releasing it
+    again cannot free slots someone else has since booked.
+    """
+    slots = list(ScheduleSlot.objects.filter(
+        Q(pk=appointment.slot_id) | Q(covering_appointments=appointment)
+    ).distinct())
+    ScheduleSlot.objects.filter(pk__in=[slot.pk for slot in slots]).update(is_booked=False)
+    appointment.slots.clear()
+    for slot in slots:
+        slot.is_booked = False
+    invalidate_slots({slot.doctor_id for slot in slots})
+    if appointment.slot is not None:
+        appointment.slot.is_booked = False
+    return slots
@@ -0,0 +1,346 @@
+import base64
+import binascii
+import hashlib
+import json
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max, Q
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.text import compress_string
+from django.views.decorators.http import require_GET
+
+from .models import Appointment, Clinic, DoctorProfile, ScheduleSlot, Service
+from .routers import replica_reads
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is used instead
+    brotli = None
+
+API_VERSION = 'v1'
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_BATCH = 100
+# Smaller bodies are sent uncompressed; compression would not pay for itself
+MIN_COMPRESS_LENGTH = 200
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class Resource:
+    """A model exposed by the API
+
+    ``fields`` maps API field names to ORM paths; only requested fields are
+    selected, with related columns joined into the same query. ``filters``
+    map query parameters to integer lookups, and ``ordering`` is the keyset
+    used for cursors, ending in a unique column.
+    """
+    name: str
+    model: type
+    fields: dict
+    default_fields: tuple
+    ordering: tuple = ('pk',)
+    filters: dict = field(default_factory=dict)
+    # Column whose latest value versions the result, letting unchanged results answer 304 before rows are read
+    version_field: str = None
+    login_required: bool = False
+    # (request, queryset) -> the rows this request may see
+    scope: object = None
+
+    def queryset(self, request):
+        queryset = self.model.objects.all()
+        return self.scope(request, queryset) if self.scope else queryset.filter(is_active=True)
+
+
+def _open_slots(request, slots):
+    return slots.filter(is_booked=False, is_available=True, doctor__is_active=True, start_time__gte=timezone.now())
+
+
+def _own_appointments(request, appointments):
+    return appointments.filter(patient__user=request.user)
+
+
+RESOURCES = {resource.name: resource for resource in [
+    Resource(
+        'clinics', Clinic,
+        fields={
+            'id': 'pk', 'name': 'name', 'address': 'address', 'contact_number': 'contact_number',
+            'email': 'email', 'website': 'website', 'description': 'description',
+            'emergency_number': 'emergency_number', 'opening_hours': 'opening_hours',
+            'facilities': 'facilities', 'insurance_accepted': 'insurance_accepted',
+            'specialties': 'specialties', 'latitude': 'latitude', 'longitude': 'longitude',
+        },
+        default_fields=('id', 'name', 'address', 'contact_number', 'specialties'),
+    ),
+    Resource(
+        'doctors', DoctorProfile,
+        fields={
+            'id': 'pk', 'first_name': 'user__first_name', 'last_name': 'user__last_name',
+            'specialty': 'specialty', 'qualification': 'qualification', 'bio': 'bio',
+            'clinic_id': 'clinic_id', 'clinic_name': 'clinic__name',
+            'consultation_fee': 'consultation_fee', 'years_of_experience': 'years_of_experience',
+        },
+        default_fields=('id', 'first_name', 'last_name', 'specialty', 'clinic_id'),
+        filters={'clinic': 'clinic_id'},
+    ),
+    Resource(
+        'services', Service,
+        fields={
+            'id': 'pk', 'name': 'name', 'description': 'description', 'duration_minutes': 'duration_minutes',
+            'fee': 'fee', 'clinic_id': 'clinic_id', 'clinic_name': 'clinic__name',
+        },
+        default_fields=('id', 'name', 'duration_minutes', 'fee', 'clinic_id'),
+        filters={'clinic': 'clinic_id'},
+    ),
+    Resource(
+        'slots', ScheduleSlot,
+        fields={
+            'id': 'pk', 'doctor_id': 'doctor_id', 'clinic_id': 'doctor__clinic_id',
+            'start_time': 'start_time', 'end_time': 'end_time',
+        },
+        default_fields=('id', 'doctor_id', 'start_time', 'end_time'),
+        ordering=('start_time', 'pk'),
+        filters={'doctor': 'doctor_id', 'clinic': 'doctor__clinic_id'},
+        scope=_open_slots,
+    ),
+    Resource(
+        'appointments', Appointment,
+        fields={
+            'id': 'pk', 'datetime': 'datetime', 'status': 'status', 'notes': 'notes',
+            'doctor_id': 'doctor_id', 'doctor_first_name': 'doctor__user__first_name',
+            'doctor_last_name': 'doctor__user__last_name', 'service_id': 'service_id',
+            'service_name': 'service__name', 'clinic_id': 'doctor__clinic_id',
+            'created_at': 'created_at', 'updated_at': 'updated_at',
+        },
+        default_fields=('id', 'datetime', 'status', 'doctor_id', 'service_id', 'updated_at'),
+        filters={'doctor': 'doctor_id'},
+        version_field='updated_at',
+        login_required=True,
+        scope=_own_appointments,
+    ),
+]}
+
+
+def _int_list(value, name, limit):
+    try:
+        ids = [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise ApiError(f'{name} must be comma-separated integers')
+    if len(ids) > limit:
+        raise ApiError(f'At most {limit} {name} per request')
+    return ids
+
+
+def _fields(resource, request):
+    value = request.GET.get('fields')
+    if not value:
+        return list(resource.default_fields)
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in resource.fields]
+    if unknown:
+        raise ApiError(f'Unknown fields: {", ".join(unknown)}')
+    return names
+
+
+def _filtered(resource, request):
+    queryset = resource.queryset(request)
+    for param, lookup in resource.filters.items():
+        if param in request.GET:
+            queryset = queryset.filter(**{f'{lookup}__in': _int_list(request.GET[param], param, MAX_BATCH)})
+    return queryset
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, cls=DjangoJSONEncoder).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise ApiError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != length:
+        raise ApiError('Invalid cursor')
+    return values
+
+
+def _after(ordering, values):
+    """Keyset condition for rows after ``values`` in ``ordering``"""
+    condition = Q()
+    for index in range(len(ordering) - 1, -1, -1):
+        step = Q(**{f'{ordering[index]}__gt': values[index]})
+        condition = step | (Q(**{ordering[index]: values[index]}) & condition) if condition else step
+    return condition
+
+
+def _rows(queryset, resource, names, extra=()):
+    """Dicts of the requested fields, from one query that selects only their columns"""
+    paths = list(dict.fromkeys([resource.fields[name] for name in names] + list(extra)))
+    rows = list(queryset.values(*paths))
+    return [{name: row[resource.fields[name]] for name in names} for row in rows], rows
+
+
+def _list(request, resource, queryset, names):
+    try:
+        limit = min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        raise ApiError('limit must be an integer')
+    if limit < 1:
+        raise ApiError('limit must be positive')
+    ordering = resource.ordering
+    queryset = queryset.order_by(*ordering)
+    if request.GET.get('cursor'):
+        try:
+            queryset = queryset.filter(_after(ordering, decode_cursor(request.GET['cursor'], len(ordering))))
+            data, rows = _rows(queryset[:limit + 1], resource, names, extra=ordering)
+        except (ValidationError, TypeError, ValueError):
+            raise ApiError('Invalid cursor')
+    else:
+        data, rows = _rows(queryset[:limit + 1], resource, names, extra=ordering)
+    next_url = None
+    if len(rows) > limit:
+        data = data[:limit]
+        params = request.GET.copy()
+        params['cursor'] = encode_cursor([rows[limit - 1][column] for column in ordering])
+        next_url = f'{request.path}?{params.urlencode()}'
+    return {'data': data, 'next': next_url}
+
+
+def _batch(request, resource, queryset, names):
+    ids = _int_list(request.GET['ids'], 'ids', MAX_BATCH)
+    data, rows = _rows(queryset.filter(pk__in=ids), resource, names, extra=('pk',))
+    by_id = {row['pk']: item for row, item in zip(rows, data)}
+    return {'data': [by_id[pk] for pk in ids if pk in by_id], 'missing': [pk for pk in ids if pk not in by_id]}
+
+
+def _version_etag(request, queryset, resource):
+    """ETag from the newest version_field value and row count, without reading rows"""
+    version = queryset.aggregate(latest=Max(resource.version_field), count=Count('pk'))
+    key = f'{request.get_full_path()}|{request.user.pk}|{version["latest"]}|{version["count"]}'
+    return f'W/"{hashlib.md5(key.encode()).hexdigest()}"'
+
+
+def _accepted_encodings(header):
+    """{coding: q} from an Accept-Encoding header; codings with q=0 are refused"""
+    accepted = {}
+    for part in header.split(','):
+        coding, *params = [item.strip() for item in part.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q
+    return accepted
+
+
+def _choose_encoding(header):
+    """The preferred coding among those this server can produce, or None"""
+    accepted = _accepted_encodings(header)
+    available = ['br', 'gzip'] if brotli is not None else ['gzip']
+    # Unlisted codings get the wildcard's weight; ties go to the earlier (smaller) one
+    weights = [(accepted.get(coding, accepted.get('*', 0.0)), coding) for coding in available]
+    q, coding = max(weights, key=lambda weight: weight[0])
+    return coding if q > 0 else None
+
+
+def _encode(request, response):
+    """Compress with the client's preferred coding: brotli when available, else gzip"""
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if len(response.content) < MIN_COMPRESS_LENGTH:
+        return response
+    coding = _choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if coding == 'br':
+        response.content = brotli.compress(response.content)
+        response['Content-Encoding'] = 'br'
+    elif coding == 'gzip':
+        response.content = compress_string(response.content)
+        response['Content-Encoding'] = 'gzip'
+    return response
+
+
+def _json(request, payload, status=200, etag=None):
+    body = json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+    response = HttpResponse(body, status=status, content_type='application/json')
+    if status == 200:
+        # Weak, since the same entity may be sent with different encodings
+        response['ETag'] = etag or f'W/"{hashlib.md5(body).hexdigest()}"'
+        conditional = get_conditional_response(request, etag=response['ETag'], response=response)
+        if conditional is not response:
+            return conditional
+    return _encode(request, response)
+
+
+@replica_reads
+@require_GET
+def api_index(request):
+    return _json(request, {
+        'version': API_VERSION,
+        'resources': {
+            name: {
+                'url': reverse('api_list', args=[name]),
+                'fields': list(resource.fields),
+                'default_fields': list(resource.default_fields),
+                'filters': list(resource.filters),
+            }
+            for name, resource in RESOURCES.items()
+        },
+    })
+
+
+@replica_reads
+@require_GET
+def api_resource(request, resource, pk=None):
+    """List (cursor-paginated), batch (?ids=1,2,3) or single reads of a resource
+
+    Every request runs a fixed number of queries: one for the rows, plus one
+    aggregate for resources versioned by updated_at, which can answer 304
+    on its own.
+    """
+    resource = RESOURCES.get(resource)
+    if resource is None:
+        return _json(request, {'error': 'Unknown resource'}, status=404)
+    if resource.login_required and not request.user.is_authenticated:
+        return _json(request, {'error': 'Authentication required'}, status=401)
+    try:
+        names = _fields(resource, request)
+        queryset = _filtered(resource, request)
+        if pk is not None:
+            queryset = queryset.filter(pk=pk)
+        etag = None
+        if resource.version_field:
+            etag = _version_etag(request, queryset, resource)
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                patch_cache_control(not_modified, private=True)
+                return not_modified
+        if pk is not None:
+            data, _ = _rows(queryset, resource, names)
+            if not data:
+                return _json(request, {'error': 'Not found'}, status=404)
+            payload = {'data': data[0]}
+        elif 'ids' in request.GET:
+            payload = _batch(request, resource, queryset, names)
+        else:
+            payload = _list(request, resource, queryset, names)
+    except ApiError as e:
+        return _json(request, {'error': str(e)}, status=e.status)
+    response = _json(request, payload, etag=etag)
+    if resource.login_required:
+        patch_cache_control(response, private=True)
+    return response
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class HealthLinkrAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'health_linkr_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .sweeper import start_scheduler
+
+        start_scheduler()
@@ -0,0 +1,182 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from .profiling import note_cache
+from .routers import read_from_replica
+
+_MISSING = object()
+_regions = {}
+
+
+def _cache():
+    return caches[getattr(settings, 'VIEW_CACHE_ALIAS', 'default')]
+
+
+def is_process_local(alias='default'):
+    """Whether a cache is private to this process, so other workers and commands cannot see it"""
+    return isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+def _tag_key(tag):
+    return f'cache-tag:{tag}'
+
+
+def tag_versions(tags):
+    """Current version of each dependency tag, from a single cache read"""
+    if not tags:
+        return ()
+    keys = [_tag_key(tag) for tag in tags]
+    found = _cache().get_many(keys)
+    return tuple(found.get(key, 0) for key in keys)
+
+
+def invalidate_tags(*tags):
+    """Bump dependency tags so every cached entry that depends on them is recomputed
+
+    Inside a transaction the bump happens on commit, so a concurrent request
+    cannot cache pre-commit data under the new version.
+    """
+    tags = set(tags)
+    if tags:
+        transaction.on_commit(lambda: _bump(tags))
+
+
+def _bump(tags):
+    cache = _cache()
+    for tag in tags:
+        key = _tag_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Versions never expire, otherwise a stale entry could match version 0 again
+            if not cache.add(key, 1, None):
+                cache.incr(key)
+
+
+class CacheRegion:
+    """A named family of cached values with dependency tags
+
+    Entry keys embed the current version of each tag, so invalidating a tag
+    makes old entries unreachable without having to find and delete them.
+    Concurrent misses for one key are collapsed into a single recompute: one
+    thread per process via a striped lock, one process via a short cache lock.
+    Values are always computed on the primary: an entry is stored under the
+    current tag versions, so one filled from a lagging replica would keep
+    serving pre-invalidation data until it expired.
+    """
+
+    LOCK_STRIPES = 64
+
+    def __init__(self, name, timeout=300, lock_timeout=10):
+        self.name = name
+        self.timeout = timeout
+        self.lock_timeout = lock_timeout
+        self._locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self._stats_lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'recomputes': 0, 'waits': 0, 'recompute_seconds': 0.0}
+        _regions[name] = self
+
+    def _count(self, **changes):
+        with self._stats_lock:
+            for key, value in changes.items():
+                self._stats[key] += value
+
+    def key(self, parts, tags=()):
+        raw = ':'.join(map(str, parts)) + '|' + ','.join(map(str, tag_versions(tags)))
+        return f'region:{self.name}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    def get_or_set(self, parts, compute, tags=()):
+        """Return the cached value for parts, computing it once on a miss"""
+        cache = _cache()
+        key = self.key(parts, tags)
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            self._count(hits=1)
+            note_cache(hits=1)
+            return value
+        self._count(misses=1)
+        note_cache(misses=1)
+
+        with self._locks[hash(key) % self.LOCK_STRIPES]:
+            # Another thread may have filled it while we waited
+            value = cache.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            lock_key = f'{key}:lock'
+            if not cache.add(lock_key, 1, self.lock_timeout):
+                value = self._wait_for(cache, key)
+                if value is not _MISSING:
+                    return value
+            try:
+                started = time.perf_counter()
+                with read_from_replica(False):
+                    value = compute()
+                self._count(recomputes=1, recompute_seconds=time.perf_counter() - started)
+                cache.set(key, value, self.timeout)
+            finally:
+                cache.delete(lock_key)
+        return value
+
+    def _wait_for(self, cache, key):
+        """Wait for another process to finish recomputing, up to lock_timeout"""
+        self._count(waits=1)
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            value = cache.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+        return _MISSING
+
+    def metrics(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+def region_metrics():
+    return {name: region.metrics() for name, region in _regions.items()}
+
+
+clinic_pages = CacheRegion('clinic_pages', timeout=600)
+service_catalog = CacheRegion('service_catalog', timeout=600)
+doctor_slots = CacheRegion('doctor_slots', timeout=60)
+patient_appointments = CacheRegion('patient_appointments', timeout=120)
+
+
+def clinic_tag(clinic_id):
+    return f'clinic:{clinic_id}'
+
+
+def doctor_tag(doctor_id):
+    return f'doctor:{doctor_id}'
+
+
+def patient_tag(patient_id):
+    return f'patient:{patient_id}'
+
+
+CATALOG_TAG = 'catalog'
+
+
+def invalidate_appointments(pairs):
+    """Invalidate listings for (patient_id, doctor_id) pairs after bulk appointment writes"""
+    tags = set()
+    for patient_id, doctor_id in pairs:
+        tags.add(patient_tag(patient_id))
+        tags.add(doctor_tag(doctor_id))
+    invalidate_tags(*tags)
+
+
+def invalidate_slots(doctor_ids):
+    """Invalidate slot listings after bulk slot writes"""
+    invalidate_tags(*(doctor_tag(doctor_id) for doctor_id in doctor_ids))
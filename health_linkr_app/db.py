@@ -0,0 +1,63 @@
+from importlib.util import find_spec
+
+from django.core.exceptions import ImproperlyConfigured
+
+
+def database_settings(env, prefix='PG'):
+    """Build a PostgreSQL DATABASES entry with connection management from the environment
+
+    With DB_POOL the psycopg 3 connection pool is used (it requires
+    CONN_MAX_AGE = 0, and psycopg 3 rather than psycopg2); otherwise connections persist for DB_CONN_MAX_AGE
+    seconds and are health-checked before reuse.
+    """
+    options = {}
+    statement_timeout = env.int('DB_STATEMENT_TIMEOUT_MS', default=0)
+    if statement_timeout:
+        options['options'] = f'-c statement_timeout={statement_timeout}'
+    connect_timeout = env.int('DB_CONNECT_TIMEOUT', default=5)
+    if connect_timeout:
+        options['connect_timeout'] = connect_timeout
+
+    pooled = env.bool('DB_POOL', default=False)
+    if pooled:
+        if find_spec('psycopg') is None or find_spec('psycopg_pool') is None:
+            raise ImproperlyConfigured(
+                'DB_POOL needs psycopg 3 with its pool ("pip install psycopg[binary,pool]"); '
+                'psycopg2 has no connection pool support in Django.'
+            )
+        options['pool'] = {
+            'min_size': env.int('DB_POOL_MIN_SIZE', default=2),
+            'max_size': env.int('DB_POOL_MAX_SIZE', default=10),
+            'timeout': env.float('DB_POOL_TIMEOUT', default=10.0),
+        }
+
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': env(f'{prefix}_DATABASE'),
+        'USER': env(f'{prefix}_USER'),
+        'PASSWORD': env(f'{prefix}_PASSWORD'),
+        'HOST': env(f'{prefix}_HOST'),
+        'PORT': env(f'{prefix}_PORT'),
+        'CONN_MAX_AGE': 0 if pooled else env.int('DB_CONN_MAX_AGE', default=60),
+        'CONN_HEALTH_CHECKS': env.bool('DB_CONN_HEALTH_CHECKS', default=True),
+        'OPTIONS': options,
+    }
+
+
+def replica_settings(primary, hosts):
+    """DATABASES entries ('replica_1', ...) for read replicas of the primary
+
+    Each host is "host" or "host:port"; everything else is shared with the
+    primary. Replicas mirror the primary under the test runner.
+    """
+    replicas = {}
+    for number, host in enumerate(hosts, start=1):
+        host, _, port = host.partition(':')
+        replicas[f'replica_{number}'] = dict(
+            primary,
+            HOST=host,
+            PORT=port or primary['PORT'],
+            TEST={'MIRROR': 'default'},
+        )
+    return replicas
+
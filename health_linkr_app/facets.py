@@ -0,0 +1,68 @@
+from django.db.models import Count, Min
+
+# ClinicAttribute kind -> Clinic JSON list it mirrors
+FACET_FIELDS = {
+    'facility': 'facilities',
+    'insurance': 'insurance_accepted',
+    'specialty': 'specialties',
+}
+
+KEY_MAX_LENGTH = 100
+
+
+def attribute_key(value):
+    """'  MRI  scanner' and 'mri Scanner' filter as the same value"""
+    return ' '.join(str(value).split()).casefold()[:KEY_MAX_LENGTH]
+
+
+def clinic_attributes(clinic):
+    """Unsaved ClinicAttribute rows for a clinic's JSON lists, one per distinct key"""
+    from .models import ClinicAttribute
+
+    attributes = {}
+    for kind, field in FACET_FIELDS.items():
+        for value in getattr(clinic, field) or []:
+            key = attribute_key(value)
+            if key and (kind, key) not in attributes:
+                attributes[kind, key] = ClinicAttribute(
+                    clinic=clinic, kind=kind, key=key, value=' '.join(str(value).split())[:KEY_MAX_LENGTH]
+                )
+    return list(attributes.values())
+
+
+def sync_clinic_attributes(clinic):
+    """Rewrite the clinic's ClinicAttribute rows from its JSON lists"""
+    from .models import ClinicAttribute
+
+    ClinicAttribute.objects.filter(clinic=clinic).delete()
+    ClinicAttribute.objects.bulk_create(clinic_attributes(clinic))
+
+
+def filter_clinics(clinics, selected):
+    """Narrow a clinic queryset to those having every selected value
+
+    ``selected`` maps a kind to values, e.g. {'insurance': ['AXA'],
+    'facility': ['MRI']}. Each value adds an indexed semi-join on
+    ClinicAttribute rather than a scan of the JSON columns.
+    """
+    from .models import ClinicAttribute
+
+    for kind, values in selected.items():
+        for key in {attribute_key(value) for value in values} - {''}:
+            clinics = clinics.filter(
+                pk__in=ClinicAttribute.objects.filter(kind=kind, key=key).values('clinic_id')
+            )
+    return clinics
+
+
+def facet_counts(clinics):
+    """{kind: [(key, label, clinic count), ...]} over a clinic queryset, from one GROUP BY query"""
+    from .models import ClinicAttribute
+
+    counts = {kind: [] for kind in FACET_FIELDS}
+    rows = ClinicAttribute.objects.filter(clinic__in=clinics.values('pk')).values('kind', 'key').annotate(
+        label=Min('value'), clinics=Count('clinic_id')
+    ).order_by('kind', '-clinics', 'key')
+    for row in rows:
+        counts[row['kind']].append((row['key'], row['label'], row['clinics']))
+    return counts
@@ -1,8 +1,25 @@
 from django import forms
+from django.utils import timezone
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm, PasswordChangeForm
-from .models import User, Appointment, PatientProfile, DoctorProfile
+from .importer import DOCTOR, PATIENT
+from .models import User, Appointment, PatientProfile, DoctorProfile, Clinic, Service, WaitlistEntry
+from .passwords import hash_password
 
-class CustomUserCreationForm(UserCreationForm):
+class PooledPasswordMixin:
+    """Hash the new password on the shared hashing pool"""
+    def set_password_and_save(self, user, password_field_name='password1', commit=True):
+        # Forms with SetUnusablePasswordMixin may ask for password-based login to be disabled
+        if self.cleaned_data.get('set_usable_password', True):
+            raw_password = self.cleaned_data[password_field_name]
+            user.password = hash_password(raw_password)
+            user._password = raw_password
+        else:
+            user.set_unusable_password()
+        if commit:
+            user.save()
+        return user
+
+class CustomUserCreationForm(PooledPasswordMixin, UserCreationForm):
     class Meta:
         model = User
         fields = ['username', 'email', 'password1', 'password2']
@@ -25,7 +42,7 @@ class UserProfileUpdateForm(forms.ModelForm):
             'profile_photo': forms.FileInput()
         }
 
-class PasswordChangeCustomForm(PasswordChangeForm):
+class PasswordChangeCustomForm(PooledPasswordMixin, PasswordChangeForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         for field in self.fields:
@@ -37,4 +54,71 @@ class AppointmentForm(forms.ModelForm):
         fields = ['notes']
         widgets = {
             'notes': forms.Textarea(attrs={'rows': 3, 'placeholder': 'Optional notes...'}),
-        }
\ No newline at end of file
+        }
+
+class WaitlistForm(forms.ModelForm):
+    class Meta:
+        model = WaitlistEntry
+        fields = ['service', 'window_start', 'window_end']
+        widgets = {
+            'service': forms.Select(attrs={'class': 'form-select'}),
+            'window_start': forms.DateTimeInput(attrs={'type': 'datetime-local', 'class': 'form-control'}),
+            'window_end': forms.DateTimeInput(attrs={'type': 'datetime-local', 'class': 'form-control'}),
+        }
+
+    def __init__(self, *args, doctor=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if doctor is not None:
+            # Option labels include the clinic name
+            self.fields['service'].queryset = doctor.services.filter(is_active=True).select_related('clinic')
+        self.fields['service'].required = False
+
+    def clean(self):
+        cleaned_data = super().clean()
+        window_start = cleaned_data.get('window_start')
+        window_end = cleaned_data.get('window_end')
+        if window_start and window_end:
+            if window_end <= window_start:
+                raise forms.ValidationError('The end of the window must be after its start.')
+            if window_end <= timezone.now():
+                raise forms.ValidationError('The window must end in the future.')
+        return cleaned_data
+
+class OnboardingImportForm(forms.Form):
+    file = forms.FileField(help_text='CSV or JSON Lines (.jsonl) file, one user per row')
+    kind = forms.ChoiceField(choices=[(PATIENT, 'Patients'), (DOCTOR, 'Doctors')])
+    clinic = forms.ModelChoiceField(queryset=Clinic.objects.all(), required=False,
+                                    help_text='Required when importing doctors')
+    dry_run = forms.BooleanField(required=False, help_text='Validate the file without creating users')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('kind') == DOCTOR and not cleaned_data.get('clinic'):
+            self.add_error('clinic', 'Select the clinic the doctors belong to.')
+        return cleaned_data
+
+class BulkRescheduleForm(forms.Form):
+    start_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+    end_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+    include_colleagues = forms.BooleanField(
+        required=False, initial=True,
+        help_text='Also move appointments to same-specialty doctors at the same clinic'
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date = cleaned_data.get('start_date')
+        end_date = cleaned_data.get('end_date')
+        if start_date and end_date and end_date < start_date:
+            raise forms.ValidationError('The end date must not be before the start date.')
+        return cleaned_data
+
+class NearbyClinicsForm(forms.Form):
+    latitude = forms.FloatField(min_value=-90, max_value=90)
+    longitude = forms.FloatField(min_value=-180, max_value=180)
+    specialty = forms.CharField(required=False, max_length=100)
+    service = forms.ModelChoiceField(
+        required=False, queryset=Service.objects.filter(is_active=True).select_related('clinic')
+    )
+    max_km = forms.FloatField(required=False, min_value=0, label='Within (km)')
+    k = forms.IntegerField(min_value=1, max_value=50, initial=10, required=False, label='Results')
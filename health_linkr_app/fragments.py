@@ -0,0 +1,82 @@
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import caches
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import Appointment
+from .profiling import note_cache
+
+# Stands in for the per-request CSRF token inside cached fragments
+CSRF_PLACEHOLDER = '__csrf_token__'
+
+# Bump when appointment_card.html changes so old fragments are not served
+CARD_TEMPLATE_VERSION = 1
+
+# Columns the appointment list needs before any card is rendered
+CARD_INDEX_FIELDS = ('id', 'updated_at', 'datetime', 'status')
+
+
+@dataclass
+class AppointmentCard:
+    id: int
+    updated_at: object
+    datetime: object
+    status: str
+    upcoming_card: str = ''
+    past_card: str = ''
+
+
+def _cache():
+    return caches[getattr(settings, 'VIEW_CACHE_ALIAS', 'default')]
+
+
+def _card_key(row, upcoming):
+    return f'appointment-card:{CARD_TEMPLATE_VERSION}:{row.id}:{row.updated_at.timestamp()}:{int(upcoming)}'
+
+
+def appointment_cards(request, rows, now):
+    """Build the cards for (id, updated_at, datetime, status) rows, rendering only uncached ones
+
+    Fragments are keyed on (id, updated_at), so any saved change to an
+    appointment renders a fresh card; the whole page is fetched with one
+    get_many and only missing appointments are loaded from the database.
+    Changes to the doctor or service show once the fragment times out
+    (APPOINTMENT_CARD_TIMEOUT).
+    """
+    cards = [AppointmentCard(*row) for row in rows]
+    wanted = {}
+    for card in cards:
+        if card.datetime > now:
+            wanted[_card_key(card, True)] = (card, True)
+        if card.datetime <= now or card.status == Appointment.CANCELLED:
+            wanted[_card_key(card, False)] = (card, False)
+
+    cache = _cache()
+    fragments = cache.get_many(list(wanted))
+    missing = {key: value for key, value in wanted.items() if key not in fragments}
+    note_cache(hits=len(wanted) - len(missing), misses=len(missing))
+    if missing:
+        appointments = Appointment.objects.select_related('doctor__user', 'service').in_bulk(
+            {card.id for card, _ in missing.values()}
+        )
+        rendered = {}
+        for key, (card, upcoming) in missing.items():
+            appointment = appointments.get(card.id)
+            if appointment is None:
+                continue
+            rendered[key] = render_to_string('appointment_card.html', {
+                'appointment': appointment,
+                'upcoming': upcoming,
+                'csrf_token': CSRF_PLACEHOLDER,
+            })
+        cache.set_many(rendered, getattr(settings, 'APPOINTMENT_CARD_TIMEOUT', 24 * 60 * 60))
+        fragments.update(rendered)
+
+    token = get_token(request)
+    for key, (card, upcoming) in wanted.items():
+        html = mark_safe(fragments.get(key, '').replace(CSRF_PLACEHOLDER, token))
+        setattr(card, 'upcoming_card' if upcoming else 'past_card', html)
+    return cards
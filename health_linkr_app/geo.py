@@ -0,0 +1,149 @@
+import heapq
+import math
+import threading
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.db.models import Min
+from django.utils import timezone
+
+from .caching import tag_versions
+
+# Bumped (through invalidate_tags) whenever a clinic is saved or deleted
+LOCATIONS_TAG = 'clinic-locations'
+
+EARTH_RADIUS_KM = 6371.0088
+
+_tree = None
+_tree_lock = threading.Lock()
+
+
+def to_unit_vector(latitude, longitude):
+    """Point on the unit sphere; straight-line distance between these orders like great-circle distance"""
+    lat, lon = math.radians(float(latitude)), math.radians(float(longitude))
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def chord_to_km(chord):
+    return 2 * math.asin(min(chord / 2, 1.0)) * EARTH_RADIUS_KM
+
+
+def km_to_chord(km):
+    return 2 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+@dataclass
+class NearbyClinic:
+    clinic_id: int
+    distance_km: float
+
+
+class KDTree:
+    """Static 3-d tree over (unit vector, clinic id) points
+
+    Built once per change to clinic locations; nearest() visits the side of
+    each split nearer the target first and prunes the far side once it
+    cannot hold anything closer than the current k-th result.
+    """
+
+    def __init__(self, points, version=None):
+        self.version = version
+        self.size = len(points)
+        self.root = self._build(list(points), 0)
+
+    def _build(self, points, depth):
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda point: point[0][axis])
+        middle = len(points) // 2
+        vector, clinic_id = points[middle]
+        return (
+            vector, clinic_id, axis,
+            self._build(points[:middle], depth + 1),
+            self._build(points[middle + 1:], depth + 1),
+        )
+
+    def nearest(self, target, k, accept=None, max_chord=None):
+        """Up to k (squared chord, clinic id) pairs nearest ``target``, closest first"""
+        heap = []  # max-heap on distance via negation
+        limit = max_chord * max_chord if max_chord is not None else math.inf
+
+        def bound():
+            return -heap[0][0] if len(heap) == k else limit
+
+        def visit(node):
+            if node is None:
+                return
+            vector, clinic_id, axis, left, right = node
+            diff = target[axis] - vector[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            if accept is None or accept(clinic_id):
+                distance = sum((a - b) ** 2 for a, b in zip(target, vector))
+                if distance <= bound():
+                    if len(heap) == k:
+                        heapq.heapreplace(heap, (-distance, clinic_id))
+                    else:
+                        heapq.heappush(heap, (-distance, clinic_id))
+            if diff * diff <= bound():
+                visit(far)
+
+        if k > 0:
+            visit(self.root)
+        return sorted((-negated, clinic_id) for negated, clinic_id in heap)
+
+
+def clinic_tree():
+    """The k-d tree of active clinics with coordinates, rebuilt after any clinic changes"""
+    global _tree
+    from .models import Clinic
+
+    version = tag_versions([LOCATIONS_TAG])
+    with _tree_lock:
+        if _tree is None or _tree.version != version:
+            rows = Clinic.objects.filter(
+                is_active=True, latitude__isnull=False, longitude__isnull=False
+            ).values_list('pk', 'latitude', 'longitude')
+            _tree = KDTree([(to_unit_vector(lat, lon), pk) for pk, lat, lon in rows], version)
+        return _tree
+
+
+def nearest_clinics(latitude, longitude, k=10, clinic_ids=None, max_km=None):
+    """The k active clinics nearest a point, optionally only those in ``clinic_ids``"""
+    accept = clinic_ids.__contains__ if clinic_ids is not None else None
+    max_chord = km_to_chord(max_km) if max_km is not None else None
+    found = clinic_tree().nearest(to_unit_vector(latitude, longitude), k, accept, max_chord)
+    return [NearbyClinic(clinic_id, chord_to_km(math.sqrt(distance))) for distance, clinic_id in found]
+
+
+def open_slots(specialty=None, service=None, start=None, days=14):
+    """Bookable slots in the next ``days``, optionally of a specialty or service"""
+    from .models import ScheduleSlot
+
+    start = start or timezone.now()
+    slots = ScheduleSlot.objects.filter(
+        is_booked=False, is_available=True, doctor__is_active=True,
+        start_time__gte=start, start_time__lt=start + timedelta(days=days),
+    )
+    if specialty:
+        slots = slots.filter(doctor__specialty__iexact=specialty)
+    if service is not None:
+        slots = slots.filter(doctor__services=service)
+    return slots
+
+
+def nearest_clinics_with_slots(latitude, longitude, k=10, max_km=None, **slot_filters):
+    """Nearest clinics where a doctor (of a specialty / offering a service) has a free slot
+
+    Returns (NearbyClinic list, {clinic id: earliest free slot start}); the
+    availability side is one GROUP BY query, the proximity side the tree.
+    """
+    earliest = dict(
+        open_slots(**slot_filters).exclude(doctor__clinic=None).values('doctor__clinic_id').annotate(
+            first=Min('start_time')
+        ).values_list('doctor__clinic_id', 'first')
+    )
+    if not earliest:
+        return [], {}
+    return nearest_clinics(latitude, longitude, k=k, clinic_ids=earliest, max_km=max_km), earliest
@@ -0,0 +1,137 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+INDEX_REGISTRY_KEY = 'slot-holds:doctors'
+
+
+def hold_seconds():
+    return getattr(settings, 'SLOT_HOLD_SECONDS', 300)
+
+
+def _hold_key(slot_id):
+    return f'slot-hold:{slot_id}'
+
+
+def _user_key(user_id, doctor_id):
+    return f'slot-hold:user:{user_id}:{doctor_id}'
+
+
+def _index_key(doctor_id):
+    return f'slot-holds:doctor:{doctor_id}'
+
+
+def _update_index(doctor_id, add=None, remove=(), ttl=None):
+    """Maintain the per-doctor {slot_id: (user_id, expires_at)} index used by listings
+
+    The index is advisory: the per-slot key is what place_hold() and
+    is_held_by_other() trust, so a lost concurrent update only means a held
+    slot is briefly listed.
+    """
+    ttl = ttl or hold_seconds()
+    index = cache.get(_index_key(doctor_id)) or {}
+    for slot_id in remove:
+        index.pop(slot_id, None)
+    if add is not None:
+        slot_ids, user_id = add
+        for slot_id in slot_ids:
+            index[slot_id] = (user_id, time.time() + ttl)
+    if index:
+        longest = max(expires_at for _, expires_at in index.values()) - time.time()
+        cache.set(_index_key(doctor_id), index, max(int(longest) + 1, 1))
+        registry = cache.get(INDEX_REGISTRY_KEY) or set()
+        if doctor_id not in registry:
+            registry.add(doctor_id)
+            cache.set(INDEX_REGISTRY_KEY, registry, None)
+    else:
+        cache.delete(_index_key(doctor_id))
+
+
+def place_hold(slots, user, ttl=None):
+    """Reserve a run of slots for a user (for SLOT_HOLD_SECONDS by default)
+
+    Every slot the service needs is held, or none: returns False, keeping
+    no new holds, if someone else holds any of them.
+    """
+    ttl = ttl or hold_seconds()
+    slot_ids = [slot.pk for slot in slots]
+    doctor_id = slots[0].doctor_id
+    added = []
+    for slot_id in slot_ids:
+        key = _hold_key(slot_id)
+        if cache.add(key, user.pk, ttl):
+            added.append(slot_id)
+        elif cache.get(key) == user.pk:
+            cache.touch(key, ttl)
+        else:
+            cache.delete_many([_hold_key(added_id) for added_id in added])
+            return False
+
+    # A patient holds at most one run per doctor at a time
+    previous = cache.get(_user_key(user.pk, doctor_id)) or []
+    release_hold([slot_id for slot_id in previous if slot_id not in slot_ids], user, doctor_id)
+    cache.set(_user_key(user.pk, doctor_id), slot_ids, ttl)
+    _update_index(doctor_id, add=(slot_ids, user.pk), ttl=ttl)
+    return True
+
+
+def release_hold(slot_ids, user, doctor_id):
+    """Drop a user's holds on some slots (holds belonging to someone else are left alone)"""
+    slot_ids = set(slot_ids)
+    if not slot_ids:
+        return
+    user_key = _user_key(user.pk, doctor_id)
+    current = cache.get(user_key)
+    if current and slot_ids.issuperset(current):
+        cache.delete(user_key)
+    keys = {_hold_key(slot_id): slot_id for slot_id in slot_ids}
+    mine = [key for key, holder in cache.get_many(keys).items() if holder == user.pk]
+    if mine:
+        cache.delete_many(mine)
+        _update_index(doctor_id, remove=[keys[key] for key in mine])
+
+
+def is_held_by_other(slot_id, user):
+    holder = cache.get(_hold_key(slot_id))
+    return holder is not None and holder != user.pk
+
+
+def held_slot_ids(doctor_id, exclude_user=None):
+    """Slot ids currently held for a doctor, from a single cache read"""
+    now = time.time()
+    index = cache.get(_index_key(doctor_id)) or {}
+    return {
+        slot_id for slot_id, (user_id, expires_at) in index.items()
+        if expires_at > now and (exclude_user is None or user_id != exclude_user.pk)
+    }
+
+
+def sweep_expired_holds():
+    """Prune expired entries from every doctor index in bulk; returns the number removed"""
+    registry = cache.get(INDEX_REGISTRY_KEY) or set()
+    if not registry:
+        return 0
+    now = time.time()
+    keys = {_index_key(doctor_id): doctor_id for doctor_id in registry}
+    indexes = cache.get_many(keys)
+    removed = 0
+    updated = {}
+    empty = []
+    for key, doctor_id in keys.items():
+        index = indexes.get(key) or {}
+        live = {slot_id: hold for slot_id, hold in index.items() if hold[1] > now}
+        removed += len(index) - len(live)
+        if live:
+            if len(live) != len(index):
+                updated[key] = live
+        else:
+            empty.append(key)
+            registry.discard(doctor_id)
+    for key, live in updated.items():
+        longest = max(expires_at for _, expires_at in live.values()) - now
+        cache.set(key, live, max(int(longest) + 1, 1))
+    if empty:
+        cache.delete_many(empty)
+    cache.set(INDEX_REGISTRY_KEY, registry, None)
+    return removed
@@ -0,0 +1,133 @@
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseBadRequest
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+FORM_FIELD = 'idempotency_key'
+MAX_KEY_LENGTH = 255
+
+# POST fields that differ between retries of the same submission
+_IGNORED_FIELDS = {FORM_FIELD, 'csrfmiddlewaretoken'}
+
+_PENDING = 'pending'
+
+
+def _cache():
+    return caches[getattr(settings, 'IDEMPOTENCY_CACHE_ALIAS', 'default')]
+
+
+def _cache_key(request, key):
+    digest = hashlib.sha256(f'{request.resolver_match.view_name}:{key}'.encode()).hexdigest()
+    return f'idempotency:{request.user.pk}:{digest}'
+
+
+def _fingerprint(request):
+    fields = sorted((name, request.POST.getlist(name)) for name in request.POST if name not in _IGNORED_FIELDS)
+    return hashlib.sha256(repr(fields).encode()).hexdigest()
+
+
+def _replay(outcome):
+    response = HttpResponse(status=outcome['status'])
+    response['Location'] = outcome['location']
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _wait_for_outcome(cache, cache_key, seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        outcome = cache.get(cache_key)
+        if outcome != _PENDING:
+            return outcome
+    return _PENDING
+
+
+def _answer_duplicate(request, cache, cache_key, fingerprint, lock_seconds):
+    """The response to a request whose key was seen before, or None when it should run the view after all"""
+    outcome = cache.get(cache_key)
+    if outcome == _PENDING:
+        outcome = _wait_for_outcome(cache, cache_key, getattr(settings, 'IDEMPOTENCY_WAIT_SECONDS', 5))
+    if outcome is None and cache.add(cache_key, _PENDING, lock_seconds):
+        # The first attempt failed or its marker expired without an outcome
+        return None
+    if outcome is None or outcome == _PENDING:
+        return HttpResponse('This request is still being processed.', status=409)
+    if outcome['fingerprint'] != fingerprint:
+        return HttpResponse('This idempotency key was used for a different request.', status=422)
+    return _replay(outcome)
+
+
+def new_key():
+    return uuid.uuid4().hex
+
+
+def mark_completed(request):
+    """Record that the view's write has committed, so its redirect may be replayed
+
+    Call it after the transaction block has exited, not inside it.
+    """
+    request.idempotent_completed = True
+
+
+def idempotent(view):
+    """Replay the redirect of a POST retried with the same idempotency key
+
+    The key comes from the Idempotency-Key header or an ``idempotency_key``
+    form field, and is scoped to the user and view. The first request marks
+    the key pending with cache.add(), so a concurrent duplicate waits for the
+    outcome instead of running the view. When the view redirects after calling
+    mark_completed(request), its status and target are kept for
+    IDEMPOTENCY_TTL seconds and a retry gets the same redirect without calling
+    the view; flash messages are not replayed. Any other response (a form
+    with errors, or a redirect back to the form after a failure) changed
+    nothing, so the key is dropped and a retry runs the view again. Reusing a key for different
+    form data is rejected with 422. POSTs without a key run as usual.
+
+    Keys live in IDEMPOTENCY_CACHE_ALIAS (default: 'default'). With a
+    process-local cache such as locmem, a retry that reaches another worker
+    process is not recognised; use a shared cache when running several.
+
+    Forms rendered by the view should carry ``request.next_idempotency_key``,
+    which is fresh for every response, so a corrected resubmission is a new
+    request.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.next_idempotency_key = new_key()
+        key = (request.META.get(HEADER) or request.POST.get(FORM_FIELD)) if request.method == 'POST' else None
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return HttpResponseBadRequest('Idempotency key is too long.')
+
+        cache = _cache()
+        cache_key = _cache_key(request, key)
+        fingerprint = _fingerprint(request)
+        lock_seconds = getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 30)
+        if not cache.add(cache_key, _PENDING, lock_seconds):
+            response = _answer_duplicate(request, cache, cache_key, fingerprint, lock_seconds)
+            if response is not None:
+                return response
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            cache.delete(cache_key)
+            raise
+        completed = getattr(request, 'idempotent_completed', False)
+        if not completed or not 300 <= response.status_code < 400 or not response.has_header('Location'):
+            cache.delete(cache_key)
+            return response
+        cache.set(cache_key, {
+            'fingerprint': fingerprint,
+            'status': response.status_code,
+            'location': response['Location'],
+        }, getattr(settings, 'IDEMPOTENCY_TTL', 24 * 60 * 60))
+        return response
+    return wrapper
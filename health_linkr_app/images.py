@@ -0,0 +1,83 @@
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+VARIANT_DIR = 'profile_photos/variants'
+
+# Variant names are already derived from content, so they bypass the default storage
+variant_storage = FileSystemStorage()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the shared worker pool used for image processing"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_WORKERS', 2),
+                thread_name_prefix='image-worker'
+            )
+    return _executor
+
+
+def photo_sizes():
+    return tuple(getattr(settings, 'PROFILE_PHOTO_SIZES', (64, 128, 256)))
+
+
+def content_hash(file):
+    """SHA-256 of a file's content, read in chunks"""
+    digest = hashlib.sha256()
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    for chunk in file.chunks() if hasattr(file, 'chunks') else iter(lambda: file.read(64 * 1024), b''):
+        digest.update(chunk)
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    return digest.hexdigest()
+
+
+def variant_name(digest, size):
+    """Storage name of a resized variant; identical uploads share variants"""
+    return f'{VARIANT_DIR}/{digest[:2]}/{digest}_{size}.jpg'
+
+
+def generate_variants(digest, source_name):
+    """Resize and re-encode a stored photo into every configured size"""
+    missing = [size for size in photo_sizes() if not variant_storage.exists(variant_name(digest, size))]
+    if not missing:
+        return
+    with default_storage.open(source_name, 'rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for size in sorted(missing, reverse=True):
+            thumb = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+            buffer = BytesIO()
+            thumb.save(buffer, 'JPEG', quality=85, optimize=True, progressive=True)
+            name = variant_name(digest, size)
+            if not variant_storage.exists(name):
+                variant_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def _generate_logged(digest, source_name):
+    try:
+        generate_variants(digest, source_name)
+    except Exception:
+        logger.exception('Failed to generate variants for %s', source_name)
+
+
+def schedule_variants(digest, source_name):
+    """Queue variant generation on the worker pool"""
+    return get_executor().submit(_generate_logged, digest, source_name)
+
@@ -0,0 +1,318 @@
+import csv
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Q
+
+from .caching import CATALOG_TAG, clinic_tag, invalidate_tags
+from .models import DoctorProfile, PatientProfile, Role, SearchDocument, Service, User
+from .search import reindex
+
+PATIENT = 'patient'
+DOCTOR = 'doctor'
+
+REQUIRED_FIELDS = {
+    PATIENT: ('username', 'email', 'password', 'full_name', 'birth_date', 'gender', 'phone'),
+    DOCTOR: ('username', 'email', 'password', 'specialty', 'qualification', 'consultation_fee'),
+}
+
+MAX_REPORTED_ERRORS = 1000
+
+
+class OnboardingImportError(Exception):
+    pass
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    skipped: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def _csv_rows(stream, on_error):
+    reader = csv.DictReader(stream)
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            on_error(reader.line_num, f'Malformed CSV: {e}')
+            continue
+        yield reader.line_num, {k.strip(): (v or '').strip() for k, v in row.items() if k}
+
+
+def _jsonl_rows(stream, on_error):
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except json.JSONDecodeError as e:
+            on_error(number, f'Invalid JSON: {e.msg}')
+
+
+def _json_rows(stream, on_error):
+    # Plain JSON arrays cannot be streamed with the standard library
+    try:
+        rows = json.load(stream)
+    except json.JSONDecodeError as e:
+        on_error(e.lineno, f'Invalid JSON: {e.msg}')
+        return
+    if not isinstance(rows, list):
+        on_error(1, 'A JSON file must hold an array of rows')
+        return
+    yield from enumerate(rows, start=1)
+
+
+_READERS = {'csv': _csv_rows, 'jsonl': _jsonl_rows, 'json': _json_rows}
+
+
+def _raise_error(line, message):
+    raise OnboardingImportError(f'Line {line}: {message}')
+
+
+def read_rows(stream, fmt, on_error=_raise_error):
+    """Yield (line_number, row) from a CSV or JSON Lines stream without loading it whole
+
+    Lines that cannot be parsed are passed to ``on_error(line, message)``
+    and skipped; text that is not UTF-8 ends the file there.
+    """
+    if fmt not in _READERS:
+        raise OnboardingImportError(f'Unsupported format: {fmt}')
+    line = 0
+    try:
+        for line, row in _READERS[fmt](stream, on_error):
+            yield line, row
+    except UnicodeDecodeError:
+        on_error(line + 1, 'The file is not UTF-8 text; nothing after this line was read')
+
+
+def detect_format(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'json'}.get(ext, 'csv')
+
+
+def _init_worker():
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def _hash_password(raw):
+    return make_password(raw)
+
+
+class OnboardingImporter:
+    """Create users with patient or doctor profiles from a stream of rows, in batches"""
+
+    def __init__(self, kind, clinic=None, batch_size=1000, workers=None, dry_run=False):
+        if kind not in REQUIRED_FIELDS:
+            raise OnboardingImportError(f'Unknown kind: {kind}')
+        if kind == DOCTOR and clinic is None:
+            raise OnboardingImportError('Doctors must be imported into a clinic.')
+        self.kind = kind
+        self.clinic = clinic
+        self.batch_size = batch_size
+        self.workers = workers
+        self.dry_run = dry_run
+        self.result = ImportResult()
+        self._seen_usernames = set()
+        self._seen_emails = set()
+        self._services = {}
+        if clinic is not None:
+            for service_id, name in Service.objects.filter(clinic=clinic).values_list('id', 'name'):
+                self._services[name.lower()] = service_id
+                self._services[str(service_id)] = service_id
+
+    def run(self, rows):
+        # A dry run hashes no passwords, so it needs no worker processes
+        if self.dry_run:
+            executor = nullcontext()
+        else:
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        with executor as pool:
+            batch = []
+            for line, row in rows:
+                batch.append((line, row))
+                if len(batch) >= self.batch_size:
+                    self._process_batch(batch, pool)
+                    batch = []
+            if batch:
+                self._process_batch(batch, pool)
+        return self.result
+
+    def _clean(self, row):
+        """Validate a row and return normalized values, raising ValidationError"""
+        if not isinstance(row, dict):
+            raise ValidationError('Each row must be an object of field names and values')
+        missing = [name for name in REQUIRED_FIELDS[self.kind] if not str(row.get(name) or '').strip()]
+        if missing:
+            raise ValidationError(f"Missing required fields: {', '.join(missing)}")
+        cleaned = {
+            key: ';'.join(map(str, value)) if isinstance(value, list) else str(value).strip()
+            for key, value in row.items() if value is not None
+        }
+        cleaned['email'] = cleaned['email'].lower()
+        validate_email(cleaned['email'])
+
+        if cleaned['username'] in self._seen_usernames:
+            raise ValidationError(f"Duplicate username {cleaned['username']} in file")
+        if cleaned['email'] in self._seen_emails:
+            raise ValidationError(f"Duplicate email {cleaned['email']} in file")
+
+        if self.kind == PATIENT:
+            try:
+                cleaned['birth_date'] = date.fromisoformat(cleaned['birth_date'])
+            except ValueError:
+                raise ValidationError('birth_date must be YYYY-MM-DD')
+            cleaned['gender'] = cleaned['gender'].upper()[:1]
+            if cleaned['gender'] not in ('M', 'F'):
+                raise ValidationError('gender must be M or F')
+        else:
+            try:
+                cleaned['consultation_fee'] = Decimal(cleaned['consultation_fee'])
+                cleaned['years_of_experience'] = int(cleaned.get('years_of_experience') or 0)
+            except (InvalidOperation, ValueError):
+                raise ValidationError('consultation_fee and years_of_experience must be numbers')
+            service_ids = []
+            for name in filter(None, (s.strip() for s in cleaned.get('services', '').split(';'))):
+                if name.lower() not in self._services:
+                    raise ValidationError(f'Unknown service {name}')
+                service_ids.append(self._services[name.lower()])
+            cleaned['service_ids'] = service_ids
+        return cleaned
+
+    def _process_batch(self, batch, pool):
+        valid = []
+        for line, row in batch:
+            try:
+                cleaned = self._clean(row)
+            except ValidationError as e:
+                self.result.add_error(line, '; '.join(e.messages))
+                continue
+            self._seen_usernames.add(cleaned['username'])
+            self._seen_emails.add(cleaned['email'])
+            valid.append((line, cleaned))
+
+        # One query per batch for conflicts with existing accounts
+        existing = User.objects.filter(
+            Q(username__in=[row['username'] for _, row in valid]) |
+            Q(email__in=[row['email'] for _, row in valid])
+        ).values_list('username', 'email')
+        existing = list(existing)
+        taken_usernames = {username for username, _ in existing}
+        taken_emails = {email.lower() for _, email in existing}
+        rows = []
+        for line, row in valid:
+            if row['username'] in taken_usernames or row['email'] in taken_emails:
+                self.result.add_error(line, 'A user with this username or email already exists')
+            else:
+                rows.append(row)
+        if not rows:
+            return
+        if self.dry_run:
+            self.result.created += len(rows)
+            return
+
+        hashes = list(pool.map(_hash_password, [row['password'] for row in rows], chunksize=32))
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(
+                    username=row['username'],
+                    email=row['email'],
+                    password=password,
+                    first_name=row.get('first_name', ''),
+                    last_name=row.get('last_name', ''),
+                    phone=row.get('phone', ''),
+                    is_staff=self.kind == DOCTOR,
+                )
+                for row, password in zip(rows, hashes)
+            ])
+            if self.kind == PATIENT:
+                self._create_patients(users, rows)
+            else:
+                self._create_doctors(users, rows)
+        self.result.created += len(users)
+
+    def _link_role(self, users, role_name):
+        role, _ = Role.objects.get_or_create(name=role_name, defaults={'permissions': {}})
+        Through = User.roles.through
+        Through.objects.bulk_create([Through(user_id=user.pk, role_id=role.pk) for user in users])
+
+    def _create_patients(self, users, rows):
+        PatientProfile.objects.bulk_create([
+            PatientProfile(
+                user=user,
+                full_name=row['full_name'],
+                birth_date=row['birth_date'],
+                gender=row['gender'],
+                phone=row['phone'],
+                medical_history=row.get('medical_history', ''),
+                emergency_contact=row.get('emergency_contact', ''),
+                emergency_phone=row.get('emergency_phone', ''),
+            )
+            for user, row in zip(users, rows)
+        ])
+        self._link_role(users, Role.PATIENT)
+
+    def _create_doctors(self, users, rows):
+        doctors = DoctorProfile.objects.bulk_create([
+            DoctorProfile(
+                user=user,
+                specialty=row['specialty'],
+                qualification=row['qualification'],
+                clinic=self.clinic,
+                bio=row.get('bio', ''),
+                consultation_fee=row['consultation_fee'],
+                years_of_experience=row['years_of_experience'],
+            )
+            for user, row in zip(users, rows)
+        ])
+        self._link_role(users, Role.DOCTOR)
+
+        ServiceLink = Service.doctors.through
+        ServiceLink.objects.bulk_create([
+            ServiceLink(service_id=service_id, doctorprofile_id=doctor.pk)
+            for doctor, row in zip(doctors, rows)
+            for service_id in row['service_ids']
+        ])
+
+        # bulk_create sends no signals, so refresh the clinic page and search documents ourselves
+        invalidate_tags(clinic_tag(self.clinic.pk), CATALOG_TAG)
+        reindex(SearchDocument.DOCTOR, [doctor.pk for doctor in doctors])
+
+        # Doctors get the admin permissions granted to the Doctors group
+        group = Group.objects.filter(name='Doctors').first()
+        if group:
+            GroupLink = User.groups.through
+            GroupLink.objects.bulk_create([GroupLink(user_id=user.pk, group_id=group.pk) for user in users])
+
+
+def import_file(fileobj, filename, kind, **kwargs):
+    """Import an uploaded or opened binary file"""
+    stream = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    try:
+        importer = OnboardingImporter(kind, **kwargs)
+        return importer.run(read_rows(stream, detect_format(filename), on_error=importer.result.add_error))
+    finally:
+        stream.detach()
@@ -0,0 +1,63 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from health_linkr_app.allocation import allocate, find_run, find_runs
+from health_linkr_app.models import Appointment, DoctorProfile, PatientProfile, ScheduleSlot
+
+
+class Command(BaseCommand):
+    help = 'Measure multi-slot allocation latency on synthetic slots (all changes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slots', type=int, default=20000, help='Synthetic slots to create')
+        parser.add_argument('--slot-minutes', type=int, default=15)
+        parser.add_argument('--booked', type=float, default=0.3, help='Fraction of slots pre-booked')
+        parser.add_argument('--durations', default='15,30,60,90,120', help='Service durations in minutes')
+        parser.add_argument('--bookings', type=int, default=200, help='Allocations to run per duration')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        doctor = DoctorProfile.objects.first()
+        patient = PatientProfile.objects.first()
+        if doctor is None or patient is None:
+            raise CommandError('Needs at least one doctor and one patient profile.')
+        rng = random.Random(options['seed'])
+        step = timedelta(minutes=options['slot_minutes'])
+
+        with transaction.atomic():
+            start = (timezone.now() + timedelta(days=365)).replace(second=0, microsecond=0)
+            ScheduleSlot.objects.bulk_create([
+                ScheduleSlot(doctor=doctor, start_time=start + step * i, end_time=start + step * (i + 1),
+                             is_booked=rng.random() < options['booked'])
+                for i in range(options['slots'])
+            ], batch_size=2000)
+
+            for minutes in [int(m) for m in options['durations'].split(',')]:
+                duration = timedelta(minutes=minutes)
+                started = time.perf_counter()
+                runs = find_runs(doctor, duration, after=start - step)
+                scan = time.perf_counter() - started
+
+                latencies = []
+                for run in rng.sample(runs, min(options['bookings'], len(runs))):
+                    started = time.perf_counter()
+                    run = find_run(run[0], duration)
+                    if run is None:
+                        # Overlaps a run booked earlier in this benchmark
+                        continue
+                    allocate(Appointment(patient=patient, doctor=doctor), run)
+                    latencies.append(time.perf_counter() - started)
+
+                latencies.sort()
+                p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+                p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+                self.stdout.write(
+                    f'{minutes:>4} min: {len(runs)} runs found in {scan * 1000:.1f}ms, '
+                    f'{len(latencies)} allocations p50 {p50:.2f}ms p99 {p99:.2f}ms'
+                )
+            transaction.set_rollback(True)
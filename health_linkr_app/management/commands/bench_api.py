@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from health_linkr_app.models import Clinic, DoctorProfile, PatientProfile
+
+
+class Command(BaseCommand):
+    help = 'Compare latency, queries and bytes of the JSON API against the HTML views it replaces'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--username', help='Patient to authenticate as (defaults to the first patient)')
+
+    def _run(self, client, path, total, **headers):
+        client.get(path, **headers)
+        queries = 0
+        started = time.perf_counter()
+        for _ in range(total):
+            with CaptureQueriesContext(connection) as captured:
+                response = client.get(path, **headers)
+            queries += len(captured)
+            if response.status_code != 200:
+                raise CommandError(f'{path} answered {response.status_code}')
+        elapsed = time.perf_counter() - started
+        return elapsed / total * 1000, queries / total, len(response.content)
+
+    def handle(self, *args, **options):
+        patients = PatientProfile.objects.select_related('user')
+        if options['username']:
+            patients = patients.filter(user__username=options['username'])
+        patient = patients.first()
+        clinic = Clinic.objects.filter(is_active=True).first()
+        doctor = DoctorProfile.objects.filter(is_active=True).first()
+        if patient is None or clinic is None or doctor is None:
+            raise CommandError('Needs a patient, an active clinic and an active doctor.')
+
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(patient.user)
+        pairs = [
+            ('/', '/api/v1/clinics/?limit=100'),
+            (f'/clinic/{clinic.pk}/', f'/api/v1/doctors/?clinic={clinic.pk}'),
+            (f'/book/{doctor.pk}/', f'/api/v1/slots/?doctor={doctor.pk}&limit=100'),
+            ('/appointments/', '/api/v1/appointments/?limit=100'),
+        ]
+        total = options['requests']
+        for html_path, api_path in pairs:
+            for path, headers in ((html_path, {}), (api_path, {}), (api_path, {'HTTP_ACCEPT_ENCODING': 'gzip, br'})):
+                ms, queries, size = self._run(client, path, total, **headers)
+                label = f'{path} ({headers["HTTP_ACCEPT_ENCODING"]})' if headers else path
+                self.stdout.write(f'{label}: {ms:.2f} ms/request, {queries:.1f} queries/request, {size} bytes')
+            self.stdout.write('')
@@ -0,0 +1,56 @@
+import time
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+
+
+class Command(BaseCommand):
+    help = 'Measure requests per second with a new connection per request and with persistent connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='/', help='Path to request')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--max-age', type=int, default=None,
+                            help='CONN_MAX_AGE for the persistent run (defaults to the configured value, or 600)')
+
+    def _run(self, handler, environ, total, max_age):
+        connection.close()
+        connection.settings_dict['CONN_MAX_AGE'] = max_age
+        connects = 0
+        statuses = []
+
+        def start_response(status, headers, exc_info=None):
+            statuses.append(status)
+
+        started = time.perf_counter()
+        for _ in range(total):
+            if connection.connection is None:
+                connects += 1
+            # The full WSGI cycle, so request_started/finished manage connections as in production
+            response = handler(dict(environ), start_response)
+            for _chunk in response:
+                pass
+            response.close()
+            if statuses[-1].startswith('5'):
+                self.stderr.write(f'{environ["PATH_INFO"]} answered {statuses[-1]}')
+                break
+        return total / (time.perf_counter() - started), connects
+
+    def handle(self, *args, **options):
+        configured = connection.settings_dict['CONN_MAX_AGE']
+        persistent = options['max_age'] if options['max_age'] is not None else (configured or 600)
+        handler = WSGIHandler()
+        environ = RequestFactory(HTTP_HOST='localhost').get(options['url']).environ
+        total = options['requests']
+        try:
+            # Warm up imports, templates and caches
+            self._run(handler, environ, min(total, 20), 0)
+            runs = [('new connection per request', 0), (f'CONN_MAX_AGE={persistent}', persistent)]
+            for label, max_age in runs:
+                rate, connects = self._run(handler, environ, total, max_age)
+                self.stdout.write(f'{label}: {rate:.1f} requests/sec, {connects} connections opened')
+        finally:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = configured
@@ -0,0 +1,52 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import authenticate
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from health_linkr_app.models import User
+from health_linkr_app.passwords import hash_password, hashing_pool
+
+
+class Command(BaseCommand):
+    help = 'Measure password logins per second through the authentication backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=50, help='Total number of logins to run')
+        parser.add_argument('--clients', type=int, default=os.cpu_count() or 1,
+                            help='Concurrent login callers')
+
+    def handle(self, *args, **options):
+        username = f'bench-login-{os.getpid()}'
+        password = 'bench-password-123'
+        user = User.objects.create(username=username, email=f'{username}@example.invalid',
+                                   password=hash_password(password))
+        try:
+            total = options['logins']
+            clients = options['clients']
+
+            def login_once(_):
+                try:
+                    assert authenticate(username=username, password=password) is not None
+                finally:
+                    connections.close_all()
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                list(executor.map(login_once, range(total)))
+            elapsed = time.perf_counter() - started
+        finally:
+            user.delete()
+
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+        rate = total / elapsed
+        metrics = hashing_pool.metrics()
+        self.stdout.write(f'{total} logins with {clients} clients in {elapsed:.2f}s')
+        self.stdout.write(f'{rate:.1f} logins/sec, {rate / cores:.1f} logins/sec per core ({cores} cores)')
+        self.stdout.write(
+            f"hashing pool: {metrics['workers']} workers, max in flight {metrics['max_in_flight']}, "
+            f"avg wait {metrics['avg_wait_ms']:.1f}ms, avg hash {metrics['avg_run_ms']:.1f}ms, "
+            f"rejected {metrics['rejected']}"
+        )
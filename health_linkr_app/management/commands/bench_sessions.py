@@ -0,0 +1,92 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from health_linkr_app.middleware.session import SESSION_LOG_KEY
+from health_linkr_app.models import SessionLog, User
+
+ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare session engines by latency and queries per authenticated request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='/', help='Path to request')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--username', help='User to authenticate as (defaults to the first active user)')
+        parser.add_argument('--engines', default=','.join(ENGINES), help='Comma-separated engines to compare')
+
+    def _login(self, engine, user):
+        """A session for the user in the given engine, as login() would leave it"""
+        store = engine()
+        store.update({
+            SESSION_KEY: str(user.pk),
+            BACKEND_SESSION_KEY: settings.AUTHENTICATION_BACKENDS[0],
+            HASH_SESSION_KEY: user.get_session_auth_hash(),
+            SESSION_LOG_KEY: SessionLog.objects.create(user=user).pk,
+        })
+        store.save()
+        return store
+
+    def _run(self, handler, environ, total, cookie_name):
+        statuses = []
+        cookies = {}
+
+        def start_response(status, headers, exc_info=None):
+            statuses.append(status)
+            for name, value in headers:
+                if name == 'Set-Cookie' and value.startswith(f'{cookie_name}='):
+                    cookies[cookie_name] = value.split(';', 1)[0].split('=', 1)[1]
+
+        queries = session_queries = 0
+        started = time.perf_counter()
+        for _ in range(total):
+            request_environ = dict(environ, HTTP_COOKIE=f'{cookie_name}={cookies[cookie_name]}') if cookies else environ
+            with CaptureQueriesContext(connection) as captured:
+                response = handler(dict(request_environ), start_response)
+                for _chunk in response:
+                    pass
+                response.close()
+            queries += len(captured)
+            session_queries += sum(
+                1 for query in captured if 'django_session' in query['sql'] or '_sessionlog' in query['sql']
+            )
+            if not statuses[-1].startswith('2'):
+                # A redirect usually means the session was not accepted
+                raise CommandError(f'{environ["PATH_INFO"]} answered {statuses[-1]}')
+        elapsed = time.perf_counter() - started
+        return elapsed / total * 1000, queries / total, session_queries / total
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True)
+        user = users.filter(username=options['username']).first() if options['username'] else users.first()
+        if user is None:
+            raise CommandError('Needs an active user.')
+
+        factory = RequestFactory(HTTP_HOST='localhost')
+        for name in options['engines'].split(','):
+            path = ENGINES.get(name, name)
+            with override_settings(SESSION_ENGINE=path):
+                store = self._login(import_module(path).SessionStore, user)
+                environ = dict(factory.get(options['url']).environ, HTTP_COOKIE=f'{settings.SESSION_COOKIE_NAME}={store.session_key}')
+                # A new handler so SessionMiddleware picks up the engine
+                handler = WSGIHandler()
+                self._run(handler, environ, min(options['requests'], 20), settings.SESSION_COOKIE_NAME)
+                ms, queries, session_queries = self._run(
+                    handler, environ, options['requests'], settings.SESSION_COOKIE_NAME
+                )
+                self.stdout.write(f'{name}: {ms:.2f} ms/request, {queries:.1f} queries/request '
+                                  f'({session_queries:.1f} for sessions)')
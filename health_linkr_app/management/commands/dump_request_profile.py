@@ -0,0 +1,52 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from health_linkr_app import profiling
+
+
+class Command(BaseCommand):
+    help = 'Print per-view request profiles collected by RequestProfilingMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print the raw aggregates as JSON')
+        parser.add_argument('--view', help='Only show views whose name contains this')
+        parser.add_argument('--sort', default='wall_ms', choices=sorted(profiling.TIMINGS),
+                            help='Order views by the mean of this measurement')
+        parser.add_argument('--duplicates', type=int, default=3, help='Duplicate queries to show per view')
+        parser.add_argument('--reset', action='store_true', help='Clear the aggregates after printing')
+
+    def handle(self, *args, **options):
+        report = profiling.report()
+        if options['view']:
+            report = {name: stats for name, stats in report.items() if options['view'] in name}
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        elif not report:
+            self.stdout.write('No profiled requests yet (is PROFILING_SAMPLE_RATE set?)')
+        else:
+            self._print_table(report, options['sort'], options['duplicates'])
+
+        if options['reset']:
+            profiling.reset()
+            self.stdout.write('Profiles cleared')
+
+    def _print_table(self, report, sort, duplicates):
+        rows = sorted(report.items(), key=lambda item: -item[1][sort]['mean'])
+        self.stdout.write(f'{"view":<55} {"n":>6} {"wall p50/p95":>13} {"db mean":>8} '
+                          f'{"tpl mean":>8} {"queries":>8} {"cache hit":>9}')
+        for name, stats in rows:
+            wall = stats['wall_ms']
+            lookups = stats['cache_hits'] + stats['cache_misses']
+            hit_ratio = f'{stats["cache_hits"] / lookups:.0%}' if lookups else '-'
+            self.stdout.write(
+                f'{name:<55} {stats["count"]:>6} {self._bound(wall["p50"]):>6}/{self._bound(wall["p95"]):<6} '
+                f'{stats["db_ms"]["mean"]:>8} {stats["template_ms"]["mean"]:>8} '
+                f'{stats["queries"]["mean"]:>8} {hit_ratio:>9}'
+            )
+            for entry in stats['duplicates'][:duplicates]:
+                self.stdout.write(f'    x{entry["executions"]} in {entry["requests"]} requests: {entry["sql"][:120]}')
+
+    def _bound(self, value):
+        return '>max' if value is None else f'{value}'
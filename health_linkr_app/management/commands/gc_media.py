@@ -0,0 +1,61 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from health_linkr_app.images import photo_sizes, variant_name, variant_storage
+from health_linkr_app.models import MediaBlob, User
+from health_linkr_app.storage import recount_references
+
+
+class Command(BaseCommand):
+    help = 'Delete content-addressed media files that are no longer referenced'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report the files that would be deleted')
+        parser.add_argument('--grace-minutes', type=int, default=60,
+                            help='Keep orphans released more recently than this')
+        parser.add_argument('--recount', action='store_true',
+                            help='Recompute reference counts from the database first')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            recount_references()
+
+        cutoff = timezone.now() - timedelta(minutes=options['grace_minutes'])
+        orphans = MediaBlob.objects.filter(ref_count__lte=0, updated_at__lt=cutoff)
+        deleted = freed = 0
+        batch_size = options['batch_size']
+        last_pk = 0
+        while True:
+            batch = list(orphans.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            # Never trust the counter alone before deleting a file
+            referenced = set(User.objects.filter(
+                profile_photo__in=[blob.name for blob in batch]
+            ).values_list('profile_photo', flat=True))
+            removable = [blob for blob in batch if blob.name not in referenced]
+            for blob in removable:
+                if options['dry_run']:
+                    self.stdout.write(f'Would delete {blob.name}')
+                    continue
+                default_storage.delete(blob.name)
+            if not options['dry_run']:
+                MediaBlob.objects.filter(pk__in=[blob.pk for blob in removable]).delete()
+                self._delete_variants({blob.digest for blob in removable})
+            deleted += len(removable)
+            freed += sum(blob.size for blob in removable)
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {deleted} orphaned files ({freed} bytes).'))
+
+    def _delete_variants(self, digests):
+        still_used = set(MediaBlob.objects.filter(digest__in=digests).values_list('digest', flat=True))
+        for digest in digests - still_used:
+            for size in photo_sizes():
+                variant_storage.delete(variant_name(digest, size))
@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from health_linkr_app.caching import invalidate_slots
+from health_linkr_app.models import DoctorProfile, ScheduleSlot
+
+
+class Command(BaseCommand):
+    help = "Create schedule slots for doctors within their clinic's opening hours"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=14, help='How many days ahead to fill')
+        parser.add_argument('--slot-minutes', type=int, default=30)
+        parser.add_argument('--clinic', type=int, help='Only doctors of this clinic')
+        parser.add_argument('--doctor', type=int, help='Only this doctor')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many slots would be created')
+
+    def handle(self, *args, **options):
+        start = timezone.now().replace(second=0, microsecond=0) + timedelta(minutes=1)
+        end = start + timedelta(days=options['days'])
+        doctors = DoctorProfile.objects.filter(is_active=True, clinic__is_active=True).select_related('clinic', 'user')
+        if options['clinic']:
+            doctors = doctors.filter(clinic_id=options['clinic'])
+        if options['doctor']:
+            doctors = doctors.filter(pk=options['doctor'])
+
+        created_total = 0
+        touched = set()
+        for doctor in doctors:
+            existing = list(ScheduleSlot.objects.filter(
+                doctor=doctor, start_time__lt=end, end_time__gt=start
+            ).order_by('start_time').values_list('start_time', 'end_time'))
+            new_slots = []
+            index = 0
+            for slot_start, slot_end in doctor.clinic.hours.slot_times(start, end, options['slot_minutes']):
+                # Both lists are time-ordered, so one pass finds overlaps with existing slots
+                while index < len(existing) and existing[index][1] <= slot_start:
+                    index += 1
+                if index < len(existing) and existing[index][0] < slot_end:
+                    continue
+                new_slots.append(ScheduleSlot(doctor=doctor, start_time=slot_start, end_time=slot_end))
+            if new_slots and not options['dry_run']:
+                ScheduleSlot.objects.bulk_create(new_slots, batch_size=1000)
+                touched.add(doctor.pk)
+            created_total += len(new_slots)
+            self.stdout.write(f'{doctor}: {len(new_slots)} slots')
+
+        invalidate_slots(touched)
+        verb = 'Would create' if options['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {created_total} slots.'))
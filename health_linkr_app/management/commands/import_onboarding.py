@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from health_linkr_app.importer import DOCTOR, PATIENT, OnboardingImportError, import_file
+from health_linkr_app.models import Clinic
+
+
+class Command(BaseCommand):
+    help = 'Bulk import patients or doctors from a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--kind', choices=[PATIENT, DOCTOR], default=PATIENT)
+        parser.add_argument('--clinic', type=int, help='Clinic id (required for doctors)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Password hashing processes (defaults to the CPU count)')
+        parser.add_argument('--dry-run', action='store_true', help='Validate without writing')
+
+    def handle(self, *args, **options):
+        clinic = None
+        if options['clinic']:
+            try:
+                clinic = Clinic.objects.get(pk=options['clinic'])
+            except Clinic.DoesNotExist:
+                raise CommandError(f"Clinic {options['clinic']} does not exist")
+
+        try:
+            with open(options['path'], 'rb') as f:
+                result = import_file(
+                    f, options['path'], options['kind'],
+                    clinic=clinic,
+                    batch_size=options['batch_size'],
+                    workers=options['workers'],
+                    dry_run=options['dry_run']
+                )
+        except (OSError, OnboardingImportError) as e:
+            raise CommandError(str(e))
+
+        for line, message in sorted(result.errors):
+            self.stderr.write(f'Line {line}: {message}')
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {result.created} {options["kind"]}s, skipped {result.skipped} rows.'
+        ))
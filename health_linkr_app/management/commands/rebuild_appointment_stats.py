@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from health_linkr_app.stats import rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily appointment rollup table from appointment history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Number of appointments scanned per query')
+
+    def handle(self, *args, **options):
+        verbose = options['verbosity'] > 1
+        rows = rebuild_daily_stats(
+            chunk_size=options['chunk_size'],
+            stdout=self.stdout if verbose else None
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} daily appointment stat rows.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from health_linkr_app.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Recreate the search documents of every clinic, doctor and service'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = rebuild_index(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} documents.'))
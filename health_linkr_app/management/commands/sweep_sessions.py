@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from health_linkr_app.sweeper import in_peak_hours, sweep_sessions
+
+
+class Command(BaseCommand):
+    help = 'Close session logs of expired sessions and delete expired sessions in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=settings.SESSION_SWEEP_CHUNK_SIZE)
+        parser.add_argument('--pause', type=float, default=settings.SESSION_SWEEP_PAUSE,
+                            help='Seconds to sleep between chunks')
+        parser.add_argument('--max-seconds', type=float, default=None, help='Stop after this long')
+        parser.add_argument('--force', action='store_true', help='Run even during SESSION_SWEEP_PEAK_HOURS')
+
+    def handle(self, *args, **options):
+        if in_peak_hours() and not options['force']:
+            self.stdout.write(f'Skipping: inside peak hours ({settings.SESSION_SWEEP_PEAK_HOURS}); use --force to run.')
+            return
+        result = sweep_sessions(
+            chunk_size=options['chunk_size'], pause=options['pause'], max_seconds=options['max_seconds']
+        )
+        message = f'Closed {result.closed} session logs and deleted {result.deleted} expired sessions.'
+        if not result.finished:
+            message += ' Stopped early; run again to continue.'
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from health_linkr_app.caching import is_process_local
+from health_linkr_app.holds import sweep_expired_holds
+
+
+class Command(BaseCommand):
+    help = 'Remove expired slot holds from the per-doctor hold indexes'
+
+    def handle(self, *args, **options):
+        if is_process_local():
+            # This command would sweep its own empty cache, not the one the web workers use
+            raise CommandError(
+                'Slot holds live in the default cache, which is process-local here (locmem). '
+                'Point CACHE_URL at a shared cache such as redis or memcached before sweeping.'
+            )
+        removed = sweep_expired_holds()
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} expired slot holds.'))
@@ -0,0 +1,96 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def _parse_range(header, size):
+    """Parse a single-range Range header into (start, end), inclusive"""
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if start:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    elif end:
+        # Suffix range: the last N bytes
+        start = max(size - int(end), 0)
+        end = size - 1
+    else:
+        return None
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def _iter_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _sendfile_response(path):
+    """Hand the transfer to the front-end server when configured to"""
+    backend = getattr(settings, 'SENDFILE_BACKEND', '')
+    if backend == 'nginx':
+        relative = os.path.relpath(path, settings.MEDIA_ROOT)
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = settings.SENDFILE_URL_PREFIX.rstrip('/') + '/' + relative
+        return response
+    if backend == 'apache':
+        response = HttpResponse()
+        response['X-Sendfile'] = path
+        return response
+    return None
+
+
+def serve_file(request, path, etag=None, max_age=0, immutable=False):
+    """Serve a file from disk with conditional, Range and sendfile support"""
+    stat = os.stat(path)
+    size = stat.st_size
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    etag = f'"{etag}"' if etag else f'"{int(stat.st_mtime)}-{size}"'
+
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = _sendfile_response(path)
+        byte_range = None
+        if response is None and 'Range' in request.headers:
+            byte_range = _parse_range(request.headers['Range'], size)
+            if byte_range is False:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+        start, end = byte_range or (0, size - 1)
+
+        if response is None and byte_range:
+            response = StreamingHttpResponse(_iter_range(path, start, end - start + 1), status=206)
+            response['Content-Length'] = str(end - start + 1)
+        elif response is None:
+            # Whole files go out through wsgi.file_wrapper, which servers can turn into sendfile()
+            response = FileResponse(open(path, 'rb'))
+        if byte_range:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Type'] = content_type
+
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    cache_control = f'public, max-age={max_age}'
+    if immutable:
+        cache_control += ', immutable'
+    response['Cache-Control'] = cache_control
+    return response
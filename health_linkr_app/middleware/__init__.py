@@ -1,4 +1,11 @@
 from .session import SessionExpiryMiddleware
 from .auth import AuthRequiredMiddleware
+from .throttle import HashingPoolBusyMiddleware
+from .database import StatementTimeoutMiddleware
+from .replica import ReplicaRoutingMiddleware
+from .profiling import RequestProfilingMiddleware
+from .nplusone import NPlusOneMiddleware
 
-__all__ = ['SessionExpiryMiddleware', 'AuthRequiredMiddleware']
+__all__ = ['SessionExpiryMiddleware', 'AuthRequiredMiddleware', 'HashingPoolBusyMiddleware',
+           'StatementTimeoutMiddleware', 'ReplicaRoutingMiddleware', 'RequestProfilingMiddleware',
+           'NPlusOneMiddleware']
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.db import connection
+
+from health_linkr_app.timeouts import set_statement_timeout
+
+
+class StatementTimeoutMiddleware:
+    """Apply per-view statement timeouts, restoring the default afterwards
+
+    Connections are persistent or pooled, so a timeout set for one view must
+    not leak into the next request served on the same connection.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.timeouts = getattr(settings, 'STATEMENT_TIMEOUTS', {})
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if getattr(request, '_statement_timeout_set', False) and connection.connection is not None:
+            set_statement_timeout(None)
+        return response
+
+    def _timeout_for(self, request, view_func):
+        match = request.resolver_match
+        if match is not None and match.view_name in self.timeouts:
+            return self.timeouts[match.view_name]
+        view_class = getattr(view_func, 'view_class', None)
+        return getattr(view_func, 'statement_timeout', getattr(view_class, 'statement_timeout', None))
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timeout = self._timeout_for(request, view_func)
+        if timeout is not None:
+            set_statement_timeout(timeout)
+            request._statement_timeout_set = True
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from health_linkr_app.nplusone import detect, install
+
+
+class NPlusOneMiddleware:
+    """Detect relations lazily loaded over and over while serving a request
+
+    NPLUSONE_MODE is 'raise' under the test runner so regressions fail
+    tests, 'log' in staging to report them with their origin, and 'off'
+    elsewhere.
+    """
+
+    def __init__(self, get_response):
+        if getattr(settings, 'NPLUSONE_MODE', 'off') == 'off':
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        install()
+
+    def __call__(self, request):
+        with detect():
+            return self.get_response(request)
@@ -0,0 +1,46 @@
+import random
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from health_linkr_app import profiling
+
+
+class RequestProfilingMiddleware:
+    """Record wall, DB and template time, query counts and cache hits for a sample of requests
+
+    Samples are attributed to the resolved URL name (admin views by their
+    namespaced name) and aggregated per view; see profiling.report(). Off
+    unless PROFILING_SAMPLE_RATE is above zero.
+    """
+
+    def __init__(self, get_response):
+        self.rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+        if self.rate <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        profiling.instrument_templates()
+
+    def __call__(self, request):
+        if random.random() >= self.rate:
+            return self.get_response(request)
+
+        profile, token = profiling.begin()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.query_wrapper))
+                response = self.get_response(request)
+        finally:
+            profiling.end(token)
+
+        match = request.resolver_match
+        view_name = match.view_name if match is not None else '<unresolved>'
+        sample = profiling.record(view_name, profile)
+        if getattr(settings, 'PROFILING_HEADER', False):
+            response['Server-Timing'] = ', '.join(
+                f'{name.removesuffix("_ms")};dur={sample[name]:.1f}' for name in ('wall_ms', 'db_ms', 'template_ms')
+            )
+        return response
@@ -0,0 +1,63 @@
+import time
+
+from django.conf import settings
+
+from health_linkr_app.routers import restore, use_replica
+
+PIN_SESSION_KEY = 'db_pinned_until'
+
+
+def pin_to_primary(request, seconds=None):
+    """Serve this session's reads from the primary for a while, so it sees its own writes"""
+    seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 30) if seconds is None else seconds
+    if hasattr(request, 'session'):
+        request.session[PIN_SESSION_KEY] = time.time() + seconds
+
+
+class ReplicaRoutingMiddleware:
+    """Serve read-only views from a replica unless the session recently wrote
+
+    A view is replica-eligible when it is marked with @replica_reads, its URL
+    name is listed in REPLICA_VIEWS, or it is an admin changelist. Any
+    successful unsafe request pins the session to the primary for
+    REPLICA_PIN_SECONDS.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.views = set(getattr(settings, 'REPLICA_VIEWS', ()))
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            token = getattr(request, '_replica_token', None)
+            if token is not None:
+                restore(token)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            pin_to_primary(request)
+        return response
+
+    def _eligible(self, request, view_func):
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        if getattr(view_func, 'replica_reads', False):
+            return True
+        view_class = getattr(view_func, 'view_class', None)
+        if getattr(view_class, 'replica_reads', False):
+            return True
+        match = request.resolver_match
+        if match is None:
+            return False
+        if match.view_name in self.views:
+            return True
+        return 'admin' in match.app_names and match.url_name.endswith('_changelist')
+
+    def _pinned(self, request):
+        session = getattr(request, 'session', None)
+        return session is not None and session.get(PIN_SESSION_KEY, 0) > time.time()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self._eligible(request, view_func) and not self._pinned(request):
+            # Stays on until the response, including lazily rendered templates, is built
+            request._replica_token = use_replica()
@@ -1,92 +1,97 @@
+from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth import logout
 from django.contrib.auth.signals import user_logged_in, user_logged_out
 from django.dispatch import receiver
 from django.db.models.signals import post_save
-from datetime import datetime
 from health_linkr_app.models import SessionLog
+from health_linkr_app.revocation import is_revoked, revoke_sessions
+from health_linkr_app.telemetry import client_ip, request_user_agent_id
+
+# The SessionLog row for this session, kept in the session itself so requests need no lookup
+SESSION_LOG_KEY = '_session_log_id'
+
+
+def start_session_log(request, user):
+    """Record a new session and remember its log in the session"""
+    session_log = SessionLog.objects.create(
+        user=user,
+        ip_address=client_ip(request),
+        user_agent_id=request_user_agent_id(request),
+        # Empty for signed-cookie sessions, which have no server-side key
+        session_id=request.session.session_key or ''
+    )
+    request.session[SESSION_LOG_KEY] = session_log.pk
+    return session_log.pk
+
 
 class SessionExpiryMiddleware:
+    """Enforce forced logout and idle expiry without touching the database per request
+
+    Revoked sessions are found in the cache revocation list (see
+    revocation.py), and idle time is tracked in the session, so only login,
+    logout and expiry write to SessionLog.
+    """
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.idle_seconds = getattr(settings, 'SESSION_IDLE_SECONDS', 1800)
 
     def __call__(self, request):
         if request.user.is_authenticated:
-            # Get or create session log for this session
-            session_id = request.session.session_key or ''
-            session_log = SessionLog.objects.filter(
-                user=request.user,
-                session_id=session_id,
-                logout_time__isnull=True
-            ).first()
+            log_id = request.session.get(SESSION_LOG_KEY)
+            if log_id is None:
+                # Sessions created before logs were kept in the session, or without a login signal
+                log_id = start_session_log(request, request.user)
 
-            # Force logout if session is marked as expired
-            if session_log and session_log.is_expired:
+            # Force logout if the session was revoked
+            elif is_revoked(log_id):
                 logout(request)
                 return self.get_response(request)
 
-            if not session_log and session_id:
-                # Create new session log if none exists
-                session_log = SessionLog.objects.create(
-                    user=request.user,
-                    ip_address=request.META.get('REMOTE_ADDR', ''),
-                    user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                    session_id=session_id
+            # Check for session expiration
+            now = timezone.now()
+            last_activity = request.session.get('last_activity')
+            if last_activity and now.timestamp() - last_activity > self.idle_seconds:
+                # Mark session as expired
+                SessionLog.objects.filter(pk=log_id, logout_time__isnull=True).update(
+                    is_expired=True, logout_time=now
                 )
-
-            if session_log:
-                # Check for session expiration
-                last_activity = request.session.get('last_activity')
-                if last_activity:
-                    last_activity_dt = datetime.fromtimestamp(last_activity, tz=timezone.get_current_timezone())
-                    if (timezone.now() - last_activity_dt).total_seconds() > 1800:  # 30 minutes
-                        # Mark session as expired
-                        session_log.is_expired = True
-                        session_log.logout_time = timezone.now()
-                        session_log.save()
-                        logout(request)
-                    else:
-                        # Update last activity
-                        request.session['last_activity'] = timezone.now().timestamp()
+                logout(request)
+            else:
+                # Update last activity
+                request.session['last_activity'] = now.timestamp()
 
         response = self.get_response(request)
         return response
 
 @receiver(user_logged_out)
 def log_user_logout(sender, request, user, **kwargs):
-    if user and request.session.session_key:
-        # Mark existing session as logged out
-        SessionLog.objects.filter(
-            user=user,
-            session_id=request.session.session_key,
-            is_expired=False,
-            logout_time__isnull=True
-        ).update(
-            logout_time=timezone.now(),
-            is_expired=True
-        )
+    if not user:
+        return
+    log_id = request.session.get(SESSION_LOG_KEY)
+    if log_id is not None:
+        logs = SessionLog.objects.filter(pk=log_id)
+    elif request.session.session_key:
+        logs = SessionLog.objects.filter(user=user, session_id=request.session.session_key)
+    else:
+        return
+    # Mark existing session as logged out
+    logs.filter(is_expired=False, logout_time__isnull=True).update(
+        logout_time=timezone.now(),
+        is_expired=True
+    )
 
 @receiver(user_logged_in)
 def log_user_login(sender, request, user, **kwargs):
     # Create new session log on login
-    if user and request.session.session_key:
-        SessionLog.objects.create(
-            user=user,
-            ip_address=request.META.get('REMOTE_ADDR', ''),
-            user_agent=request.META.get('HTTP_USER_AGENT', ''),
-            session_id=request.session.session_key
-        )
+    if user and hasattr(request, 'session'):
+        start_session_log(request, user)
 
 @receiver(post_save, sender=SessionLog)
 def handle_session_expiry(sender, instance, **kwargs):
     """Handle forced session expiry by admin"""
-    if instance.is_expired and instance.session_id and not instance.logout_time:
-        from django.contrib.sessions.models import Session
-        try:
-            # Delete the session to force logout
-            Session.objects.filter(session_key=instance.session_id).delete()
-            # Update logout time
-            instance.logout_time = timezone.now()
-            instance.save()
-        except Session.DoesNotExist:
-            pass
+    if instance.is_expired and not instance.logout_time:
+        # Revocation updates the row with a queryset, so this receiver does not fire again
+        revoke_sessions(SessionLog.objects.filter(pk=instance.pk))
+        instance.logout_time = timezone.now()
@@ -0,0 +1,17 @@
+from django.http import HttpResponse
+from health_linkr_app.passwords import HashingPoolBusy
+
+class HashingPoolBusyMiddleware:
+    """Answer with 503 instead of an error page when the password hashing queue is full"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, HashingPoolBusy):
+            response = HttpResponse('The service is busy, please try again shortly.', status=503)
+            response['Retry-After'] = '5'
+            return response
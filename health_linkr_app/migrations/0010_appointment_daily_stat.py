@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_linkr_app', '0009_add_doctor_model_permissions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('CONFIRMED', 'Confirmed'), ('COMPLETED', 'Completed'), ('CANCELLED', 'Cancelled')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('clinic', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='appointment_stats', to='health_linkr_app.clinic')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='appointment_stats', to='health_linkr_app.doctorprofile')),
+                ('service', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='appointment_stats', to='health_linkr_app.service')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['date', 'status'], name='health_link_date_a9ed3c_idx'), models.Index(fields=['clinic', 'date'], name='health_link_clinic__044a90_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'clinic', 'doctor', 'service', 'status'), name='unique_appointment_daily_stat')],
+            },
+        ),
+    ]
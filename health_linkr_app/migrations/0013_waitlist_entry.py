@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_linkr_app', '0012_media_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window_start', models.DateTimeField()),
+                ('window_end', models.DateTimeField()),
+                ('priority', models.PositiveSmallIntegerField(default=0, help_text='Higher priority entries are offered slots first')),
+                ('status', models.CharField(choices=[('ACTIVE', 'Waiting'), ('OFFERED', 'Slot offered'), ('FULFILLED', 'Fulfilled'), ('CANCELLED', 'Cancelled')], default='ACTIVE', max_length=20)),
+                ('offered_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='health_linkr_app.doctorprofile')),
+                ('offered_slot', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='waitlist_offers', to='health_linkr_app.scheduleslot')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='health_linkr_app.patientprofile')),
+                ('service', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='waitlist_entries', to='health_linkr_app.service')),
+            ],
+            options={
+                'ordering': ['-priority', 'created_at'],
+                'indexes': [models.Index(fields=['doctor', 'status', 'window_start'], name='health_link_doctor__32b642_idx'), models.Index(fields=['patient', 'status'], name='health_link_patient_2060a8_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('window_end__gt', models.F('window_start'))), name='valid_waitlist_window')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:27
+
+from django.db import migrations, models
+
+
+def backfill_slots(apps, schema_editor):
+    Appointment = apps.get_model('health_linkr_app', 'Appointment')
+    Through = Appointment.slots.through
+    rows = Appointment.objects.filter(slot__isnull=False).values_list('id', 'slot_id')
+    batch = []
+    for appointment_id, slot_id in rows.iterator(chunk_size=2000):
+        batch.append(Through(appointment_id=appointment_id, scheduleslot_id=slot_id))
+        if len(batch) >= 2000:
+            Through.objects.bulk_create(batch)
+            batch = []
+    Through.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_linkr_app', '0013_waitlist_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='slots',
+            field=models.ManyToManyField(blank=True, help_text='Every slot the appointment occupies, starting with slot', related_name='covering_appointments', to='health_linkr_app.scheduleslot'),
+        ),
+        migrations.RunPython(backfill_slots, migrations.RunPython.noop),
+    ]
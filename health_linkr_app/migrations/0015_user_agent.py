@@ -0,0 +1,124 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:44
+
+import hashlib
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copy of the user-agent parser in health_linkr_app.telemetry at the time of this migration
+USER_AGENT_MAX_LENGTH = 512
+
+_BOT = re.compile(r'bot|crawl|spider|slurp|curl|wget|python-requests|httpclient|headless', re.IGNORECASE)
+
+# (name, pattern capturing the version), checked in order: most browsers also claim to be Chrome or Safari
+_BROWSERS = (
+    ('Edge', re.compile(r'Edg(?:e|A|iOS)?/(\d+)')),
+    ('Opera', re.compile(r'(?:OPR|Opera)/(\d+)')),
+    ('Samsung Internet', re.compile(r'SamsungBrowser/(\d+)')),
+    ('Firefox', re.compile(r'(?:Firefox|FxiOS)/(\d+)')),
+    ('Chrome', re.compile(r'(?:Chrome|CriOS)/(\d+)')),
+    ('Safari', re.compile(r'Version/(\d+)[\d.]* (?:Mobile/\S+ )?Safari/')),
+    ('Internet Explorer', re.compile(r'(?:MSIE |Trident/.*rv:)(\d+)')),
+)
+
+_OPERATING_SYSTEMS = (
+    ('iOS', re.compile(r'iPhone|iPad|iPod')),
+    ('Android', re.compile(r'Android')),
+    ('ChromeOS', re.compile(r'CrOS')),
+    ('Windows', re.compile(r'Windows')),
+    ('macOS', re.compile(r'Mac OS X|Macintosh')),
+    ('Linux', re.compile(r'Linux')),
+)
+
+
+def parse_user_agent(raw):
+    browser = version = os_name = ''
+    for name, pattern in _BROWSERS:
+        match = pattern.search(raw)
+        if match:
+            browser, version = name, match.group(1)
+            break
+    for name, pattern in _OPERATING_SYSTEMS:
+        if pattern.search(raw):
+            os_name = name
+            break
+
+    if not raw:
+        device_type = 'other'
+    elif _BOT.search(raw):
+        device_type = 'bot'
+    elif 'iPad' in raw or 'Tablet' in raw or ('Android' in raw and 'Mobile' not in raw):
+        device_type = 'tablet'
+    elif 'Mobi' in raw or 'iPhone' in raw:
+        device_type = 'mobile'
+    elif os_name in ('Windows', 'macOS', 'Linux', 'ChromeOS'):
+        device_type = 'desktop'
+    else:
+        device_type = 'other'
+    return {'browser': browser, 'browser_version': version, 'os': os_name, 'device_type': device_type}
+
+
+def user_agent_digest(raw):
+    return hashlib.sha256(raw.encode('utf-8', 'replace')).hexdigest()
+
+
+def intern_user_agents(apps, schema_editor):
+    SessionLog = apps.get_model('health_linkr_app', 'SessionLog')
+    UserAgent = apps.get_model('health_linkr_app', 'UserAgent')
+    raw_values = SessionLog.objects.exclude(user_agent='').values_list('user_agent', flat=True).distinct()
+    for raw in raw_values.iterator(chunk_size=2000):
+        truncated = raw[:USER_AGENT_MAX_LENGTH]
+        agent, _ = UserAgent.objects.get_or_create(
+            digest=user_agent_digest(truncated), defaults={'raw': truncated, **parse_user_agent(truncated)}
+        )
+        # One UPDATE per distinct string rather than per session
+        SessionLog.objects.filter(user_agent=raw).update(agent=agent)
+
+
+def restore_user_agents(apps, schema_editor):
+    SessionLog = apps.get_model('health_linkr_app', 'SessionLog')
+    UserAgent = apps.get_model('health_linkr_app', 'UserAgent')
+    for agent in UserAgent.objects.iterator(chunk_size=2000):
+        SessionLog.objects.filter(agent=agent).update(user_agent=agent.raw)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_linkr_app', '0014_appointment_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAgent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('raw', models.TextField()),
+                ('browser', models.CharField(blank=True, max_length=50)),
+                ('browser_version', models.CharField(blank=True, max_length=20)),
+                ('os', models.CharField(blank=True, max_length=50)),
+                ('device_type', models.CharField(choices=[('desktop', 'Desktop'), ('mobile', 'Mobile'), ('tablet', 'Tablet'), ('bot', 'Bot'), ('other', 'Other')], default='other', max_length=10)),
+                ('first_seen', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['device_type', 'browser'], name='health_link_device__a688a7_idx'), models.Index(fields=['os'], name='health_link_os_55cf0e_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='sessionlog',
+            name='agent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='session_logs', to='health_linkr_app.useragent'),
+        ),
+        migrations.RunPython(intern_user_agents, restore_user_agents),
+        migrations.RemoveField(
+            model_name='sessionlog',
+            name='user_agent',
+        ),
+        migrations.RenameField(
+            model_name='sessionlog',
+            old_name='agent',
+            new_name='user_agent',
+        ),
+    ]
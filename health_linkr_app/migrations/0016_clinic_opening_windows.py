@@ -0,0 +1,147 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:46
+
+import logging
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+# Frozen copy of the opening-hours parser in health_linkr_app.opening_hours at the time of this migration
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+MINUTES_PER_DAY = 24 * 60
+
+_TIME = re.compile(r'^\s*(\d{1,2})(?:[:.](\d{2}))?\s*$')
+_CLOSED = {'', 'closed', 'none', '-'}
+
+
+def parse_time(value):
+    match = _TIME.match(value)
+    if not match:
+        raise ValueError(f'Invalid time {value!r}')
+    hours, minutes = int(match.group(1)), int(match.group(2) or 0)
+    if minutes > 59 or hours * 60 + minutes > MINUTES_PER_DAY:
+        raise ValueError(f'Invalid time {value!r}')
+    return hours * 60 + minutes
+
+
+def format_time(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def day_ranges(value):
+    if value is None:
+        return []
+    if isinstance(value, dict):
+        opens, closes = value.get('open') or '', value.get('close') or ''
+        if not opens.strip() and not closes.strip():
+            return []
+        return [(parse_time(opens), parse_time(closes))]
+    if isinstance(value, str):
+        if value.strip().lower() in _CLOSED:
+            return []
+        ranges = []
+        for part in value.split(','):
+            opens, sep, closes = part.partition('-')
+            if not sep:
+                raise ValueError(f'Invalid opening hours {value!r}')
+            ranges.append((parse_time(opens), parse_time(closes)))
+        return ranges
+    if isinstance(value, (list, tuple)):
+        if len(value) == 2 and all(isinstance(v, str) and '-' not in v for v in value):
+            return [(parse_time(value[0]), parse_time(value[1]))]
+        ranges = []
+        for item in value:
+            ranges.extend(day_ranges(item))
+        return ranges
+    raise ValueError(f'Invalid opening hours {value!r}')
+
+
+def merge(ranges):
+    merged = []
+    for opens, closes in sorted(ranges):
+        if merged and opens <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], closes))
+        else:
+            merged.append((opens, closes))
+    return merged
+
+
+def parse_opening_hours(raw):
+    """Merged (opens, closes) minute ranges per weekday, Monday first"""
+    raw = raw or {}
+    if not isinstance(raw, dict):
+        raise ValueError('Opening hours must be an object keyed by weekday')
+    by_day = {}
+    for key, value in raw.items():
+        day = str(key).strip().lower()
+        if day not in WEEKDAYS:
+            raise ValueError(f'Unknown weekday {key!r}')
+        by_day[day] = value
+
+    days = [[] for _ in WEEKDAYS]
+    for index, day in enumerate(WEEKDAYS):
+        for opens, closes in day_ranges(by_day.get(day)):
+            if closes > opens:
+                days[index].append((opens, closes))
+            elif closes < opens:
+                days[index].append((opens, MINUTES_PER_DAY))
+                if closes:
+                    days[(index + 1) % 7].append((0, closes))
+    return [merge(ranges) for ranges in days]
+
+
+def normalise_opening_hours(apps, schema_editor):
+    Clinic = apps.get_model('health_linkr_app', 'Clinic')
+    ClinicOpeningWindow = apps.get_model('health_linkr_app', 'ClinicOpeningWindow')
+    windows = []
+    for clinic in Clinic.objects.all():
+        try:
+            days = parse_opening_hours(clinic.opening_hours)
+        except ValueError as e:
+            # Store it as closed so the clinic's pages still render; the log keeps the old value
+            logger.warning('Clinic %s had unparseable opening hours %r (%s); storing them as closed',
+                           clinic.pk, clinic.opening_hours, e)
+            days = [[] for _ in WEEKDAYS]
+        clinic.opening_hours = {
+            day: [[format_time(opens), format_time(closes)] for opens, closes in ranges]
+            for day, ranges in zip(WEEKDAYS, days)
+        }
+        clinic.save(update_fields=['opening_hours'])
+        windows.extend(
+            ClinicOpeningWindow(clinic=clinic, weekday=weekday, opens=opens, closes=closes)
+            for weekday, ranges in enumerate(days)
+            for opens, closes in ranges
+        )
+    ClinicOpeningWindow.objects.bulk_create(windows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_linkr_app', '0015_user_agent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='clinic',
+            name='opening_hours',
+            field=models.JSONField(default=dict, help_text='Format: {"monday": [["09:00", "17:00"]], ...}; "9:00-17:00" and {"open": "09:00", "close": "17:00"} are accepted and normalised on save'),
+        ),
+        migrations.CreateModel(
+            name='ClinicOpeningWindow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(help_text='0 is Monday')),
+                ('opens', models.PositiveSmallIntegerField(help_text='Minutes after midnight')),
+                ('closes', models.PositiveSmallIntegerField(help_text='Minutes after midnight')),
+                ('clinic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='opening_windows', to='health_linkr_app.clinic')),
+            ],
+            options={
+                'ordering': ['clinic', 'weekday', 'opens'],
+                'indexes': [models.Index(fields=['weekday', 'opens', 'closes'], name='health_link_weekday_fbcf64_idx')],
+            },
+        ),
+        migrations.RunPython(normalise_opening_hours, migrations.RunPython.noop),
+    ]
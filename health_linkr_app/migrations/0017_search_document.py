@@ -0,0 +1,110 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:50
+
+import re
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+# (index name, model, SQL column expression); PostgreSQL only
+GIN_INDEXES = [
+    ('search_document_vector_gin', 'SearchDocument', '"vector"'),
+    ('search_document_body_trgm', 'SearchDocument', '"body" gin_trgm_ops'),
+    ('patient_full_name_trgm', 'PatientProfile', '"full_name" gin_trgm_ops'),
+    ('patient_phone_trgm', 'PatientProfile', '"phone" gin_trgm_ops'),
+]
+
+
+def create_gin_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, model_name, column in GIN_INDEXES:
+        table = apps.get_model('health_linkr_app', model_name)._meta.db_table
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {schema_editor.quote_name(table)} USING gin ({column})'
+        )
+
+
+def drop_gin_indexes(apps, schema_editor):
+    # pg_trgm is left installed; other schemas may use it
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in GIN_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+# Frozen copy of the document builders in health_linkr_app.search at the time of this migration
+_TOKEN = re.compile(r'[^\W_]+')
+
+
+def _body(*parts):
+    return ' '.join(' '.join(_TOKEN.findall(str(part).lower())) for part in parts if part)
+
+
+def _clinic_document(clinic):
+    return clinic.pk, clinic.name, _body(clinic.name, *(clinic.specialties or []), clinic.address), clinic.is_active
+
+
+def _doctor_document(doctor):
+    user = doctor.user
+    name = f'{user.first_name} {user.last_name}'.strip() or user.username
+    return (doctor.clinic_id, f'Dr. {name}',
+            _body(name, user.username, doctor.specialty, doctor.qualification), doctor.is_active)
+
+
+def _service_document(service):
+    return service.clinic_id, service.name, _body(service.name, service.description), service.is_active
+
+
+SOURCES = [
+    ('clinic', 'Clinic', (), _clinic_document),
+    ('doctor', 'DoctorProfile', ('user',), _doctor_document),
+    ('service', 'Service', (), _service_document),
+]
+
+
+def build_search_index(apps, schema_editor):
+    SearchDocument = apps.get_model('health_linkr_app', 'SearchDocument')
+    for kind, model_name, related, build in SOURCES:
+        objects = apps.get_model('health_linkr_app', model_name).objects.select_related(*related).order_by('pk')
+        documents = []
+        for obj in objects.iterator(chunk_size=500):
+            clinic_id, title, body, is_active = build(obj)
+            documents.append(SearchDocument(
+                kind=kind, object_id=obj.pk, clinic_id=clinic_id, title=title, body=body, is_active=is_active,
+            ))
+        SearchDocument.objects.bulk_create(documents, batch_size=500)
+    if schema_editor.connection.vendor == 'postgresql':
+        SearchDocument.objects.update(
+            vector=SearchVector('title', weight='A', config='simple') + SearchVector('body', weight='B', config='simple')
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_linkr_app', '0016_clinic_opening_windows'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('clinic', 'Clinic'), ('doctor', 'Doctor'), ('service', 'Service')], max_length=10)),
+                ('object_id', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(help_text='Lowercased searchable text, title included')),
+                ('vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('clinic', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='health_linkr_app.clinic')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_document')],
+            },
+        ),
+        migrations.RunPython(create_gin_indexes, drop_gin_indexes),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copy of the attribute expansion in health_linkr_app.facets at the time of this migration
+FACET_FIELDS = {
+    'facility': 'facilities',
+    'insurance': 'insurance_accepted',
+    'specialty': 'specialties',
+}
+KEY_MAX_LENGTH = 100
+
+
+def clinic_attributes(clinic, ClinicAttribute):
+    attributes = {}
+    for kind, field in FACET_FIELDS.items():
+        for value in getattr(clinic, field) or []:
+            value = ' '.join(str(value).split())
+            key = value.casefold()[:KEY_MAX_LENGTH]
+            if key and (kind, key) not in attributes:
+                attributes[kind, key] = ClinicAttribute(clinic=clinic, kind=kind, key=key, value=value[:KEY_MAX_LENGTH])
+    return list(attributes.values())
+
+
+def fill_clinic_attributes(apps, schema_editor):
+    Clinic = apps.get_model('health_linkr_app', 'Clinic')
+    ClinicAttribute = apps.get_model('health_linkr_app', 'ClinicAttribute')
+    attributes = []
+    for clinic in Clinic.objects.only('facilities', 'insurance_accepted', 'specialties'):
+        attributes.extend(clinic_attributes(clinic, ClinicAttribute))
+    ClinicAttribute.objects.bulk_create(attributes, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_linkr_app', '0017_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClinicAttribute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('facility', 'Facility'), ('insurance', 'Insurance'), ('specialty', 'Specialty')], max_length=10)),
+                ('key', models.CharField(help_text='Case-folded value used for filtering', max_length=100)),
+                ('value', models.CharField(max_length=100)),
+                ('clinic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attributes', to='health_linkr_app.clinic')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'key', 'clinic'], name='health_link_kind_66be90_idx')],
+                'constraints': [models.UniqueConstraint(fields=('clinic', 'kind', 'key'), name='unique_clinic_attribute')],
+            },
+        ),
+        migrations.RunPython(fill_clinic_attributes, migrations.RunPython.noop),
+    ]
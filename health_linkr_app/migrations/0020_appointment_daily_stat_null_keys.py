@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:04
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_rows(apps, schema_editor):
+    """Fold counter rows that only the old, NULL-distinct constraint let through into one"""
+    Stat = apps.get_model('health_linkr_app', 'AppointmentDailyStat')
+    keys = ('date', 'clinic_id', 'doctor_id', 'service_id', 'status')
+    duplicates = Stat.objects.values(*keys).annotate(
+        rows=Count('id'), total=Sum('count'), keep=Min('id')
+    ).filter(rows__gt=1).order_by()
+    for row in duplicates:
+        lookup = {key: row[key] for key in keys}
+        Stat.objects.filter(**lookup).exclude(pk=row['keep']).delete()
+        Stat.objects.filter(pk=row['keep']).update(count=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_linkr_app', '0019_clinic_coordinates'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_rows, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='appointmentdailystat',
+            name='unique_appointment_daily_stat',
+        ),
+        migrations.AddConstraint(
+            model_name='appointmentdailystat',
+            constraint=models.UniqueConstraint(models.F('date'), django.db.models.functions.comparison.Coalesce('clinic', models.Value(0)), models.F('doctor'), django.db.models.functions.comparison.Coalesce('service', models.Value(0)), models.F('status'), name='unique_appointment_daily_stat'),
+        ),
+    ]
@@ -1,6 +1,14 @@
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser, Group, Permission
+from django.contrib.postgres.search import SearchVectorField
 from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .opening_hours import OpeningHours, compile_opening_hours
+from .storage import digest_from_name
 
 class Role(models.Model):
     ADMIN = 'ADMIN'
@@ -66,6 +74,16 @@ class User(AbstractUser):
     def __str__(self):
         return f"{self.get_full_name()} ({self.email})"
 
+    def get_profile_photo_url(self, size=128):
+        """URL of a resized profile photo variant, falling back to the original"""
+        if not self.profile_photo:
+            return ''
+        digest = digest_from_name(self.profile_photo.name)
+        if digest:
+            from django.urls import reverse
+            return reverse('profile_photo', args=[digest, size])
+        return self.profile_photo.url
+
 class PatientProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='patient_profile')
     full_name = models.CharField(max_length=150)
@@ -88,7 +106,8 @@ class Clinic(models.Model):
     website = models.URLField(blank=True)
     opening_hours = models.JSONField(
         default=dict,
-        help_text='Format: {"monday": {"open": "09:00", "close": "17:00"}, ...}'
+        help_text='Format: {"monday": [["09:00", "17:00"]], ...}; "9:00-17:00" and '
+                  '{"open": "09:00", "close": "17:00"} are accepted and normalised on save'
     )
     facilities = models.JSONField(
         default=list,
@@ -104,10 +123,38 @@ class Clinic(models.Model):
     )
     emergency_number = models.CharField(max_length=20, blank=True)
     is_active = models.BooleanField(default=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True,
+                                   validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True,
+                                    validators=[MinValueValidator(-180), MaxValueValidator(180)])
     
     def __str__(self):
         return self.name
 
+    def clean(self):
+        try:
+            OpeningHours.parse(self.opening_hours)
+        except ValueError as e:
+            raise ValidationError({'opening_hours': str(e)})
+        if (self.latitude is None) != (self.longitude is None):
+            raise ValidationError('Set both latitude and longitude, or neither.')
+
+    def save(self, *args, **kwargs):
+        self.opening_hours = OpeningHours.parse(self.opening_hours).to_json()
+        self.__dict__.pop('hours', None)
+        super().save(*args, **kwargs)
+
+    @cached_property
+    def hours(self):
+        """Parsed opening hours (see opening_hours.OpeningHours)"""
+        return compile_opening_hours(self.opening_hours)
+
+    def is_open_at(self, when):
+        return self.hours.is_open_at(when)
+
+    def next_open_window(self, after=None):
+        return self.hours.next_open_window(after)
+
     def get_available_doctors(self):
         """Get all active doctors in this clinic"""
         return self.doctors.filter(is_active=True)
@@ -118,19 +165,50 @@ class Clinic(models.Model):
 
     def get_formatted_hours(self):
         """Return opening hours in a formatted way"""
-        days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+        return self.hours.formatted()
 
-        formatted = {}
-        for day in days:
-            raw = self.opening_hours.get(day.capitalize(), "Closed")
+class ClinicOpeningWindow(models.Model):
+    """One opening period of a clinic, kept in sync with Clinic.opening_hours for queries"""
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name='opening_windows')
+    weekday = models.PositiveSmallIntegerField(help_text='0 is Monday')
+    opens = models.PositiveSmallIntegerField(help_text='Minutes after midnight')
+    closes = models.PositiveSmallIntegerField(help_text='Minutes after midnight')
 
-            if isinstance(raw, str) and raw.lower() != 'closed' and '-' in raw:
-                open_time, close_time = raw.split('-', 1)
-                formatted[day] = f"{open_time.strip()} - {close_time.strip()}"
-            else:
-                formatted[day] = "Closed"
+    class Meta:
+        ordering = ['clinic', 'weekday', 'opens']
+        indexes = [
+            models.Index(fields=['weekday', 'opens', 'closes']),
+        ]
+
+    def __str__(self):
+        return f"{self.clinic_id} day {self.weekday}: {self.opens}-{self.closes}"
+
+class ClinicAttribute(models.Model):
+    """One facility, accepted insurer or specialty of a clinic, kept in sync with its JSON lists for filtering"""
+    FACILITY = 'facility'
+    INSURANCE = 'insurance'
+    SPECIALTY = 'specialty'
+    KIND_CHOICES = [
+        (FACILITY, 'Facility'),
+        (INSURANCE, 'Insurance'),
+        (SPECIALTY, 'Specialty'),
+    ]
+
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name='attributes')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    key = models.CharField(max_length=100, help_text='Case-folded value used for filtering')
+    value = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['clinic', 'kind', 'key'], name='unique_clinic_attribute'),
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'key', 'clinic']),
+        ]
 
-        return formatted
+    def __str__(self):
+        return f"{self.clinic_id} {self.kind}: {self.value}"
 
 class DoctorProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='doctor_profile')
@@ -157,6 +235,36 @@ class Service(models.Model):
     def __str__(self):
         return f"{self.name} at {self.clinic.name} ({self.duration_minutes} mins, ${self.fee})"
 
+class SearchDocument(models.Model):
+    """Precomputed search text of a clinic, doctor or service, maintained by search.py"""
+    CLINIC = 'clinic'
+    DOCTOR = 'doctor'
+    SERVICE = 'service'
+    KIND_CHOICES = [
+        (CLINIC, 'Clinic'),
+        (DOCTOR, 'Doctor'),
+        (SERVICE, 'Service'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    clinic = models.ForeignKey(Clinic, on_delete=models.SET_NULL, null=True, related_name='+')
+    title = models.CharField(max_length=255)
+    body = models.TextField(help_text='Lowercased searchable text, title included')
+    # Filled on PostgreSQL only; other databases search an in-memory index instead
+    vector = SearchVectorField(null=True, editable=False)
+    is_active = models.BooleanField(default=True)
+    # Set on every write; with the row count it tells processes their in-memory index is stale
+    updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_document'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.title}"
+
 class ScheduleSlot(models.Model):
     doctor = models.ForeignKey(DoctorProfile, on_delete=models.CASCADE, related_name='schedule_slots')
     start_time = models.DateTimeField()
@@ -195,6 +303,8 @@ class Appointment(models.Model):
     service = models.ForeignKey(Service, on_delete=models.SET_NULL, null=True, related_name='appointments')
     datetime = models.DateTimeField()
     slot = models.ForeignKey(ScheduleSlot, on_delete=models.SET_NULL, null=True, related_name='appointment')
+    slots = models.ManyToManyField(ScheduleSlot, blank=True, related_name='covering_appointments',
+                                   help_text='Every slot the appointment occupies, starting with slot')
     notes = models.TextField(blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -211,12 +321,97 @@ class Appointment(models.Model):
     def __str__(self):
         return f"[{self.status}] {self.patient.full_name} with {self.doctor} on {self.datetime.strftime('%B %d, %Y at %I:%M %p')}"
 
+    # Slots freed by the save that cancelled this appointment
+    freed_slots = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.status if 'status' in field_names else None
+        return instance
+
     def save(self, *args, **kwargs):
-        if self.status == self.CANCELLED and self.slot:
-            # Free up the slot if appointment is cancelled
-            self.slot.is_booked = False
-            self.slot.save()
+        # Free the slots only when the appointment becomes cancelled; they may
+        # belong to someone else by the time a cancelled appointment is saved again
+        cancelling = (
+            self.status == self.CANCELLED
+            and not self._state.adding
+            and getattr(self, '_loaded_status', None) != self.CANCELLED
+        )
         super().save(*args, **kwargs)
+        if cancelling:
+            from .allocation import release
+
+            self.freed_slots = release(self)
+        self._loaded_status = self.status
+
+class WaitlistEntry(models.Model):
+    """A patient's interest in a doctor's slots within a time window"""
+    ACTIVE = 'ACTIVE'
+    OFFERED = 'OFFERED'
+    FULFILLED = 'FULFILLED'
+    CANCELLED = 'CANCELLED'
+
+    STATUS_CHOICES = [
+        (ACTIVE, 'Waiting'),
+        (OFFERED, 'Slot offered'),
+        (FULFILLED, 'Fulfilled'),
+        (CANCELLED, 'Cancelled'),
+    ]
+
+    patient = models.ForeignKey(PatientProfile, on_delete=models.CASCADE, related_name='waitlist_entries')
+    doctor = models.ForeignKey(DoctorProfile, on_delete=models.CASCADE, related_name='waitlist_entries')
+    service = models.ForeignKey(Service, on_delete=models.SET_NULL, null=True, blank=True, related_name='waitlist_entries')
+    window_start = models.DateTimeField()
+    window_end = models.DateTimeField()
+    priority = models.PositiveSmallIntegerField(default=0, help_text='Higher priority entries are offered slots first')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=ACTIVE)
+    offered_slot = models.ForeignKey(ScheduleSlot, on_delete=models.SET_NULL, null=True, blank=True, related_name='waitlist_offers')
+    offered_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-priority', 'created_at']
+        indexes = [
+            models.Index(fields=['doctor', 'status', 'window_start']),
+            models.Index(fields=['patient', 'status']),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(window_end__gt=models.F('window_start')),
+                name='valid_waitlist_window'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.patient.full_name} waiting for {self.doctor} ({self.status})"
+
+class AppointmentDailyStat(models.Model):
+    """Per-day appointment counts, maintained incrementally from status transitions"""
+    date = models.DateField()
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, null=True, related_name='appointment_stats')
+    doctor = models.ForeignKey(DoctorProfile, on_delete=models.CASCADE, related_name='appointment_stats')
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, null=True, related_name='appointment_stats')
+    status = models.CharField(max_length=20, choices=Appointment.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date']
+        constraints = [
+            # clinic and service are nullable and NULLs never conflict, so they are compared coalesced
+            models.UniqueConstraint(
+                models.F('date'), Coalesce('clinic', models.Value(0)), models.F('doctor'),
+                Coalesce('service', models.Value(0)), models.F('status'),
+                name='unique_appointment_daily_stat'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['date', 'status']),
+            models.Index(fields=['clinic', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.status}: {self.count}"
 
 class Notification(models.Model):
     NOTIFICATION_TYPES = [
@@ -236,12 +431,41 @@ class Notification(models.Model):
     def __str__(self):
         return f"{self.type} notification for {self.user.username}"
 
+class UserAgent(models.Model):
+    """A distinct user-agent string, parsed once and shared by every session that sent it"""
+    DEVICE_TYPES = [
+        ('desktop', 'Desktop'),
+        ('mobile', 'Mobile'),
+        ('tablet', 'Tablet'),
+        ('bot', 'Bot'),
+        ('other', 'Other'),
+    ]
+
+    digest = models.CharField(max_length=64, unique=True)
+    raw = models.TextField()
+    browser = models.CharField(max_length=50, blank=True)
+    browser_version = models.CharField(max_length=20, blank=True)
+    os = models.CharField(max_length=50, blank=True)
+    device_type = models.CharField(max_length=10, choices=DEVICE_TYPES, default='other')
+    first_seen = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['device_type', 'browser']),
+            models.Index(fields=['os']),
+        ]
+
+    def __str__(self):
+        browser = f"{self.browser} {self.browser_version}".strip() or 'Unknown browser'
+        return f"{browser} on {self.os or 'unknown OS'} ({self.device_type})"
+
 class SessionLog(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='session_logs')
     login_time = models.DateTimeField(auto_now_add=True)
     logout_time = models.DateTimeField(null=True, blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)  # Made nullable for flexibility
-    user_agent = models.TextField(blank=True)
+    user_agent = models.ForeignKey(UserAgent, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='session_logs')
     session_id = models.CharField(max_length=100, blank=True)
     is_expired = models.BooleanField(default=False)
 
@@ -272,4 +496,21 @@ class AuditTrail(models.Model):
     ip_address = models.GenericIPAddressField(null=True)
 
     def __str__(self):
-        return f"{self.user.username} - {self.action} - {self.timestamp}"
\ No newline at end of file
+        return f"{self.user.username} - {self.action} - {self.timestamp}"
+
+class MediaBlob(models.Model):
+    """Content-addressed media file and the number of rows referencing it"""
+    name = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
@@ -0,0 +1,110 @@
+import logging
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fnmatch import fnmatch
+from functools import wraps
+
+from django.conf import settings
+from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor
+
+logger = logging.getLogger(__name__)
+
+_scope = ContextVar('nplusone_scope', default=None)
+
+
+class NPlusOneError(Exception):
+    """Raised when the same relation is lazily loaded repeatedly within one request"""
+
+
+def _project_frames():
+    """Stack frames from project code, innermost last, skipping this module"""
+    base = str(settings.BASE_DIR)
+    return [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(base) and frame.filename != __file__
+    ]
+
+
+class Scope:
+    """Counts lazy foreign key loads per relation for one request or block"""
+
+    def __init__(self, mode=None, threshold=None, allowlist=None):
+        self.mode = mode or getattr(settings, 'NPLUSONE_MODE', 'off')
+        self.threshold = threshold or getattr(settings, 'NPLUSONE_THRESHOLD', 2)
+        self.allowlist = getattr(settings, 'NPLUSONE_ALLOWLIST', ()) if allowlist is None else allowlist
+        self.loads = Counter()
+        self.reported = set()
+        self.suppressed = 0
+
+    def allowed(self, relation):
+        return any(fnmatch(relation, pattern) for pattern in self.allowlist)
+
+    def lazy_load(self, field):
+        relation = f'{field.model._meta.label}.{field.name}'
+        if self.suppressed or relation in self.reported or self.allowed(relation):
+            return
+        self.loads[relation] += 1
+        if self.loads[relation] < self.threshold:
+            return
+        self.reported.add(relation)
+        frames = _project_frames()
+        origin = f'{frames[-1].filename}:{frames[-1].lineno} in {frames[-1].name}' if frames else 'unknown'
+        message = (f'{relation} lazily loaded {self.loads[relation]} times in one request ({origin}); '
+                   f'use select_related or allowlist it in NPLUSONE_ALLOWLIST')
+        if self.mode == 'raise':
+            raise NPlusOneError(message)
+        logger.warning('%s\n%s', message, ''.join(traceback.format_list(frames)))
+
+
+def _detecting(get_object):
+    @wraps(get_object)
+    def wrapper(self, instance):
+        scope = _scope.get()
+        if scope is not None:
+            scope.lazy_load(self.field)
+        return get_object(self, instance)
+    wrapper._nplusone = True
+    return wrapper
+
+
+def install():
+    """Observe lazy forward foreign key and one-to-one loads; idempotent"""
+    if not getattr(ForwardManyToOneDescriptor.get_object, '_nplusone', False):
+        ForwardManyToOneDescriptor.get_object = _detecting(ForwardManyToOneDescriptor.get_object)
+
+
+@contextmanager
+def detect(**options):
+    """Watch a block (a request, a test, a command) for repeated lazy loads"""
+    install()
+    token = _scope.set(Scope(**options))
+    try:
+        yield _scope.get()
+    finally:
+        _scope.reset(token)
+
+
+@contextmanager
+def _suppressed():
+    scope = _scope.get()
+    if scope is not None:
+        scope.suppressed += 1
+    try:
+        yield
+    finally:
+        if scope is not None:
+            scope.suppressed -= 1
+
+
+def allow_lazy_loads(func=None):
+    """Context manager or decorator for code that lazily loads relations on purpose"""
+    if func is None:
+        return _suppressed()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with _suppressed():
+            return func(*args, **kwargs)
+    return wrapper
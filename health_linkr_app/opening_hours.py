@@ -0,0 +1,218 @@
+import json
+import re
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+
+from django.utils import timezone
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+MINUTES_PER_DAY = 24 * 60
+
+_TIME = re.compile(r'^\s*(\d{1,2})(?:[:.](\d{2}))?\s*$')
+_CLOSED = {'', 'closed', 'none', '-'}
+
+
+def parse_time(value):
+    """Minutes after midnight for "8:30", "08:30" or "24:00"."""
+    match = _TIME.match(value)
+    if not match:
+        raise ValueError(f'Invalid time {value!r}')
+    hours, minutes = int(match.group(1)), int(match.group(2) or 0)
+    if minutes > 59 or hours * 60 + minutes > MINUTES_PER_DAY:
+        raise ValueError(f'Invalid time {value!r}')
+    return hours * 60 + minutes
+
+
+def format_time(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def _day_ranges(value):
+    """(open, close) minute pairs for one day in any of the formats clinics have used
+
+    Accepts "8:30-18:00", "08:00-12:00, 13:00-17:00", {"open": .., "close": ..},
+    [["08:00", "17:00"], ...] and "Closed" / "" / None.
+    """
+    if value is None:
+        return []
+    if isinstance(value, dict):
+        opens, closes = value.get('open') or '', value.get('close') or ''
+        if not opens.strip() and not closes.strip():
+            return []
+        return [(parse_time(opens), parse_time(closes))]
+    if isinstance(value, str):
+        if value.strip().lower() in _CLOSED:
+            return []
+        ranges = []
+        for part in value.split(','):
+            opens, sep, closes = part.partition('-')
+            if not sep:
+                raise ValueError(f'Invalid opening hours {value!r}')
+            ranges.append((parse_time(opens), parse_time(closes)))
+        return ranges
+    if isinstance(value, (list, tuple)):
+        # A single ["08:00", "17:00"] pair, or a list of ranges in any of the forms above
+        if len(value) == 2 and all(isinstance(v, str) and '-' not in v for v in value):
+            return [(parse_time(value[0]), parse_time(value[1]))]
+        ranges = []
+        for item in value:
+            ranges.extend(_day_ranges(item))
+        return ranges
+    raise ValueError(f'Invalid opening hours {value!r}')
+
+
+def _merge(ranges):
+    merged = []
+    for opens, closes in sorted(ranges):
+        if merged and opens <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], closes))
+        else:
+            merged.append((opens, closes))
+    return tuple(merged)
+
+
+class OpeningHours:
+    """Weekly opening hours as sorted, non-overlapping minute ranges per weekday
+
+    Ranges that run past midnight (22:00-02:00) are split across the two
+    days, so each day's ranges lie within 0..1440 and lookups are a bisect.
+    """
+
+    def __init__(self, days):
+        self.days = tuple(_merge(ranges) for ranges in days)
+        self._starts = tuple(tuple(opens for opens, _ in ranges) for ranges in self.days)
+
+    @classmethod
+    def parse(cls, raw):
+        """Parse any stored opening-hours JSON; raises ValueError when it is malformed"""
+        raw = raw or {}
+        if not isinstance(raw, dict):
+            raise ValueError('Opening hours must be an object keyed by weekday')
+        by_day = {}
+        for key, value in raw.items():
+            day = str(key).strip().lower()
+            if day not in WEEKDAYS:
+                raise ValueError(f'Unknown weekday {key!r}')
+            by_day[day] = value
+
+        days = [[] for _ in WEEKDAYS]
+        for index, day in enumerate(WEEKDAYS):
+            for opens, closes in _day_ranges(by_day.get(day)):
+                if closes > opens:
+                    days[index].append((opens, closes))
+                elif closes < opens:
+                    days[index].append((opens, MINUTES_PER_DAY))
+                    if closes:
+                        days[(index + 1) % 7].append((0, closes))
+        return cls(days)
+
+    def to_json(self):
+        """The normalised form stored on Clinic.opening_hours"""
+        return {
+            day: [[format_time(opens), format_time(closes)] for opens, closes in ranges]
+            for day, ranges in zip(WEEKDAYS, self.days)
+        }
+
+    def formatted(self):
+        """{"monday": "08:00 - 17:00", ...} with "Closed" for closed days"""
+        return {
+            day: ', '.join(f'{format_time(opens)} - {format_time(closes)}' for opens, closes in ranges) or 'Closed'
+            for day, ranges in zip(WEEKDAYS, self.days)
+        }
+
+    def is_open_at(self, when):
+        local = timezone.localtime(when) if timezone.is_aware(when) else when
+        weekday = local.weekday()
+        minute = local.hour * 60 + local.minute
+        index = bisect_right(self._starts[weekday], minute) - 1
+        return index >= 0 and minute < self.days[weekday][index][1]
+
+    def windows(self, start, end):
+        """Yield (opens, closes) aware datetimes of open periods overlapping [start, end)"""
+        local_start = timezone.localtime(start)
+        day = local_start.date()
+        tz = timezone.get_current_timezone()
+        while True:
+            midnight = timezone.make_aware(datetime.combine(day, time.min), tz)
+            if midnight >= end:
+                return
+            for opens, closes in self.days[day.weekday()]:
+                window_start = midnight + timedelta(minutes=opens)
+                window_end = midnight + timedelta(minutes=closes)
+                if window_end > start and window_start < end:
+                    yield max(window_start, start), min(window_end, end)
+            day += timedelta(days=1)
+
+    def next_open_window(self, after=None):
+        """The first (opens, closes) period open at or after ``after``, or None when never open
+
+        When already open, the window starts at ``after``. Windows that
+        continue over midnight are joined.
+        """
+        after = after or timezone.now()
+        if not any(self.days):
+            return None
+        window = next(self.windows(after, after + timedelta(days=8)), None)
+        if window is None:
+            return None
+        opens, closes = window
+        for next_opens, next_closes in self.windows(closes, closes + timedelta(days=8)):
+            if next_opens != closes:
+                break
+            closes = next_closes
+        return opens, closes
+
+    def slot_times(self, start, end, minutes):
+        """Yield (start, end) of back-to-back slots of ``minutes`` that fit inside open periods"""
+        step = timedelta(minutes=minutes)
+        for opens, closes in self.windows(start, end):
+            slot_start = opens
+            while slot_start + step <= closes:
+                yield slot_start, slot_start + step
+                slot_start += step
+
+    def __bool__(self):
+        return any(self.days)
+
+    def __eq__(self, other):
+        return isinstance(other, OpeningHours) and self.days == other.days
+
+    def __repr__(self):
+        return f'OpeningHours({self.to_json()!r})'
+
+
+@lru_cache(maxsize=256)
+def _compiled(serialized):
+    return OpeningHours.parse(json.loads(serialized))
+
+
+def compile_opening_hours(raw):
+    """Parsed opening hours, shared by every clinic with the same stored value"""
+    return _compiled(json.dumps(raw or {}, sort_keys=True))
+
+
+def sync_opening_windows(clinic):
+    """Rewrite the clinic's ClinicOpeningWindow rows from its opening hours"""
+    from .models import ClinicOpeningWindow
+
+    ClinicOpeningWindow.objects.filter(clinic=clinic).delete()
+    ClinicOpeningWindow.objects.bulk_create([
+        ClinicOpeningWindow(clinic=clinic, weekday=weekday, opens=opens, closes=closes)
+        for weekday, ranges in enumerate(clinic.hours.days)
+        for opens, closes in ranges
+    ])
+
+
+def clinics_open_at(when, queryset=None):
+    """Clinics open at ``when``, answered from the opening-window side table"""
+    from .models import Clinic
+
+    local = timezone.localtime(when)
+    minute = local.hour * 60 + local.minute
+    queryset = Clinic.objects.all() if queryset is None else queryset
+    return queryset.filter(
+        opening_windows__weekday=local.weekday(),
+        opening_windows__opens__lte=minute,
+        opening_windows__closes__gt=minute,
+    ).distinct()
@@ -0,0 +1,138 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password, verify_password
+
+logger = logging.getLogger(__name__)
+
+
+class HashingPoolBusy(Exception):
+    """Raised when the password hashing queue is full"""
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 with the work factor taken from settings
+
+    Keeps the stock algorithm name, so existing hashes stay valid and are
+    rehashed on the next successful login whenever the iteration count changes.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_HASH_ITERATIONS', None) or PBKDF2PasswordHasher.iterations
+
+
+class HashingPool:
+    """Bounded thread pool for password hashing with queueing metrics
+
+    PBKDF2 releases the GIL, so hashes run in parallel across cores. At most
+    ``workers`` hashes run at once and at most ``queue_size`` more may wait;
+    beyond that callers get HashingPoolBusy instead of piling onto the CPU.
+    """
+
+    def __init__(self, workers=None, queue_size=64, timeout=5.0):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.workers + queue_size)
+        self._lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'rejected': 0,
+            'in_flight': 0,
+            'max_in_flight': 0,
+            'wait_seconds': 0.0,
+            'run_seconds': 0.0,
+        }
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        return self._executor
+
+    def _count(self, **changes):
+        with self._lock:
+            for key, value in changes.items():
+                self._stats[key] += value
+            self._stats['max_in_flight'] = max(self._stats['max_in_flight'], self._stats['in_flight'])
+
+    def run(self, func, *args):
+        """Run func(*args) on the pool and wait for its result"""
+        if not self._slots.acquire(timeout=self.timeout):
+            self._count(rejected=1)
+            logger.warning('Password hashing queue full, request rejected: %s', self.metrics())
+            raise HashingPoolBusy('Too many password hashing requests are queued')
+        queued_at = time.perf_counter()
+        self._count(submitted=1, in_flight=1)
+
+        def task():
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self._count(wait_seconds=started - queued_at, run_seconds=time.perf_counter() - started)
+
+        try:
+            return self._get_executor().submit(task).result()
+        finally:
+            self._count(completed=1, in_flight=-1)
+            self._slots.release()
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        completed = stats['completed'] or 1
+        stats['avg_wait_ms'] = stats['wait_seconds'] * 1000 / completed
+        stats['avg_run_ms'] = stats['run_seconds'] * 1000 / completed
+        stats['workers'] = self.workers
+        stats['queue_size'] = self.queue_size
+        return stats
+
+
+hashing_pool = HashingPool(
+    workers=getattr(settings, 'PASSWORD_HASH_WORKERS', None),
+    queue_size=getattr(settings, 'PASSWORD_HASH_QUEUE_SIZE', 64),
+    timeout=getattr(settings, 'PASSWORD_HASH_QUEUE_TIMEOUT', 5.0),
+)
+
+
+def hash_password(raw_password):
+    """make_password() on the hashing pool"""
+    return hashing_pool.run(make_password, raw_password)
+
+
+class PooledModelBackend(ModelBackend):
+    """ModelBackend that verifies passwords on the hashing pool
+
+    Hashes whose work factor is out of date are upgraded after a successful
+    login, with the new hash also computed on the pool.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hash once anyway to keep the timing of unknown users similar
+            hash_password(password)
+            return
+        is_correct, must_update = hashing_pool.run(verify_password, password, user.password)
+        if not is_correct or not self.user_can_authenticate(user):
+            return
+        if must_update:
+            user.password = hash_password(password)
+            user.save(update_fields=['password'])
+        return user
@@ -0,0 +1,256 @@
+import hashlib
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Upper bounds of the histogram buckets; the last bucket counts everything above
+MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+TIMINGS = {'wall_ms': MS_BUCKETS, 'db_ms': MS_BUCKETS, 'template_ms': MS_BUCKETS, 'queries': QUERY_BUCKETS}
+
+# Duplicate fingerprints kept per view
+MAX_DUPLICATES = 20
+
+INDEX_KEY = 'request-profile:views'
+LOCK_KEY = 'request-profile:lock'
+
+_current = ContextVar('request_profile', default=None)
+_pending = {}
+_pending_lock = threading.Lock()
+_pending_state = {'samples': 0, 'since': time.monotonic()}
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r'\bIN \((?:[^()]*)\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+def _cache():
+    return caches[getattr(settings, 'PROFILING_CACHE_ALIAS', 'default')]
+
+
+def _view_key(name):
+    return f'request-profile:view:{name}'
+
+
+def fingerprint(sql):
+    """Normalise a statement so executions differing only in parameters compare equal"""
+    sql = _LITERALS.sub('?', sql)
+    sql = _IN_LISTS.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class RequestProfile:
+    """Measurements collected while one sampled request is served"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.queries = 0
+        self.statements = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._template_depth = 0
+
+    def query_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+            key = fingerprint(sql)
+            self.statements[key] = self.statements.get(key, 0) + 1
+
+    def duplicates(self):
+        return {sql: count for sql, count in self.statements.items() if count > 1}
+
+    def sample(self):
+        return {
+            'wall_ms': (time.perf_counter() - self.started) * 1000,
+            'db_ms': self.db_seconds * 1000,
+            'template_ms': self.template_seconds * 1000,
+            'queries': self.queries,
+        }
+
+
+def begin():
+    profile = RequestProfile()
+    return profile, _current.set(profile)
+
+
+def end(token):
+    _current.reset(token)
+
+
+def note_cache(hits=0, misses=0):
+    """Count cache lookups against the request being profiled, if any"""
+    profile = _current.get()
+    if profile is not None:
+        profile.cache_hits += hits
+        profile.cache_misses += misses
+
+
+def _timed_render(render):
+    def wrapper(self, *args, **kwargs):
+        profile = _current.get()
+        if profile is None:
+            return render(self, *args, **kwargs)
+        profile._template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            profile._template_depth -= 1
+            # Templates rendered from inside another render are already counted
+            if not profile._template_depth:
+                profile.template_seconds += time.perf_counter() - started
+    wrapper._profiled = True
+    return wrapper
+
+
+def instrument_templates():
+    """Time Django template rendering; does nothing outside a profiled request"""
+    from django.template.backends.django import Template
+
+    if not getattr(Template.render, '_profiled', False):
+        Template.render = _timed_render(Template.render)
+
+
+def _empty_stats():
+    stats = {'count': 0, 'cache_hits': 0, 'cache_misses': 0, 'duplicates': {}}
+    for name, buckets in TIMINGS.items():
+        stats[name] = {'sum': 0, 'max': 0, 'hist': [0] * (len(buckets) + 1)}
+    return stats
+
+
+def _add_sample(stats, sample, profile):
+    stats['count'] += 1
+    for name, buckets in TIMINGS.items():
+        value = sample[name]
+        timing = stats[name]
+        timing['sum'] += value
+        timing['max'] = max(timing['max'], value)
+        timing['hist'][bisect_left(buckets, value)] += 1
+    stats['cache_hits'] += profile.cache_hits
+    stats['cache_misses'] += profile.cache_misses
+    for sql, count in profile.duplicates().items():
+        key = hashlib.md5(sql.encode()).hexdigest()[:12]
+        entry = stats['duplicates'].setdefault(key, {'sql': sql[:500], 'requests': 0, 'executions': 0})
+        entry['requests'] += 1
+        entry['executions'] += count
+
+
+def _merge(stats, other):
+    stats['count'] += other['count']
+    stats['cache_hits'] += other['cache_hits']
+    stats['cache_misses'] += other['cache_misses']
+    for name in TIMINGS:
+        timing, incoming = stats[name], other[name]
+        timing['sum'] += incoming['sum']
+        timing['max'] = max(timing['max'], incoming['max'])
+        timing['hist'] = [a + b for a, b in zip(timing['hist'], incoming['hist'])]
+    for key, entry in other['duplicates'].items():
+        mine = stats['duplicates'].setdefault(key, {'sql': entry['sql'], 'requests': 0, 'executions': 0})
+        mine['requests'] += entry['requests']
+        mine['executions'] += entry['executions']
+    worst = sorted(stats['duplicates'].items(), key=lambda item: -item[1]['executions'])
+    stats['duplicates'] = dict(worst[:MAX_DUPLICATES])
+    return stats
+
+
+def record(view_name, profile):
+    """Add a finished request to this process's buffer, flushing it to the cache now and then"""
+    sample = profile.sample()
+    with _pending_lock:
+        _add_sample(_pending.setdefault(view_name, _empty_stats()), sample, profile)
+        _pending_state['samples'] += 1
+        due = (
+            _pending_state['samples'] >= getattr(settings, 'PROFILING_FLUSH_EVERY', 20)
+            or time.monotonic() - _pending_state['since'] >= getattr(settings, 'PROFILING_FLUSH_SECONDS', 10)
+        )
+    if due:
+        flush()
+    return sample
+
+
+def flush():
+    """Merge buffered samples into the shared aggregates; keeps them buffered if another process holds the lock"""
+    cache = _cache()
+    if not cache.add(LOCK_KEY, 1, 5):
+        return False
+    try:
+        with _pending_lock:
+            pending = dict(_pending)
+            _pending.clear()
+            _pending_state.update(samples=0, since=time.monotonic())
+        if not pending:
+            return True
+        names = set(cache.get(INDEX_KEY, ())) | set(pending)
+        stored = cache.get_many([_view_key(name) for name in pending])
+        updates = {
+            _view_key(name): _merge(stored.get(_view_key(name)) or _empty_stats(), stats)
+            for name, stats in pending.items()
+        }
+        updates[INDEX_KEY] = sorted(names)
+        cache.set_many(updates, None)
+    finally:
+        cache.delete(LOCK_KEY)
+    return True
+
+
+def _percentile(hist, buckets, fraction):
+    total = sum(hist)
+    if not total:
+        return 0
+    seen = 0
+    for index, count in enumerate(hist):
+        seen += count
+        if seen >= total * fraction:
+            return buckets[index] if index < len(buckets) else None
+    return None
+
+
+def summarize(stats):
+    """Aggregates for one view with means and bucket-bound percentiles added"""
+    count = stats['count']
+    summary = {'count': count, 'cache_hits': stats['cache_hits'], 'cache_misses': stats['cache_misses']}
+    for name, buckets in TIMINGS.items():
+        timing = stats[name]
+        summary[name] = {
+            'mean': round(timing['sum'] / count, 2) if count else 0,
+            'max': round(timing['max'], 2),
+            'p50': _percentile(timing['hist'], buckets, 0.5),
+            'p95': _percentile(timing['hist'], buckets, 0.95),
+            'p99': _percentile(timing['hist'], buckets, 0.99),
+            'buckets': list(buckets),
+            'hist': timing['hist'],
+        }
+    summary['duplicates'] = sorted(stats['duplicates'].values(), key=lambda entry: -entry['executions'])
+    return summary
+
+
+def report():
+    """Aggregated profile of every view, including this process's unflushed samples"""
+    flush()
+    cache = _cache()
+    names = cache.get(INDEX_KEY, ())
+    stored = cache.get_many([_view_key(name) for name in names])
+    return {
+        name: summarize(stored[_view_key(name)])
+        for name in names if _view_key(name) in stored
+    }
+
+
+def reset():
+    cache = _cache()
+    names = cache.get(INDEX_KEY, ())
+    cache.delete_many([_view_key(name) for name in names] + [INDEX_KEY])
+    with _pending_lock:
+        _pending.clear()
+        _pending_state.update(samples=0, since=time.monotonic())
@@ -0,0 +1,321 @@
+import copy
+import heapq
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .caching import invalidate_appointments, invalidate_slots
+from .allocation import SlotAllocationError, iter_runs, service_duration
+from .models import Appointment, DoctorProfile, Notification, ScheduleSlot
+from .stats import record_changes
+
+# A cost no real assignment reaches, used for "cannot be assigned"
+UNASSIGNABLE = 10 ** 9
+
+# Above this many n*n*m steps the Hungarian solver gets slow in Python
+HUNGARIAN_MAX_WORK = 20_000_000
+
+
+@dataclass
+class Move:
+    appointment: Appointment
+    run: list
+    cost: float
+
+    @property
+    def doctor(self):
+        return self.run[0].doctor
+
+    @property
+    def start_time(self):
+        return self.run[0].start_time
+
+
+@dataclass
+class ReschedulePlan:
+    doctor: DoctorProfile
+    start: datetime
+    end: datetime
+    moves: list = field(default_factory=list)
+    unassigned: list = field(default_factory=list)
+    solver: str = ''
+
+
+def absence_bounds(start_date, end_date):
+    """Aware datetimes covering whole days from start_date to end_date inclusive"""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(start_date, time.min), tz)
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def affected_appointments(doctor, start, end):
+    return list(
+        Appointment.objects.filter(
+            doctor=doctor,
+            status__in=[Appointment.PENDING, Appointment.CONFIRMED],
+            datetime__gte=max(start, timezone.now()),
+            datetime__lt=end
+        ).select_related('patient__user', 'doctor__user', 'service', 'slot').prefetch_related('slots')
+        .order_by('datetime')
+    )
+
+
+def candidate_doctors(doctor, include_colleagues=True):
+    """The absent doctor plus active same-specialty colleagues at the same clinic"""
+    match = Q(pk=doctor.pk)
+    if include_colleagues:
+        match |= Q(clinic_id=doctor.clinic_id, specialty=doctor.specialty, is_active=True)
+    return list(DoctorProfile.objects.filter(match).select_related('user'))
+
+
+def hungarian(cost):
+    """Minimum-cost assignment of rows to columns (rows <= columns)
+
+    Returns the column assigned to each row. O(n^2 * m) for n rows and m columns.
+    """
+    n, m = len(cost), len(cost[0])
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [float('inf')] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            row = cost[i0 - 1]
+            delta = float('inf')
+            j1 = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = row[j - 1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    assignment = [None] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            assignment[p[j] - 1] = j - 1
+    return assignment
+
+
+class BulkRescheduler:
+    """Move a doctor's appointments out of an absence window
+
+    Each affected appointment may move to a later run of the same doctor's
+    slots (after the absence) or to a same-specialty colleague at the same
+    clinic who offers the service. The cost of a move is how far it shifts the
+    appointment in hours, plus a penalty for changing doctor.
+    """
+
+    def __init__(self, doctor, start, end, include_colleagues=True, horizon_days=14,
+                 colleague_penalty_hours=4, max_candidates=25):
+        self.doctor = doctor
+        self.start = start
+        self.end = end
+        self.include_colleagues = include_colleagues
+        self.horizon = end + timedelta(days=horizon_days)
+        self.colleague_penalty = colleague_penalty_hours
+        self.max_candidates = max_candidates
+        self._runs = {}
+        self._service_doctors = {}
+
+    def _free_slots(self, doctor):
+        slots = ScheduleSlot.objects.filter(
+            doctor=doctor,
+            is_booked=False,
+            is_available=True,
+            start_time__gt=timezone.now(),
+            start_time__lt=self.horizon
+        ).select_related('doctor__user').order_by('start_time')
+        if doctor.pk == self.doctor.pk:
+            # The absent doctor can only take appointments after returning
+            slots = slots.filter(start_time__gte=self.end)
+        return list(slots)
+
+    def _runs_for(self, doctor, duration):
+        key = (doctor.pk, duration)
+        if key not in self._runs:
+            if doctor.pk not in self._runs:
+                self._runs[doctor.pk] = self._free_slots(doctor)
+            self._runs[key] = list(iter_runs(self._runs[doctor.pk], duration))
+        return self._runs[key]
+
+    def _candidates(self, appointment, doctors):
+        """The cheapest (cost, run) options for one appointment"""
+        duration = service_duration(appointment.service, appointment.slot)
+        service_doctors = None
+        if appointment.service_id:
+            if appointment.service_id not in self._service_doctors:
+                self._service_doctors[appointment.service_id] = set(
+                    appointment.service.doctors.values_list('pk', flat=True)
+                )
+            service_doctors = self._service_doctors[appointment.service_id]
+        options = []
+        for doctor in doctors:
+            if doctor.pk != self.doctor.pk and service_doctors is not None and doctor.pk not in service_doctors:
+                continue
+            penalty = 0 if doctor.pk == self.doctor.pk else self.colleague_penalty
+            for run in self._runs_for(doctor, duration):
+                shift = abs((run[0].start_time - appointment.datetime).total_seconds()) / 3600
+                options.append((shift + penalty, run))
+        return heapq.nsmallest(self.max_candidates, options, key=lambda option: option[0])
+
+    def plan(self):
+        appointments = affected_appointments(self.doctor, self.start, self.end)
+        result = ReschedulePlan(self.doctor, self.start, self.end)
+        if not appointments:
+            return result
+        doctors = candidate_doctors(self.doctor, self.include_colleagues)
+        candidates = [self._candidates(appointment, doctors) for appointment in appointments]
+
+        columns = {}
+        for options in candidates:
+            for _, run in options:
+                columns.setdefault(tuple(slot.pk for slot in run), run)
+        runs = list(columns.values())
+        index = {key: i for i, key in enumerate(columns)}
+
+        n, m = len(appointments), len(runs) + len(appointments)
+        if n * n * m <= HUNGARIAN_MAX_WORK:
+            result.solver = 'hungarian'
+            # One dummy column per appointment lets any of them go unassigned
+            matrix = [[UNASSIGNABLE] * m for _ in appointments]
+            for row, options in zip(matrix, candidates):
+                for cost, run in options:
+                    row[index[tuple(slot.pk for slot in run)]] = cost
+            chosen = [
+                (appointment, runs[j], matrix[i][j])
+                for i, (appointment, j) in enumerate(zip(appointments, hungarian(matrix)))
+                if j < len(runs) and matrix[i][j] < UNASSIGNABLE
+            ]
+        else:
+            result.solver = 'greedy'
+            chosen = sorted(
+                ((appointment, run, cost) for appointment, options in zip(appointments, candidates)
+                 for cost, run in options),
+                key=lambda choice: choice[2]
+            )
+
+        # Runs of different lengths can share slots; keep the cheapest claim on each slot
+        used_slots = set()
+        assigned = set()
+        for appointment, run, cost in sorted(chosen, key=lambda choice: choice[2]):
+            slot_ids = {slot.pk for slot in run}
+            if appointment.pk in assigned or slot_ids & used_slots:
+                continue
+            used_slots |= slot_ids
+            assigned.add(appointment.pk)
+            result.moves.append(Move(appointment, run, cost))
+        result.moves.sort(key=lambda move: move.appointment.datetime)
+        result.unassigned = [appointment for appointment in appointments if appointment.pk not in assigned]
+        return result
+
+
+def apply_plan(plan):
+    """Apply a reschedule plan atomically with batched slot, appointment and notification writes"""
+    now = timezone.now()
+    with transaction.atomic():
+        moves = plan.moves
+        old_slot_ids = set()
+        for move in moves:
+            old_slot_ids.add(move.appointment.slot_id)
+            old_slot_ids.update(slot.pk for slot in move.appointment.slots.all())
+        old_slot_ids.discard(None)
+        ScheduleSlot.objects.filter(pk__in=old_slot_ids).update(is_booked=False)
+
+        # The doctor is out, so nothing else may be booked into the absence
+        ScheduleSlot.objects.filter(
+            doctor=plan.doctor, start_time__gte=plan.start, start_time__lt=plan.end
+        ).update(is_available=False)
+
+        new_slot_ids = [slot.pk for move in moves for slot in move.run]
+        claimed = ScheduleSlot.objects.filter(
+            pk__in=new_slot_ids, is_booked=False, is_available=True
+        ).update(is_booked=True)
+        if claimed != len(new_slot_ids):
+            raise SlotAllocationError('Some of the planned slots were booked meanwhile; please plan again.')
+
+        changes = []
+        notifications = []
+        for move in moves:
+            appointment = move.appointment
+            old = copy.copy(appointment)
+            appointment.doctor = move.doctor
+            appointment.slot = move.run[0]
+            appointment.datetime = move.start_time
+            appointment.updated_at = now
+            changes.append((old, appointment))
+
+            when = appointment.datetime.strftime("%B %d, %Y at %I:%M %p")
+            doctor_name = appointment.doctor.user.get_full_name()
+            notifications.append(Notification(
+                user=appointment.patient.user,
+                type='IN_APP',
+                title='Appointment Rescheduled',
+                message=f'Dr. {old.doctor.user.get_full_name()} is unavailable, so your appointment has been '
+                        f'moved to {when} with Dr. {doctor_name}.'
+            ))
+            notifications.append(Notification(
+                user=appointment.doctor.user,
+                type='IN_APP',
+                title='Appointment Rescheduled' if old.doctor_id == appointment.doctor_id else 'Appointment Reassigned',
+                message=f'Appointment with {appointment.patient.full_name} is now scheduled for {when}.'
+            ))
+
+        Appointment.objects.bulk_update([move.appointment for move in moves],
+                                        ['doctor', 'slot', 'datetime', 'updated_at'], batch_size=500)
+        Through = Appointment.slots.through
+        Through.objects.filter(appointment_id__in=[move.appointment.pk for move in moves]).delete()
+        Through.objects.bulk_create([
+            Through(appointment_id=move.appointment.pk, scheduleslot_id=slot.pk)
+            for move in moves for slot in move.run
+        ], batch_size=1000)
+        record_changes(changes)
+        Notification.objects.bulk_create(notifications, batch_size=500)
+
+        invalidate_slots({plan.doctor.pk} | {move.doctor.pk for move in moves})
+        invalidate_appointments(
+            (move.appointment.patient_id, doctor_id)
+            for move, (old, _) in zip(moves, changes)
+            for doctor_id in (old.doctor_id, move.doctor.pk)
+        )
+    return len(moves)
+
+
+def reschedule_absence(doctor, start_date, end_date, apply=False, **options):
+    """Plan (and optionally apply) moving a doctor's appointments out of an absence"""
+    start, end = absence_bounds(start_date, end_date)
+    if not apply:
+        return BulkRescheduler(doctor, start, end, **options).plan()
+    with transaction.atomic():
+        # Lock the affected slots so the plan cannot go stale before it is applied
+        list(ScheduleSlot.objects.select_for_update().filter(
+            doctor=doctor, start_time__gte=start, start_time__lt=end
+        ).values_list('pk'))
+        plan = BulkRescheduler(doctor, start, end, **options).plan()
+        apply_plan(plan)
+    return plan
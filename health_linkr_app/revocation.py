@@ -0,0 +1,85 @@
+from importlib import import_module
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from .models import SessionLog
+
+
+def session_store():
+    return import_module(settings.SESSION_ENGINE).SessionStore
+
+
+def _revocation_cache():
+    return caches[settings.SESSION_CACHE_ALIAS]
+
+
+def _revoked_key(log_id):
+    return f'session-revoked:{log_id}'
+
+
+def revocation_ttl():
+    """How long a revocation is remembered: sessions idle for longer have expired anyway"""
+    return getattr(settings, 'SESSION_IDLE_SECONDS', 1800) + getattr(settings, 'SESSION_REVOCATION_GRACE', 300)
+
+
+def mark_revoked(log_ids):
+    """Add session logs to the revocation list consulted by SessionExpiryMiddleware"""
+    if log_ids:
+        _revocation_cache().set_many({_revoked_key(log_id): 1 for log_id in log_ids}, revocation_ttl())
+
+
+def is_revoked(log_id):
+    return _revocation_cache().get(_revoked_key(log_id)) is not None
+
+
+def active_logs(users=None, clinics=None, ip_addresses=None):
+    """Open session logs, narrowed by users, the doctors of clinics, or client IPs"""
+    logs = SessionLog.objects.filter(logout_time__isnull=True)
+    if users is not None:
+        logs = logs.filter(user__in=users)
+    if clinics is not None:
+        logs = logs.filter(user__doctor_profile__clinic__in=clinics)
+    if ip_addresses is not None:
+        logs = logs.filter(ip_address__in=ip_addresses)
+    return logs
+
+
+def delete_sessions(session_keys):
+    """Remove sessions from the session engine's database table and cache"""
+    session_keys = [key for key in session_keys if key]
+    if not session_keys:
+        return
+    store = session_store()
+    if hasattr(store, 'get_model_class'):
+        # No signals or relations on sessions, so this is a single DELETE
+        store.get_model_class().objects.filter(session_key__in=session_keys).delete()
+    prefix = getattr(store, 'cache_key_prefix', None)
+    if prefix:
+        caches[settings.SESSION_CACHE_ALIAS].delete_many([prefix + key for key in session_keys])
+
+
+def revoke_sessions(logs):
+    """Log out every session behind a queryset of session logs
+
+    One DELETE on the sessions table (plus a cache delete_many for cached
+    engines) and one UPDATE on SessionLog, however many sessions are
+    revoked. Sessions that cannot be deleted server-side (signed cookies)
+    are caught by the revocation list. Returns the number of sessions revoked.
+    """
+    rows = list(logs.filter(logout_time__isnull=True).values_list('pk', 'session_id'))
+    if not rows:
+        return 0
+    with transaction.atomic():
+        delete_sessions([session_id for _, session_id in rows])
+        log_ids = [pk for pk, _ in rows]
+        SessionLog.objects.filter(pk__in=log_ids).update(is_expired=True, logout_time=timezone.now())
+        transaction.on_commit(lambda: mark_revoked(log_ids))
+    return len(rows)
+
+
+def revoke(users=None, clinics=None, ip_addresses=None):
+    """Revoke the open sessions of users, the doctors of clinics, or client IPs"""
+    return revoke_sessions(active_logs(users=users, clinics=clinics, ip_addresses=ip_addresses))
@@ -0,0 +1,62 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+# Models that must always be read from the primary
+PRIMARY_ONLY_APPS = {'sessions'}
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != 'default']
+
+
+def use_replica(enabled=True):
+    """Switch replica reads on or off for the current context; returns a token for restore()"""
+    return _replica_reads.set(enabled)
+
+
+def restore(token):
+    _replica_reads.reset(token)
+
+
+@contextmanager
+def read_from_replica(enabled=True):
+    """Route reads inside the block to a replica, when one is configured
+
+    read_from_replica(False) pins the block to the primary instead.
+    """
+    token = use_replica(enabled)
+    try:
+        yield
+    finally:
+        restore(token)
+
+
+def replica_reads(view):
+    """Mark a view (function or class) as safe to serve from a replica"""
+    view.replica_reads = True
+    return view
+
+
+class ReplicaRouter:
+    """Send writes to the primary and reads to a replica inside read_from_replica()"""
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return 'default'
+        replicas = replica_aliases()
+        return random.choice(replicas) if replicas else 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
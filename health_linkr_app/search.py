@@ -0,0 +1,265 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.apps import apps as django_apps
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connections, transaction
+from django.db.models import Count, F, Max, Q
+
+_TOKEN = re.compile(r'[^\W_]+')
+
+# setweight(title, 'A') || setweight(body, 'B'); body repeats the title so trigram matching sees it too
+VECTOR = (
+    SearchVector('title', weight='A', config='simple')
+    + SearchVector('body', weight='B', config='simple')
+)
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+def _body(*parts):
+    return ' '.join(' '.join(tokenize(str(part))) for part in parts if part)
+
+
+def _clinic_document(clinic):
+    return {
+        'clinic_id': clinic.pk,
+        'title': clinic.name,
+        'body': _body(clinic.name, *(clinic.specialties or []), clinic.address),
+        'is_active': clinic.is_active,
+    }
+
+
+def _doctor_document(doctor):
+    user = doctor.user
+    name = f'{user.first_name} {user.last_name}'.strip() or user.username
+    return {
+        'clinic_id': doctor.clinic_id,
+        'title': f'Dr. {name}',
+        'body': _body(name, user.username, doctor.specialty, doctor.qualification),
+        'is_active': doctor.is_active,
+    }
+
+
+def _service_document(service):
+    return {
+        'clinic_id': service.clinic_id,
+        'title': service.name,
+        'body': _body(service.name, service.description),
+        'is_active': service.is_active,
+    }
+
+
+# kind -> (model name, select_related, document builder)
+_SOURCES = {
+    'clinic': ('Clinic', (), _clinic_document),
+    'doctor': ('DoctorProfile', ('user',), _doctor_document),
+    'service': ('Service', (), _service_document),
+}
+
+
+def _is_postgresql(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def _write_documents(kind, objects, Document):
+    build = _SOURCES[kind][2]
+    documents = [Document(kind=kind, object_id=obj.pk, **build(obj)) for obj in objects]
+    if not documents:
+        return set()
+    Document.objects.bulk_create(
+        documents, batch_size=500, update_conflicts=True,
+        unique_fields=['kind', 'object_id'], update_fields=['clinic', 'title', 'body', 'is_active', 'updated'],
+    )
+    object_ids = {document.object_id for document in documents}
+    written = Document.objects.filter(kind=kind, object_id__in=object_ids)
+    if _is_postgresql(written):
+        written.update(vector=VECTOR)
+    return object_ids
+
+
+def reindex(kind, object_ids):
+    """Refresh the search documents of some clinics, doctors or services
+
+    Objects that no longer exist lose their document. The in-memory index
+    of every process rebuilds on its next search, since the change moves the
+    documents' version (see _documents_version).
+    """
+    from .models import SearchDocument
+
+    object_ids = set(object_ids)
+    if not object_ids:
+        return
+    model_name, related, _ = _SOURCES[kind]
+    objects = django_apps.get_model('health_linkr_app', model_name).objects.select_related(*related)
+    written = _write_documents(kind, objects.filter(pk__in=object_ids), SearchDocument)
+    if object_ids - written:
+        SearchDocument.objects.filter(kind=kind, object_id__in=object_ids - written).delete()
+
+
+def rebuild_index(chunk_size=500):
+    """Recreate every search document"""
+    from .models import SearchDocument
+
+    with transaction.atomic():
+        SearchDocument.objects.all().delete()
+        for kind, (model_name, related, _) in _SOURCES.items():
+            objects = django_apps.get_model('health_linkr_app', model_name).objects.select_related(*related).order_by('pk')
+            last_pk = 0
+            while True:
+                chunk = list(objects.filter(pk__gt=last_pk)[:chunk_size])
+                if not chunk:
+                    break
+                _write_documents(kind, chunk, SearchDocument)
+                last_pk = chunk[-1].pk
+    return SearchDocument.objects.count()
+
+
+@dataclass
+class SearchHit:
+    kind: str
+    object_id: int
+    clinic_id: int
+    title: str
+    rank: float = 0.0
+
+
+class InvertedIndex:
+    """Token postings over search documents, for databases without full-text search
+
+    Each query word matches index terms it is a prefix of; a document must
+    match every word. Words found in the title rank higher.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.documents = {}
+        self.postings = defaultdict(set)
+        self._terms = None
+
+    def add(self, document):
+        key = (document.kind, document.object_id)
+        self.remove(key)
+        tokens = set(tokenize(document.body))
+        hit = SearchHit(document.kind, document.object_id, document.clinic_id, document.title)
+        self.documents[key] = (hit, document.is_active, tokens, set(tokenize(document.title)))
+        for token in tokens:
+            self.postings[token].add(key)
+        self._terms = None
+
+    def remove(self, key):
+        entry = self.documents.pop(key, None)
+        if entry is None:
+            return
+        for token in entry[2]:
+            self.postings[token].discard(key)
+            if not self.postings[token]:
+                del self.postings[token]
+        self._terms = None
+
+    def _matching(self, prefix):
+        if self._terms is None:
+            self._terms = sorted(self.postings)
+        keys = set()
+        index = bisect_left(self._terms, prefix)
+        while index < len(self._terms) and self._terms[index].startswith(prefix):
+            keys |= self.postings[self._terms[index]]
+            index += 1
+        return keys
+
+    def search(self, words, kinds=None, clinic_ids=None, active_only=True):
+        keys = None
+        for word in words:
+            keys = self._matching(word) if keys is None else keys & self._matching(word)
+            if not keys:
+                return []
+        hits = []
+        for key in keys:
+            hit, is_active, _, title_tokens = self.documents[key]
+            if (active_only and not is_active) or (kinds and hit.kind not in kinds):
+                continue
+            if clinic_ids is not None and hit.clinic_id not in clinic_ids:
+                continue
+            rank = sum(2 if any(token.startswith(word) for token in title_tokens) else 1 for word in words)
+            hits.append(SearchHit(hit.kind, hit.object_id, hit.clinic_id, hit.title, float(rank)))
+        hits.sort(key=lambda hit: (-hit.rank, hit.title))
+        return hits
+
+
+def _documents_version(documents):
+    """A value that changes whenever a document is written or deleted
+
+    Read from the database rather than a cache, so it is shared by every
+    process even when the default cache is process-local: every write sets
+    ``updated``, and a delete lowers the count.
+    """
+    version = documents.aggregate(count=Count('pk'), updated=Max('updated'))
+    return version['count'], version['updated']
+
+
+def _memory_search(documents, words, **filters):
+    global _index
+    version = _documents_version(documents)
+    with _index_lock:
+        if _index is None or _index.version != version:
+            index = InvertedIndex(version)
+            for document in documents.only('kind', 'object_id', 'clinic_id', 'title', 'body', 'is_active').iterator():
+                index.add(document)
+            _index = index
+        return _index.search(words, **filters)
+
+
+def _database_search(documents, words, kinds=None, clinic_ids=None, active_only=True, limit=None):
+    # Every word as a prefix, so results appear while a name is still being typed
+    query = SearchQuery(' & '.join(f'{word}:*' for word in words), search_type='raw', config='simple')
+    text = ' '.join(words)
+    documents = documents.filter(Q(vector=query) | Q(body__trigram_word_similar=text))
+    if active_only:
+        documents = documents.filter(is_active=True)
+    if kinds:
+        documents = documents.filter(kind__in=kinds)
+    if clinic_ids is not None:
+        documents = documents.filter(clinic_id__in=clinic_ids)
+    documents = documents.annotate(
+        rank=SearchRank(F('vector'), query) + TrigramWordSimilarity(text, 'body')
+    ).order_by('-rank', 'title')
+    if limit:
+        documents = documents[:limit]
+    return [
+        SearchHit(kind, object_id, clinic_id, title, rank)
+        for kind, object_id, clinic_id, title, rank in documents.values_list(
+            'kind', 'object_id', 'clinic_id', 'title', 'rank'
+        )
+    ]
+
+
+def search_documents(query, kinds=None, clinic_ids=None, active_only=True, limit=20):
+    """Clinics, doctors and services matching every word of ``query``, best first
+
+    PostgreSQL matches the tsvector (words as prefixes) or, for misspellings,
+    the trigram index; other databases use the in-memory inverted index.
+    """
+    from .models import SearchDocument
+
+    words = tokenize(query)
+    if not words:
+        return []
+    documents = SearchDocument.objects.all()
+    filters = {'kinds': kinds, 'clinic_ids': clinic_ids, 'active_only': active_only}
+    if _is_postgresql(documents):
+        return _database_search(documents, words, limit=limit, **filters)
+    hits = _memory_search(documents, words, **filters)
+    return hits[:limit] if limit else hits
+
+
+def search_ids(query, kind):
+    """Ids of every matching object of one kind, inactive ones included (for the admin)"""
+    return [hit.object_id for hit in search_documents(query, kinds=[kind], active_only=False, limit=None)]
@@ -0,0 +1,174 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .caching import CATALOG_TAG, clinic_tag, doctor_tag, invalidate_tags, patient_tag
+from .facets import FACET_FIELDS, sync_clinic_attributes
+from .geo import LOCATIONS_TAG
+from .images import schedule_variants
+from .models import Appointment, Clinic, DoctorProfile, ScheduleSlot, SearchDocument, Service, User, UserAgent
+from .opening_hours import sync_opening_windows
+from .search import reindex
+from .stats import move_doctor_stats
+from .storage import digest_from_name, release, retain
+from .telemetry import forget_user_agent
+
+
+@receiver(pre_save, sender=User)
+def remember_profile_photo(sender, instance, update_fields=None, **kwargs):
+    """Remember the stored photo name so post_save can adjust reference counts"""
+    if update_fields is not None and 'profile_photo' not in update_fields:
+        instance._previous_profile_photo = None
+        return
+    previous = None
+    if instance.pk:
+        previous = User.objects.filter(pk=instance.pk).values_list('profile_photo', flat=True).first()
+    instance._previous_profile_photo = previous or ''
+
+
+@receiver(post_save, sender=User)
+def count_profile_photo_references(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_profile_photo', None)
+    if previous is None:
+        return
+    current = instance.profile_photo.name or ''
+    if previous != current:
+        if previous:
+            release(previous)
+        if current:
+            retain(current)
+            # Whichever form or admin page stored the photo, it gets resized variants
+            digest = digest_from_name(current)
+            if digest:
+                transaction.on_commit(lambda: schedule_variants(digest, current))
+
+
+@receiver(post_delete, sender=User)
+def release_profile_photo(sender, instance, **kwargs):
+    if instance.profile_photo:
+        release(instance.profile_photo.name)
+
+
+@receiver(post_save, sender=Clinic)
+@receiver(post_delete, sender=Clinic)
+def invalidate_clinic(sender, instance, **kwargs):
+    invalidate_tags(clinic_tag(instance.pk), CATALOG_TAG, LOCATIONS_TAG)
+
+
+@receiver(post_save, sender=Clinic)
+def sync_clinic_opening_windows(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and 'opening_hours' not in update_fields):
+        return
+    sync_opening_windows(instance)
+
+
+@receiver(post_save, sender=Clinic)
+def sync_clinic_facets(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and not set(FACET_FIELDS.values()) & set(update_fields)):
+        return
+    sync_clinic_attributes(instance)
+
+
+@receiver(post_save, sender=Clinic)
+@receiver(post_delete, sender=Clinic)
+def index_clinic(sender, instance, raw=False, **kwargs):
+    if not raw:
+        reindex(SearchDocument.CLINIC, [instance.pk])
+
+
+@receiver(post_save, sender=DoctorProfile)
+@receiver(post_delete, sender=DoctorProfile)
+def index_doctor(sender, instance, raw=False, **kwargs):
+    if not raw:
+        reindex(SearchDocument.DOCTOR, [instance.pk])
+
+
+@receiver(post_save, sender=User)
+def index_doctor_name(sender, instance, created=False, update_fields=None, raw=False, **kwargs):
+    """Doctor documents include the user's name; logins only save last_login and are skipped"""
+    if raw or created:
+        return
+    if update_fields is not None and not {'first_name', 'last_name', 'username'} & set(update_fields):
+        return
+    reindex(SearchDocument.DOCTOR, DoctorProfile.objects.filter(user=instance).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def index_service(sender, instance, raw=False, **kwargs):
+    if not raw:
+        reindex(SearchDocument.SERVICE, [instance.pk])
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def invalidate_service(sender, instance, **kwargs):
+    invalidate_tags(clinic_tag(instance.clinic_id), CATALOG_TAG)
+
+
+@receiver(m2m_changed, sender=Service.doctors.through)
+def invalidate_service_doctors(sender, instance, pk_set=None, **kwargs):
+    if kwargs['action'] not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Service):
+        tags = [clinic_tag(instance.clinic_id)] + [doctor_tag(pk) for pk in pk_set or ()]
+    else:
+        tags = [clinic_tag(instance.clinic_id), doctor_tag(instance.pk)]
+    invalidate_tags(CATALOG_TAG, *tags)
+
+
+@receiver(pre_save, sender=DoctorProfile)
+def remember_doctor_clinic(sender, instance, raw=False, **kwargs):
+    """Remember the clinic the doctor is leaving, whose cached page lists them"""
+    instance._previous_clinic_id = None
+    if instance.pk and not raw:
+        instance._previous_clinic_id = (
+            DoctorProfile.objects.filter(pk=instance.pk).values_list('clinic_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=DoctorProfile)
+@receiver(post_delete, sender=DoctorProfile)
+def invalidate_doctor(sender, instance, **kwargs):
+    tags = {clinic_tag(instance.clinic_id), doctor_tag(instance.pk)}
+    previous = getattr(instance, '_previous_clinic_id', None)
+    if previous is not None:
+        tags.add(clinic_tag(previous))
+    invalidate_tags(*tags)
+
+
+@receiver(post_save, sender=DoctorProfile)
+def move_doctor_daily_stats(sender, instance, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_clinic_id', None)
+    if not raw and previous is not None and previous != instance.clinic_id:
+        move_doctor_stats(instance)
+
+
+@receiver(post_save, sender=User)
+def invalidate_doctor_name(sender, instance, created=False, update_fields=None, raw=False, **kwargs):
+    """Clinic and doctor pages render doctor names"""
+    if raw or created:
+        return
+    if update_fields is not None and not {'first_name', 'last_name', 'username'} & set(update_fields):
+        return
+    tags = set()
+    for pk, clinic_id in DoctorProfile.objects.filter(user=instance).values_list('pk', 'clinic_id'):
+        tags.update((clinic_tag(clinic_id), doctor_tag(pk)))
+    invalidate_tags(*tags)
+
+
+@receiver(post_save, sender=ScheduleSlot)
+@receiver(post_delete, sender=ScheduleSlot)
+def invalidate_slot(sender, instance, **kwargs):
+    invalidate_tags(doctor_tag(instance.doctor_id))
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def invalidate_appointment(sender, instance, **kwargs):
+    invalidate_tags(patient_tag(instance.patient_id), doctor_tag(instance.doctor_id))
+
+
+@receiver(post_delete, sender=UserAgent)
+def forget_deleted_user_agent(sender, instance, **kwargs):
+    forget_user_agent(instance.digest)
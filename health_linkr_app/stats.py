@@ -0,0 +1,177 @@
+from collections import Counter
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Appointment, AppointmentDailyStat
+
+STAT_FIELDS = ('clinic_id', 'doctor_id', 'service_id', 'date', 'status')
+
+
+def _stat_key(appointment, status=None, when=None):
+    """Build the rollup key an appointment counts towards"""
+    when = when or appointment.datetime
+    return (
+        appointment.doctor.clinic_id,
+        appointment.doctor_id,
+        appointment.service_id,
+        timezone.localdate(when),
+        status or appointment.status,
+    )
+
+
+def _grouped_counts(queryset):
+    """Yield (key, count) pairs for a queryset grouped by the rollup dimensions"""
+    rows = queryset.annotate(
+        stat_date=TruncDate('datetime')
+    ).values(
+        'doctor__clinic_id', 'doctor_id', 'service_id', 'stat_date', 'status'
+    ).annotate(n=Count('id')).order_by()
+    for row in rows:
+        key = (row['doctor__clinic_id'], row['doctor_id'], row['service_id'], row['stat_date'], row['status'])
+        yield key, row['n']
+
+
+def apply_deltas(deltas):
+    """Apply a {key: delta} mapping to the rollup table"""
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        lookup = dict(zip(STAT_FIELDS, key))
+        with transaction.atomic():
+            updated = AppointmentDailyStat.objects.filter(**lookup).update(count=F('count') + delta)
+            if updated:
+                continue
+            try:
+                with transaction.atomic():
+                    AppointmentDailyStat.objects.create(count=delta, **lookup)
+            except IntegrityError:
+                # Another request created the row first
+                AppointmentDailyStat.objects.filter(**lookup).update(count=F('count') + delta)
+
+
+def record_transition(appointment, old_status, new_status, old_datetime=None):
+    """Record a single appointment moving between statuses (or days)"""
+    deltas = Counter()
+    if old_status:
+        deltas[_stat_key(appointment, old_status, old_datetime)] -= 1
+    if new_status:
+        deltas[_stat_key(appointment, new_status)] += 1
+    apply_deltas(deltas)
+
+
+def record_change(old_obj, new_obj):
+    """Record the difference between two versions of an appointment"""
+    deltas = Counter()
+    if old_obj is not None:
+        deltas[_stat_key(old_obj)] -= 1
+    if new_obj is not None:
+        deltas[_stat_key(new_obj)] += 1
+    apply_deltas(deltas)
+
+
+def record_changes(pairs):
+    """Record many (old_obj, new_obj) appointment changes with one set of deltas"""
+    deltas = Counter()
+    for old_obj, new_obj in pairs:
+        if old_obj is not None:
+            deltas[_stat_key(old_obj)] -= 1
+        if new_obj is not None:
+            deltas[_stat_key(new_obj)] += 1
+    apply_deltas(deltas)
+
+
+def record_queryset_transition(queryset, new_status):
+    """Record a bulk status change; call before the queryset is updated"""
+    deltas = Counter()
+    for key, n in _grouped_counts(queryset.exclude(status=new_status)):
+        deltas[key] -= n
+        deltas[key[:-1] + (new_status,)] += n
+    apply_deltas(deltas)
+
+
+def record_queryset_removal(queryset):
+    """Record a bulk delete; call before the queryset is deleted"""
+    apply_deltas(Counter({key: -n for key, n in _grouped_counts(queryset)}))
+
+
+def move_doctor_stats(doctor):
+    """Re-key a doctor's rollup rows to their current clinic after a move
+
+    Keys use the doctor's clinic at the time of each change, so rows left
+    on the old clinic would never be decremented again.
+    """
+    with transaction.atomic():
+        moved = AppointmentDailyStat.objects.filter(doctor=doctor).exclude(clinic_id=doctor.clinic_id)
+        deltas = Counter()
+        for row in moved.select_for_update():
+            deltas[(doctor.clinic_id, doctor.pk, row.service_id, row.date, row.status)] += row.count
+        moved.delete()
+        apply_deltas(deltas)
+
+
+def _lock_stats_table():
+    """Hold back counter updates until the surrounding transaction ends; reads go on"""
+    connection = connections[router.db_for_write(AppointmentDailyStat)]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {connection.ops.quote_name(AppointmentDailyStat._meta.db_table)} IN EXCLUSIVE MODE')
+    else:
+        # Row locks where the database has them; SQLite serialises writers anyway
+        list(AppointmentDailyStat.objects.select_for_update().values_list('pk', flat=True))
+
+
+def rebuild_daily_stats(chunk_size=5000, stdout=None):
+    """Rebuild the rollup table from appointment history, scanning in primary key chunks
+
+    The table is locked for the whole rebuild, so increments from bookings
+    made meanwhile wait and are applied on top of the rebuilt rows instead
+    of being overwritten.
+    """
+    with transaction.atomic():
+        _lock_stats_table()
+        totals = Counter()
+        last_pk = 0
+        while True:
+            pks = list(
+                Appointment.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+            )
+            if not pks:
+                break
+            chunk = Appointment.objects.filter(pk__gte=pks[0], pk__lte=pks[-1])
+            for key, n in _grouped_counts(chunk):
+                totals[key] += n
+            last_pk = pks[-1]
+            if stdout:
+                stdout.write(f'Scanned appointments up to id {last_pk}')
+
+        AppointmentDailyStat.objects.all().delete()
+        AppointmentDailyStat.objects.bulk_create(
+            [AppointmentDailyStat(count=n, **dict(zip(STAT_FIELDS, key))) for key, n in totals.items() if n],
+            batch_size=chunk_size
+        )
+    return len(totals)
+
+
+def daily_counts(start=None, end=None, **filters):
+    """Appointment counts per day and status, read from the rollup table"""
+    stats = AppointmentDailyStat.objects.filter(**filters).exclude(count=0)
+    if start:
+        stats = stats.filter(date__gte=start)
+    if end:
+        stats = stats.filter(date__lte=end)
+    return stats.values('date', 'status').annotate(total=Sum('count')).order_by('date', 'status')
+
+
+def period_totals(periods, **filters):
+    """Counts per status for each (label, first day, last day) period, from one rollup query"""
+    totals = {label: dict.fromkeys((status for status, _ in Appointment.STATUS_CHOICES), 0) for label, _, _ in periods}
+    start = min(first for _, first, _ in periods)
+    end = max(last for _, _, last in periods)
+    for row in daily_counts(start, end, **filters):
+        for label, first, last in periods:
+            if first <= row['date'] <= last:
+                totals[label][row['status']] += row['total']
+    return totals
@@ -0,0 +1,117 @@
+import os
+
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .images import content_hash
+
+CAS_PREFIX = 'cas'
+
+
+def blob_name(digest, ext=''):
+    """Sharded storage name for a content hash, e.g. cas/ab/cd/abcd...jpg"""
+    return f'{CAS_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+
+def digest_from_name(name):
+    """Return the content hash embedded in a content-addressed name, or None"""
+    if not name or not name.startswith(CAS_PREFIX + '/'):
+        return None
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage that stores each distinct file content exactly once
+
+    Files are named by their SHA-256, so saving identical content returns the
+    existing name instead of writing a suffixed copy.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save. FileSystemStorage
+        # asks again for a blob name only when another save created it first;
+        # the name cannot change, so end its retry loop instead of spinning
+        if digest_from_name(name):
+            raise FileExistsError(name)
+        return name
+
+    def _save(self, name, content):
+        digest = content_hash(content)
+        ext = os.path.splitext(name)[1].lower()
+        name = blob_name(digest, ext)
+        if self.exists(name):
+            return name
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            # An identical upload won the race; same digest, same bytes
+            return name
+
+
+def retain(name):
+    """Increment the reference count of a stored file"""
+    from .models import MediaBlob
+
+    digest = digest_from_name(name)
+    if not digest:
+        return
+    with transaction.atomic():
+        # The row lock makes a concurrent first reference wait and then increment
+        blob, created = MediaBlob.objects.select_for_update().get_or_create(name=name, defaults={
+            'digest': digest,
+            'size': _size(name),
+            'ref_count': 1,
+        })
+        if not created:
+            MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+
+
+def release(name):
+    """Decrement the reference count of a stored file; orphans are removed by gc_media"""
+    from .models import MediaBlob
+
+    if not digest_from_name(name):
+        return
+    MediaBlob.objects.filter(name=name, ref_count__gt=0).update(
+        ref_count=F('ref_count') - 1, updated_at=timezone.now()
+    )
+
+
+def _size(name):
+    try:
+        return default_storage.size(name)
+    except OSError:
+        return 0
+
+
+def _walk_blobs(directory=CAS_PREFIX):
+    directories, files = default_storage.listdir(directory)
+    for filename in files:
+        yield f'{directory}/{filename}'
+    for sub in directories:
+        yield from _walk_blobs(f'{directory}/{sub}')
+
+
+def recount_references():
+    """Recompute reference counts from User.profile_photo and register untracked files"""
+    from .models import MediaBlob, User
+
+    counts = dict(
+        User.objects.filter(profile_photo__startswith=CAS_PREFIX + '/')
+        .values_list('profile_photo').annotate(n=Count('id')).order_by()
+    )
+    now = timezone.now()
+    with transaction.atomic():
+        MediaBlob.objects.exclude(name__in=list(counts)).exclude(ref_count=0).update(ref_count=0, updated_at=now)
+        known = set(MediaBlob.objects.values_list('name', flat=True))
+        for name, n in counts.items():
+            MediaBlob.objects.filter(name=name).exclude(ref_count=n).update(ref_count=n, updated_at=now)
+        missing = set(counts) - known
+        if default_storage.exists(CAS_PREFIX):
+            missing.update(name for name in _walk_blobs() if name not in known)
+        MediaBlob.objects.bulk_create([
+            MediaBlob(name=name, digest=digest_from_name(name), size=_size(name), ref_count=counts.get(name, 0))
+            for name in missing
+        ])
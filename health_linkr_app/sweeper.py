@@ -0,0 +1,194 @@
+import logging
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import SessionLog
+from .revocation import session_store
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = 'session-sweep:lock'
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+@dataclass
+class SweepResult:
+    closed: int = 0
+    deleted: int = 0
+    chunks: int = 0
+    finished: bool = True
+
+
+def peak_hours():
+    """(start, end) local times from SESSION_SWEEP_PEAK_HOURS ("08:00-18:00"), or None"""
+    value = getattr(settings, 'SESSION_SWEEP_PEAK_HOURS', '')
+    if not value:
+        return None
+    start, end = (datetime.strptime(part.strip(), '%H:%M').time() for part in value.split('-'))
+    return start, end
+
+
+def in_peak_hours(now=None):
+    hours = peak_hours()
+    if hours is None:
+        return False
+    current = timezone.localtime(now).time()
+    start, end = hours
+    if start <= end:
+        return start <= current < end
+    # A window that wraps midnight
+    return current >= start or current < end
+
+
+def _live_session_keys(keys, now):
+    """The subset of session keys whose session still exists"""
+    store = session_store()
+    if hasattr(store, 'get_model_class'):
+        return set(store.get_model_class().objects.filter(
+            session_key__in=keys, expire_date__gte=now
+        ).values_list('session_key', flat=True))
+    prefix = getattr(store, 'cache_key_prefix', None)
+    if prefix:
+        found = caches[settings.SESSION_CACHE_ALIAS].get_many([prefix + key for key in keys])
+        return {key[len(prefix):] for key in found}
+    # Signed cookies cannot be checked server-side
+    return set(keys)
+
+
+class SessionSweeper:
+    """Close SessionLog rows of sessions that ended without a logout, and delete expired sessions
+
+    Work is done in chunks of ``chunk_size`` rows, each in its own short
+    statement, with ``pause`` seconds between chunks so the sweep never holds
+    locks for long. A sweep stops once ``max_seconds`` have passed.
+    """
+
+    def __init__(self, chunk_size=500, pause=0.1, max_seconds=None, now=None):
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.max_seconds = max_seconds
+        self.now = now or timezone.now()
+        self.deadline = time.monotonic() + max_seconds if max_seconds else None
+        self.result = SweepResult()
+
+    def _out_of_time(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.result.finished = False
+            return True
+        return False
+
+    def _throttle(self):
+        self.result.chunks += 1
+        if self.pause:
+            time.sleep(self.pause)
+
+    def close_stale_logs(self):
+        """Close open logs whose session has expired, oldest first
+
+        Only logs older than the session cookie age can have expired, so the
+        scan walks the (login_time, logout_time) index up to that point.
+        Logs without a server-side session (signed cookies) are closed once
+        they are older than SESSION_LOG_MAX_AGE.
+        """
+        cutoff = self.now - timedelta(seconds=settings.SESSION_COOKIE_AGE)
+        orphan_cutoff = self.now - timedelta(seconds=getattr(settings, 'SESSION_LOG_MAX_AGE', 12 * 60 * 60))
+        logs = SessionLog.objects.filter(login_time__lt=cutoff, logout_time__isnull=True).order_by('login_time', 'pk')
+        after = None
+        while not self._out_of_time():
+            chunk = logs
+            if after is not None:
+                chunk = chunk.filter(Q(login_time__gt=after[0]) | Q(login_time=after[0], pk__gt=after[1]))
+            rows = list(chunk.values_list('pk', 'login_time', 'session_id')[:self.chunk_size])
+            if not rows:
+                break
+            after = rows[-1][1], rows[-1][0]
+            live = _live_session_keys([session_id for _, _, session_id in rows if session_id], self.now)
+            stale = [
+                pk for pk, login_time, session_id in rows
+                if (session_id and session_id not in live) or (not session_id and login_time < orphan_cutoff)
+            ]
+            if stale:
+                self.result.closed += SessionLog.objects.filter(pk__in=stale, logout_time__isnull=True).update(
+                    is_expired=True, logout_time=self.now
+                )
+            self._throttle()
+
+    def delete_expired_sessions(self):
+        """Delete expired database sessions in bounded chunks"""
+        store = session_store()
+        if not hasattr(store, 'get_model_class'):
+            return
+        sessions = store.get_model_class().objects.filter(expire_date__lt=self.now)
+        while not self._out_of_time():
+            keys = list(sessions.values_list('session_key', flat=True)[:self.chunk_size])
+            if not keys:
+                break
+            self.result.deleted += store.get_model_class().objects.filter(
+                session_key__in=keys, expire_date__lt=self.now
+            ).delete()[0]
+            self._throttle()
+
+    def run(self):
+        # Logs first: deleting sessions first would hide which logs they belonged to
+        self.close_stale_logs()
+        self.delete_expired_sessions()
+        return self.result
+
+
+def sweep_sessions(**options):
+    return SessionSweeper(**options).run()
+
+
+def _scheduled_sweep(interval):
+    while True:
+        # Jitter so workers started together do not all contend for the lock
+        time.sleep(interval * random.uniform(0.9, 1.1))
+        try:
+            if in_peak_hours():
+                continue
+            # One sweep per interval across every worker sharing the cache
+            if not caches['default'].add(LOCK_KEY, 1, int(interval)):
+                continue
+            result = sweep_sessions(
+                chunk_size=getattr(settings, 'SESSION_SWEEP_CHUNK_SIZE', 500),
+                pause=getattr(settings, 'SESSION_SWEEP_PAUSE', 0.1),
+                max_seconds=max(interval / 2, 1),
+            )
+            logger.info('Session sweep closed %s logs and deleted %s sessions', result.closed, result.deleted)
+        except Exception:
+            logger.exception('Session sweep failed')
+        finally:
+            connections.close_all()
+
+
+def start_scheduler():
+    """Start the background sweeper thread when SESSION_SWEEP_INTERVAL is set
+
+    Skipped for management commands other than runserver, so migrations and
+    one-off commands do not sweep.
+    """
+    global _scheduler
+    interval = getattr(settings, 'SESSION_SWEEP_INTERVAL', 0)
+    if not interval:
+        return None
+    if sys.argv[0].endswith('manage.py') and sys.argv[1:2] != ['runserver']:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(
+                target=_scheduled_sweep, args=(interval,), name='session-sweeper', daemon=True
+            )
+            _scheduler.start()
+    return _scheduler
@@ -0,0 +1,147 @@
+import hashlib
+import ipaddress
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+# Longer user-agent strings are truncated before they are hashed and stored
+USER_AGENT_MAX_LENGTH = 512
+# How long a digest -> UserAgent id mapping is cached; deletes drop it sooner
+USER_AGENT_CACHE_SECONDS = 24 * 60 * 60
+
+_BOT = re.compile(r'bot|crawl|spider|slurp|curl|wget|python-requests|httpclient|headless', re.IGNORECASE)
+
+# (name, pattern capturing the version), checked in order: most browsers also claim to be Chrome or Safari
+_BROWSERS = (
+    ('Edge', re.compile(r'Edg(?:e|A|iOS)?/(\d+)')),
+    ('Opera', re.compile(r'(?:OPR|Opera)/(\d+)')),
+    ('Samsung Internet', re.compile(r'SamsungBrowser/(\d+)')),
+    ('Firefox', re.compile(r'(?:Firefox|FxiOS)/(\d+)')),
+    ('Chrome', re.compile(r'(?:Chrome|CriOS)/(\d+)')),
+    ('Safari', re.compile(r'Version/(\d+)[\d.]* (?:Mobile/\S+ )?Safari/')),
+    ('Internet Explorer', re.compile(r'(?:MSIE |Trident/.*rv:)(\d+)')),
+)
+
+_OPERATING_SYSTEMS = (
+    ('iOS', re.compile(r'iPhone|iPad|iPod')),
+    ('Android', re.compile(r'Android')),
+    ('ChromeOS', re.compile(r'CrOS')),
+    ('Windows', re.compile(r'Windows')),
+    ('macOS', re.compile(r'Mac OS X|Macintosh')),
+    ('Linux', re.compile(r'Linux')),
+)
+
+
+def parse_user_agent(raw):
+    """Browser, major version, OS and device type of a user-agent string"""
+    browser = version = os_name = ''
+    for name, pattern in _BROWSERS:
+        match = pattern.search(raw)
+        if match:
+            browser, version = name, match.group(1)
+            break
+    for name, pattern in _OPERATING_SYSTEMS:
+        if pattern.search(raw):
+            os_name = name
+            break
+
+    if not raw:
+        device_type = 'other'
+    elif _BOT.search(raw):
+        device_type = 'bot'
+    elif 'iPad' in raw or 'Tablet' in raw or ('Android' in raw and 'Mobile' not in raw):
+        device_type = 'tablet'
+    elif 'Mobi' in raw or 'iPhone' in raw:
+        device_type = 'mobile'
+    elif os_name in ('Windows', 'macOS', 'Linux', 'ChromeOS'):
+        device_type = 'desktop'
+    else:
+        device_type = 'other'
+    return {'browser': browser, 'browser_version': version, 'os': os_name, 'device_type': device_type}
+
+
+def user_agent_digest(raw):
+    return hashlib.sha256(raw.encode('utf-8', 'replace')).hexdigest()
+
+
+def _user_agent_key(digest):
+    return f'user-agent:{digest}'
+
+
+def intern_user_agent(raw):
+    """Id of the UserAgent row for a user-agent string, creating it on first sight
+
+    Ids are cached by digest, so a known agent costs no query. Deleting a
+    UserAgent drops its entry (see signals), which reaches every process
+    only when the default cache is shared.
+    """
+    from .models import UserAgent
+
+    raw = raw[:USER_AGENT_MAX_LENGTH]
+    digest = user_agent_digest(raw)
+    agent_id = cache.get(_user_agent_key(digest))
+    if agent_id is None:
+        agent, _ = UserAgent.objects.get_or_create(
+            digest=digest, defaults={'raw': raw, **parse_user_agent(raw)}
+        )
+        agent_id = agent.pk
+        # Only once the row is committed; a rolled-back insert must not be remembered
+        transaction.on_commit(lambda: cache.set(_user_agent_key(digest), agent_id, USER_AGENT_CACHE_SECONDS))
+    return agent_id
+
+
+def forget_user_agent(digest):
+    cache.delete(_user_agent_key(digest))
+
+
+def request_user_agent_id(request):
+    raw = request.META.get('HTTP_USER_AGENT', '')
+    return intern_user_agent(raw[:USER_AGENT_MAX_LENGTH]) if raw else None
+
+
+@lru_cache(maxsize=8)
+def _networks(proxies):
+    return tuple(ipaddress.ip_network(proxy.strip(), strict=False) for proxy in proxies if proxy.strip())
+
+
+def _ip(value):
+    try:
+        return ipaddress.ip_address(value.strip())
+    except (AttributeError, ValueError):
+        return None
+
+
+def _trusted(ip, networks):
+    return any(ip in network for network in networks)
+
+
+def client_ip(request):
+    """The client's address, following X-Forwarded-For only through TRUSTED_PROXIES
+
+    Hops are read right to left, starting from the peer address, until one
+    is not a trusted proxy; anything further left is client-controlled.
+    """
+    client = _ip(request.META.get('REMOTE_ADDR', ''))
+    networks = _networks(tuple(getattr(settings, 'TRUSTED_PROXIES', ())))
+    if client is None or not networks:
+        return str(client) if client else None
+    hops = request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')
+    for hop in reversed(hops):
+        if not _trusted(client, networks):
+            break
+        ip = _ip(hop)
+        if ip is None:
+            break
+        client = ip
+    return str(client)
+
+
+def device_breakdown(logs):
+    """Session counts per device type, browser and OS for a queryset of session logs"""
+    return logs.values(
+        'user_agent__device_type', 'user_agent__browser', 'user_agent__os'
+    ).annotate(sessions=Count('pk')).order_by('-sessions')
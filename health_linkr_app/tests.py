@@ -1,3 +1,722 @@
-from django.test import TestCase
+import io
+import itertools
+import json
+import math
+import random
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connections, router
+from django.http import HttpResponse, HttpResponseRedirect
+from django.test import RequestFactory, TestCase
+from django.urls import resolve
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .api import RESOURCES, _choose_encoding
+from .allocation import SlotAllocationError, allocate, claim, find_run, release
+from .caching import CacheRegion, clinic_tag, tag_versions
+from .facets import facet_counts, filter_clinics
+from .geo import EARTH_RADIUS_KM, KDTree, chord_to_km, km_to_chord, nearest_clinics_with_slots, to_unit_vector
+from .idempotency import idempotent, mark_completed
+from .importer import DOCTOR, PATIENT, import_file
+from .middleware.replica import PIN_SESSION_KEY, ReplicaRoutingMiddleware
+from .models import (
+    Appointment, AppointmentDailyStat, Clinic, ClinicAttribute, DoctorProfile, PatientProfile, ScheduleSlot, SearchDocument, Service,
+    SessionLog, User, UserAgent,
+)
+from .opening_hours import OpeningHours, clinics_open_at
+from .nplusone import NPlusOneError, allow_lazy_loads, detect
+from .revocation import revoke
+from .rescheduling import apply_plan, hungarian, reschedule_absence
+from .search import reindex, search_ids
+from .routers import read_from_replica, replica_reads
+from .stats import record_transition
+from .storage import ContentAddressedStorage
+from .telemetry import intern_user_agent
+
+
+class ScheduleTestCase(TestCase):
+    """A clinic with one doctor, one patient and eight back-to-back 30-minute slots tomorrow"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinic = Clinic.objects.create(name='Central Clinic', address='1 Main St', contact_number='555-0100')
+        cls.doctor = DoctorProfile.objects.create(
+            user=User.objects.create_user('doctor', 'doctor@example.com', 'secret-pass-1',
+                                          first_name='John', last_name='Smith'),
+            specialty='Cardiology', qualification='MD', clinic=cls.clinic, consultation_fee=50,
+        )
+        cls.patient = PatientProfile.objects.create(
+            user=User.objects.create_user('patient', 'patient@example.com', 'secret-pass-1'),
+            full_name='Pat Patient', birth_date='1990-01-01', gender='M', phone='555-0101',
+        )
+        cls.service = Service.objects.create(name='Consultation', duration_minutes=30, fee=50, clinic=cls.clinic)
+        cls.long_service = Service.objects.create(name='Assessment', duration_minutes=90, fee=120, clinic=cls.clinic)
+        start = (timezone.now() + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+        cls.start = start
+        ScheduleSlot.objects.bulk_create([
+            ScheduleSlot(doctor=cls.doctor, start_time=start + timedelta(minutes=30 * i),
+                         end_time=start + timedelta(minutes=30 * (i + 1)))
+            for i in range(8)
+        ])
+
+    def setUp(self):
+        self.slots = list(ScheduleSlot.objects.filter(doctor=self.doctor).order_by('start_time'))
+
+    def book(self, service, first_slot):
+        appointment = Appointment(patient=self.patient, doctor=self.doctor, service=service)
+        allocate(appointment, find_run(first_slot, timedelta(minutes=service.duration_minutes)))
+        return appointment
+
+    def booked_ids(self):
+        return set(ScheduleSlot.objects.filter(is_booked=True).values_list('pk', flat=True))
+
+
+class ClaimTests(ScheduleTestCase):
+    def test_claims_every_slot_in_the_run(self):
+        run = self.slots[:3]
+        claim(run)
+        self.assertEqual(self.booked_ids(), {slot.pk for slot in run})
+        self.assertTrue(all(slot.is_booked for slot in run))
+
+    def test_contention_claims_nothing(self):
+        # Another booking takes the middle slot after this run was read
+        run = self.slots[:3]
+        ScheduleSlot.objects.filter(pk=run[1].pk).update(is_booked=True)
+        with self.assertRaises(SlotAllocationError):
+            claim(run)
+        self.assertEqual(self.booked_ids(), {run[1].pk})
+        self.assertFalse(run[0].is_booked)
+
+    def test_second_claim_of_the_same_run_fails(self):
+        run = self.slots[2:4]
+        claim(run)
+        with self.assertRaises(SlotAllocationError):
+            claim([ScheduleSlot.objects.get(pk=slot.pk) for slot in run])
+        self.assertEqual(self.booked_ids(), {slot.pk for slot in run})
+
+
+class AllocateTests(ScheduleTestCase):
+    def test_multi_slot_service_occupies_a_run(self):
+        appointment = self.book(self.long_service, self.slots[1])
+        self.assertEqual(appointment.slot, self.slots[1])
+        self.assertEqual(appointment.datetime, self.slots[1].start_time)
+        self.assertEqual(set(appointment.slots.values_list('pk', flat=True)), {slot.pk for slot in self.slots[1:4]})
+        self.assertEqual(self.booked_ids(), {slot.pk for slot in self.slots[1:4]})
+
+    def test_run_broken_by_a_booked_slot_is_not_offered(self):
+        ScheduleSlot.objects.filter(pk=self.slots[2].pk).update(is_booked=True)
+        self.assertIsNone(find_run(self.slots[0], timedelta(minutes=90)))
+        self.assertEqual([slot.pk for slot in find_run(self.slots[3], timedelta(minutes=90))],
+                         [slot.pk for slot in self.slots[3:6]])
+
+
+class ReleaseTests(ScheduleTestCase):
+    def test_release_frees_every_slot_and_detaches_them(self):
+        appointment = self.book(self.long_service, self.slots[0])
+        freed = release(appointment)
+        self.assertEqual({slot.pk for slot in freed}, {slot.pk for slot in self.slots[:3]})
+        self.assertEqual(self.booked_ids(), set())
+        self.assertFalse(appointment.slots.exists())
+
+    def test_cancelling_frees_the_slots_once(self):
+        appointment = self.book(self.long_service, self.slots[0])
+        appointment = Appointment.objects.get(pk=appointment.pk)
+        appointment.status = Appointment.CANCELLED
+        appointment.save()
+        self.assertEqual({slot.pk for slot in appointment.freed_slots}, {slot.pk for slot in self.slots[:3]})
+        self.assertEqual(self.booked_ids(), set())
+
+        # Someone else books the freed time; saving the cancelled appointment again leaves it alone
+        other = self.book(self.service, self.slots[0])
+        appointment.notes = 'Patient called to cancel'
+        appointment.save()
+        Appointment.objects.get(pk=appointment.pk).save()
+        self.assertEqual(self.booked_ids(), {self.slots[0].pk})
+        self.assertEqual(list(other.slots.all()), [self.slots[0]])
+
+    def test_saving_an_active_appointment_keeps_its_slots(self):
+        appointment = self.book(self.long_service, self.slots[0])
+        appointment.status = Appointment.CONFIRMED
+        appointment.save()
+        self.assertEqual(appointment.freed_slots, ())
+        self.assertEqual(self.booked_ids(), {slot.pk for slot in self.slots[:3]})
+
+
+class WaitlistOfferTests(ScheduleTestCase):
+    def test_failed_offer_does_not_fail_the_cancellation(self):
+        appointment = self.book(self.service, self.slots[0])
+        self.client.force_login(self.patient.user)
+        with mock.patch('health_linkr_app.waitlist.offer_freed_slots', side_effect=RuntimeError('boom')), \
+                self.assertLogs('health_linkr_app.waitlist', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/appointment/{appointment.pk}/cancel/', follow=True)
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.status, 'CANCELLED')
+        self.assertEqual([str(m) for m in response.context['messages']], ['Appointment cancelled successfully.'])
+
+
+class ReschedulingTests(ScheduleTestCase):
+    def setUp(self):
+        super().setUp()
+        day_after = self.start + timedelta(days=2)
+        self.later = ScheduleSlot.objects.bulk_create([
+            ScheduleSlot(doctor=self.doctor, start_time=day_after + timedelta(minutes=30 * i),
+                         end_time=day_after + timedelta(minutes=30 * (i + 1)))
+            for i in range(3)
+        ])
+        self.first = self.book(self.service, self.slots[0])
+        self.second = self.book(self.service, self.slots[4])
+
+    def plan(self, **kwargs):
+        day = timezone.localdate(self.start)
+        return reschedule_absence(self.doctor, day, day, **kwargs)
+
+    def test_hungarian_finds_the_cheapest_assignment(self):
+        cost = [[4, 1, 3, 9], [2, 0, 5, 9], [3, 2, 2, 1]]
+        best = min(
+            sum(row[j] for row, j in zip(cost, columns))
+            for columns in itertools.permutations(range(4), 3)
+        )
+        assignment = hungarian(cost)
+        self.assertEqual(len(set(assignment)), 3)
+        self.assertEqual(sum(row[j] for row, j in zip(cost, assignment)), best)
+
+    def test_plan_moves_every_appointment_out_of_the_absence(self):
+        plan = self.plan()
+        self.assertEqual(plan.solver, 'hungarian')
+        self.assertEqual(plan.unassigned, [])
+        slot_ids = [slot.pk for move in plan.moves for slot in move.run]
+        self.assertEqual(len(slot_ids), len(set(slot_ids)))
+        self.assertTrue(all(move.start_time >= self.later[0].start_time for move in plan.moves))
+
+    def test_greedy_fallback_above_the_work_cap(self):
+        with mock.patch('health_linkr_app.rescheduling.HUNGARIAN_MAX_WORK', 0):
+            plan = self.plan()
+        self.assertEqual(plan.solver, 'greedy')
+        self.assertEqual(plan.unassigned, [])
+        slot_ids = [slot.pk for move in plan.moves for slot in move.run]
+        self.assertEqual(len(slot_ids), len(set(slot_ids)))
+
+    def test_appointments_beyond_the_free_slots_stay_unassigned(self):
+        ScheduleSlot.objects.filter(pk=self.later[2].pk).update(is_available=False)
+        self.book(self.service, self.slots[6])
+        plan = self.plan()
+        self.assertEqual((len(plan.moves), len(plan.unassigned)), (2, 1))
+
+    def test_apply_moves_appointments_and_slots(self):
+        plan = self.plan(apply=True)
+        self.assertEqual(len(plan.moves), 2)
+        for move in plan.moves:
+            appointment = Appointment.objects.get(pk=move.appointment.pk)
+            self.assertEqual(appointment.slot_id, move.run[0].pk)
+            self.assertEqual(appointment.datetime, move.start_time)
+            self.assertEqual({slot.pk for slot in appointment.slots.all()}, {slot.pk for slot in move.run})
+        moved_to = {slot.pk for move in plan.moves for slot in move.run}
+        self.assertEqual(self.booked_ids(), moved_to)
+        absent = ScheduleSlot.objects.filter(pk__in=[slot.pk for slot in self.slots])
+        self.assertFalse(absent.filter(is_available=True).exists())
+
+    def test_apply_refuses_a_stale_plan(self):
+        plan = self.plan()
+        ScheduleSlot.objects.filter(pk=plan.moves[0].run[0].pk).update(is_booked=True)
+        with self.assertRaises(SlotAllocationError):
+            apply_plan(plan)
+        self.assertEqual(Appointment.objects.get(pk=self.first.pk).slot_id, self.slots[0].pk)
+
+
+class DoctorInvalidationTests(ScheduleTestCase):
+    def assertBumps(self, tag, change):
+        before = tag_versions([tag])
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertNotEqual(tag_versions([tag]), before)
+
+    def test_moving_a_doctor_invalidates_both_clinics(self):
+        other = Clinic.objects.create(name='North Clinic', address='2 North St', contact_number='555-0102')
+
+        def move():
+            self.doctor.clinic = other
+            self.doctor.save()
+
+        self.assertBumps(clinic_tag(self.clinic.pk), move)
+
+    def test_renaming_a_doctor_invalidates_their_clinic(self):
+        def rename():
+            self.doctor.user.last_name = 'Smythe'
+            self.doctor.user.save()
+
+        self.assertBumps(clinic_tag(self.clinic.pk), rename)
+
+
+class RevocationTests(ScheduleTestCase):
+    def test_revoking_clinics_logs_out_only_their_doctors(self):
+        other = Clinic.objects.create(name='North Clinic', address='2 North St', contact_number='555-0200')
+        colleague = DoctorProfile.objects.create(
+            user=User.objects.create_user('colleague', 'colleague@example.com', 'secret-pass-1'),
+            specialty='Cardiology', qualification='MD', clinic=other, consultation_fee=50,
+        )
+        for user in (self.doctor.user, colleague.user, self.patient.user):
+            SessionLog.objects.create(user=user, session_id=f'session-{user.pk}')
+        revoked = revoke(clinics=Clinic.objects.filter(pk__in=[self.clinic.pk, other.pk]))
+        self.assertEqual(revoked, 2)
+        open_logs = SessionLog.objects.filter(logout_time__isnull=True)
+        self.assertEqual(list(open_logs.values_list('user', flat=True)), [self.patient.user.pk])
+
+
+class DailyStatTests(ScheduleTestCase):
+    def counts(self):
+        return sorted(
+            AppointmentDailyStat.objects.exclude(count=0).values_list('clinic_id', 'status', 'count')
+        )
+
+    def test_moving_a_doctor_moves_their_counts(self):
+        appointment = self.book(self.service, self.slots[0])
+        record_transition(appointment, None, Appointment.PENDING)
+        other = Clinic.objects.create(name='North Clinic', address='2 North St', contact_number='555-0102')
+        self.doctor.clinic = other
+        self.doctor.save()
+        self.assertEqual(self.counts(), [(other.pk, Appointment.PENDING, 1)])
+
+        appointment = Appointment.objects.select_related('doctor').get(pk=appointment.pk)
+        appointment.status = Appointment.CANCELLED
+        appointment.save()
+        record_transition(appointment, Appointment.PENDING, Appointment.CANCELLED)
+        self.assertEqual(self.counts(), [(other.pk, Appointment.CANCELLED, 1)])
+        self.assertFalse(AppointmentDailyStat.objects.filter(clinic=self.clinic).exists())
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.storage = ContentAddressedStorage(location=self.enterContext(tempfile.TemporaryDirectory()))
+
+    def test_identical_content_is_stored_once(self):
+        first = self.storage.save('a.JPG', ContentFile(b'same bytes'))
+        self.assertTrue(first.startswith('cas/') and first.endswith('.jpg'))
+        self.assertEqual(self.storage.save('b.jpg', ContentFile(b'same bytes')), first)
+        self.assertNotEqual(self.storage.save('c.jpg', ContentFile(b'other bytes')), first)
+
+    def test_losing_the_race_to_create_a_blob_returns_its_name(self):
+        first = self.storage.save('a.jpg', ContentFile(b'same bytes'))
+        # Both uploads passed the exists() check before either wrote the file
+        with mock.patch.object(self.storage, 'exists', return_value=False):
+            self.assertEqual(self.storage.save('b.jpg', ContentFile(b'same bytes')), first)
+        with self.storage.open(first) as stored:
+            self.assertEqual(stored.read(), b'same bytes')
+
+
+class OpeningHoursTests(TestCase):
+    # 2026-10-19 is a Monday
+    MONDAY = datetime(2026, 10, 19)
+
+    def at(self, days, hour, minute=0):
+        return timezone.make_aware(self.MONDAY + timedelta(days=days, hours=hour, minutes=minute))
+
+    def test_seed_formats_parse_to_the_same_hours(self):
+        nested = OpeningHours.parse({'monday': {'open': '8:30', 'close': '18:00'}, 'tuesday': {'open': '', 'close': ''}})
+        ranged = OpeningHours.parse({'Monday': '8:30-18:00', 'Tuesday': 'Closed'})
+        self.assertEqual(nested, ranged)
+        self.assertEqual(ranged.to_json()['monday'], [['08:30', '18:00']])
+        self.assertEqual(ranged.formatted()['tuesday'], 'Closed')
+
+    def test_malformed_hours_are_rejected(self):
+        for raw in ({'monday': 'morningish'}, {'someday': '8:00-9:00'}, {'monday': '8:00-25:00'}, ['8:00-9:00']):
+            with self.subTest(raw=raw), self.assertRaises(ValueError):
+                OpeningHours.parse(raw)
+
+    def test_overnight_hours_are_split_at_midnight(self):
+        hours = OpeningHours.parse({'friday': '22:00-02:00', 'sunday': '20:00-01:00'})
+        self.assertEqual(hours.to_json()['friday'], [['22:00', '24:00']])
+        self.assertEqual(hours.to_json()['saturday'], [['00:00', '02:00']])
+        self.assertEqual(hours.to_json()['monday'], [['00:00', '01:00']])
+
+    def test_is_open_at(self):
+        hours = OpeningHours.parse({'monday': '08:00-12:00, 13:00-17:00', 'friday': '22:00-02:00'})
+        self.assertTrue(hours.is_open_at(self.at(0, 8)))
+        self.assertFalse(hours.is_open_at(self.at(0, 12, 30)))
+        self.assertFalse(hours.is_open_at(self.at(0, 17)))
+        self.assertTrue(hours.is_open_at(self.at(5, 1, 59)))
+        self.assertFalse(hours.is_open_at(self.at(5, 2)))
+
+    def test_next_open_window(self):
+        hours = OpeningHours.parse({'monday': '08:00-12:00', 'friday': '22:00-02:00'})
+        self.assertEqual(hours.next_open_window(self.at(0, 9)), (self.at(0, 9), self.at(0, 12)))
+        self.assertEqual(hours.next_open_window(self.at(0, 12)), (self.at(4, 22), self.at(5, 2)))
+        self.assertEqual(hours.next_open_window(self.at(5, 3)), (self.at(7, 8), self.at(7, 12)))
+        self.assertIsNone(OpeningHours.parse({}).next_open_window(self.at(0, 9)))
+
+    def test_clinics_open_at_uses_the_synced_windows(self):
+        day = Clinic.objects.create(name='Day Clinic', address='1 Main St', contact_number='555-0100',
+                                    opening_hours={'Monday': '8:30-18:00'})
+        night = Clinic.objects.create(name='Night Clinic', address='2 Main St', contact_number='555-0102',
+                                      opening_hours={'sunday': {'open': '22:00', 'close': '06:00'}})
+        self.assertEqual(list(clinics_open_at(self.at(0, 9))), [day])
+        self.assertEqual(list(clinics_open_at(self.at(0, 5))), [night])
+        night.opening_hours = {}
+        night.save()
+        self.assertEqual(list(clinics_open_at(self.at(0, 5))), [])
+
+
+def haversine_km(a, b):
+    (lat1, lon1), (lat2, lon2) = [(math.radians(lat), math.radians(lon)) for lat, lon in (a, b)]
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+class GeoTests(ScheduleTestCase):
+    def setUp(self):
+        super().setUp()
+        rng = random.Random(7)
+        self.points = {pk: (rng.uniform(50, 54), rng.uniform(-3, 2)) for pk in range(200)}
+        self.tree = KDTree([(to_unit_vector(*point), pk) for pk, point in self.points.items()])
+        self.here = (51.5, -0.1)
+
+    def brute_force(self, max_km=math.inf):
+        distances = sorted((haversine_km(self.here, point), pk) for pk, point in self.points.items())
+        return [(round(km, 6), pk) for km, pk in distances if km <= max_km]
+
+    def nearest(self, k, **kwargs):
+        found = self.tree.nearest(to_unit_vector(*self.here), k, **kwargs)
+        return [(round(chord_to_km(math.sqrt(distance)), 6), pk) for distance, pk in found]
+
+    def test_k_nearest_in_distance_order(self):
+        for k in (1, 5, 50):
+            with self.subTest(k=k):
+                self.assertEqual(self.nearest(k), self.brute_force()[:k])
+
+    def test_max_km_prunes_far_points(self):
+        within = self.brute_force(max_km=60)
+        self.assertTrue(0 < len(within) < 20)
+        self.assertEqual(self.nearest(20, max_chord=km_to_chord(60)), within)
+
+    def test_accept_filters_candidates(self):
+        even = [(km, pk) for km, pk in self.brute_force() if pk % 2 == 0]
+        self.assertEqual(self.nearest(5, accept=lambda pk: pk % 2 == 0), even[:5])
+
+    def test_nearest_clinics_only_with_free_slots(self):
+        closer = Clinic.objects.create(name='Closer Clinic', address='2 Main St', contact_number='555-0102',
+                                       latitude=51.51, longitude=-0.1)
+        far = Clinic.objects.create(name='Far Clinic', address='3 Main St', contact_number='555-0103',
+                                    latitude=55.95, longitude=-3.19)
+        self.clinic.latitude, self.clinic.longitude = 51.6, -0.1
+        with self.captureOnCommitCallbacks(execute=True):
+            # The committed save bumps the locations tag, so the clinic tree is rebuilt
+            self.clinic.save()
+        ScheduleSlot.objects.filter(pk=self.slots[0].pk).update(is_booked=True)
+        nearby, earliest = nearest_clinics_with_slots(*self.here, k=5)
+        self.assertEqual([clinic.clinic_id for clinic in nearby], [self.clinic.pk])
+        self.assertEqual(earliest, {self.clinic.pk: self.slots[1].start_time})
+        self.assertAlmostEqual(nearby[0].distance_km, haversine_km(self.here, (51.6, -0.1)), places=6)
+        self.assertEqual(nearest_clinics_with_slots(*self.here, k=5, max_km=5), ([], earliest))
+        self.assertEqual(nearest_clinics_with_slots(*self.here, specialty='Dermatology'), ([], {}))
+        self.assertNotIn(far.pk, earliest)
+        self.assertNotIn(closer.pk, earliest)
+
+
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        def clinic(name, **lists):
+            return Clinic.objects.create(name=name, address='1 Main St', contact_number='555-0100', **lists)
+
+        cls.central = clinic('Central', facilities=['MRI  Scanner', 'X-ray'], insurance_accepted=['AXA', 'Bupa'])
+        cls.north = clinic('North', facilities=['mri scanner'], insurance_accepted=['Bupa'])
+        cls.south = clinic('South', facilities=['X-ray'], insurance_accepted=['axa'])
+
+    def test_every_selected_value_must_match(self):
+        selected = {'facility': ['mri scanner'], 'insurance': ['Bupa']}
+        self.assertEqual(set(filter_clinics(Clinic.objects.all(), selected)), {self.central, self.north})
+        selected['facility'].append('X-RAY')
+        self.assertEqual(list(filter_clinics(Clinic.objects.all(), selected)), [self.central])
+
+    def test_values_differing_in_case_and_spacing_are_one_key(self):
+        self.assertEqual(set(filter_clinics(Clinic.objects.all(), {'insurance': [' AXA ']})), {self.central, self.south})
+        facilities = dict((key, count) for key, _, count in facet_counts(Clinic.objects.all())['facility'])
+        self.assertEqual(facilities, {'mri scanner': 2, 'x-ray': 2})
+
+    def test_counts_come_from_one_query(self):
+        with self.assertNumQueries(1):
+            counts = facet_counts(Clinic.objects.exclude(pk=self.south.pk))
+        self.assertEqual(counts['insurance'], [('bupa', 'Bupa', 2), ('axa', 'AXA', 1)])
+        self.assertEqual(counts['specialty'], [])
+
+    def test_saving_a_clinic_resyncs_its_attributes(self):
+        self.south.insurance_accepted = ['Bupa']
+        self.south.save(update_fields=['insurance_accepted'])
+        keys = set(ClinicAttribute.objects.filter(clinic=self.south).values_list('kind', 'key'))
+        self.assertEqual(keys, {('facility', 'x-ray'), ('insurance', 'bupa')})
+        self.south.facilities = ['MRI scanner']
+        self.south.save(update_fields=['name'])
+        self.assertFalse(ClinicAttribute.objects.filter(clinic=self.south, key='mri scanner').exists())
+
+
+class ImporterTests(TestCase):
+    PATIENT_ROW = {
+        'username': 'alice', 'email': 'Alice@example.com', 'password': 'secret-pass-1',
+        'full_name': 'Alice A', 'birth_date': '1990-05-01', 'gender': 'f', 'phone': '555-0199',
+    }
+
+    def run_import(self, content, filename, **kwargs):
+        return import_file(io.BytesIO(content), filename, PATIENT, **kwargs)
+
+    def test_malformed_lines_are_reported_and_skipped(self):
+        content = '\n'.join([json.dumps(self.PATIENT_ROW), '{"username": ', '["not", "an", "object"]']).encode()
+        result = self.run_import(content, 'patients.jsonl', dry_run=True)
+        self.assertEqual(result.created, 1)
+        self.assertEqual([line for line, _ in result.errors], [2, 3])
+
+    def test_non_utf8_file_is_reported(self):
+        content = 'username,email\nb\xe9a,b@example.com\n'.encode('latin-1')
+        result = self.run_import(content, 'patients.csv', dry_run=True)
+        self.assertEqual(result.created, 0)
+        self.assertIn('UTF-8', result.errors[0][1])
+
+    def test_malformed_csv_line_does_not_stop_the_import(self):
+        header = ','.join(self.PATIENT_ROW)
+        row = ','.join(self.PATIENT_ROW.values())
+        content = f'{header}\n"{"x" * 200_000}"\n{row}\n'.encode()
+        result = self.run_import(content, 'patients.csv', dry_run=True)
+        self.assertEqual(result.created, 1)
+        self.assertIn('Malformed CSV', result.errors[0][1])
+
+    def test_dry_run_starts_no_worker_processes(self):
+        with mock.patch('health_linkr_app.importer.ProcessPoolExecutor') as executor:
+            self.run_import(json.dumps(self.PATIENT_ROW).encode(), 'patients.jsonl', dry_run=True)
+        executor.assert_not_called()
+        self.assertFalse(User.objects.filter(username='alice').exists())
+
+    def test_import_creates_patients(self):
+        result = self.run_import(json.dumps(self.PATIENT_ROW).encode(), 'patients.jsonl', workers=1)
+        self.assertEqual((result.created, result.errors), (1, []))
+        patient = PatientProfile.objects.select_related('user').get(user__username='alice')
+        self.assertEqual((patient.user.email, patient.gender), ('alice@example.com', 'F'))
+        self.assertTrue(patient.user.check_password('secret-pass-1'))
+
+
+class SearchTests(ScheduleTestCase):
+    def test_imported_doctors_are_searchable(self):
+        row = {'username': 'dr-jones', 'email': 'jones@example.com', 'password': 'secret-pass-1',
+               'first_name': 'Indiana', 'last_name': 'Jones', 'specialty': 'Archaeology',
+               'qualification': 'PhD', 'consultation_fee': '80'}
+        with self.captureOnCommitCallbacks(execute=True):
+            result = import_file(io.BytesIO(json.dumps(row).encode()), 'doctors.jsonl', DOCTOR,
+                                 clinic=self.clinic, workers=1)
+        self.assertEqual(result.created, 1)
+        doctor = DoctorProfile.objects.get(user__username='dr-jones')
+        self.assertEqual(search_ids('indiana archaeo', SearchDocument.DOCTOR), [doctor.pk])
+
+    def test_memory_index_sees_writes_made_by_other_processes(self):
+        self.assertEqual(search_ids('smith', SearchDocument.DOCTOR), [self.doctor.pk])
+        # Another process's change reaches this one only through the database
+        with self.captureOnCommitCallbacks(execute=False):
+            User.objects.filter(pk=self.doctor.user_id).update(last_name='Jones')
+            reindex(SearchDocument.DOCTOR, [self.doctor.pk])
+        self.assertEqual(search_ids('smith', SearchDocument.DOCTOR), [])
+        self.assertEqual(search_ids('jones', SearchDocument.DOCTOR), [self.doctor.pk])
+
+
+class NPlusOneTests(ScheduleTestCase):
+    def load_doctors(self, slots):
+        return [slot.doctor.specialty for slot in slots]
+
+    def test_raises_at_the_threshold(self):
+        with detect(mode='raise', threshold=3):
+            slots = ScheduleSlot.objects.order_by('start_time')
+            self.load_doctors(slots[:2])
+            with self.assertRaisesMessage(NPlusOneError, 'health_linkr_app.ScheduleSlot.doctor lazily loaded 3 times'):
+                self.load_doctors(slots[2:3])
+
+    def test_allowlisted_relation_is_not_reported(self):
+        with detect(mode='raise', threshold=2, allowlist=['health_linkr_app.ScheduleSlot.*']):
+            self.load_doctors(ScheduleSlot.objects.all())
+
+    def test_allow_lazy_loads_suppresses_detection(self):
+        with detect(mode='raise', threshold=2):
+            with allow_lazy_loads():
+                self.load_doctors(ScheduleSlot.objects.all())
+            allow_lazy_loads(self.load_doctors)(ScheduleSlot.objects.all())
+
+    def test_select_related_is_not_a_lazy_load(self):
+        with detect(mode='raise', threshold=2):
+            self.load_doctors(ScheduleSlot.objects.select_related('doctor'))
+
+
+class UserAgentTests(TestCase):
+    AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36'
+
+    def setUp(self):
+        cache.clear()
+
+    def test_known_agent_costs_no_query(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            agent_id = intern_user_agent(self.AGENT)
+        with self.assertNumQueries(0):
+            self.assertEqual(intern_user_agent(self.AGENT), agent_id)
+        agent = UserAgent.objects.get(pk=agent_id)
+        self.assertEqual((agent.browser, agent.os, agent.device_type), ('Chrome', 'Windows', 'desktop'))
+
+    def test_deleted_agent_is_created_again(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            agent_id = intern_user_agent(self.AGENT)
+        UserAgent.objects.filter(pk=agent_id).delete()
+        self.assertTrue(UserAgent.objects.filter(pk=intern_user_agent(self.AGENT)).exists())
+
+
+class ApiTests(ScheduleTestCase):
+    def test_encoding_honours_q_values(self):
+        self.assertEqual(_choose_encoding('gzip, deflate'), 'gzip')
+        self.assertIsNone(_choose_encoding('gzip;q=0, deflate'))
+        self.assertIsNone(_choose_encoding('identity'))
+        self.assertIsNone(_choose_encoding(''))
+        self.assertEqual(_choose_encoding('*;q=0.5'), _choose_encoding('br, gzip'))
+        self.assertEqual(_choose_encoding('br;q=0, gzip;q=0.1'), 'gzip')
+        self.assertIsNone(_choose_encoding('brotli, xgzip'))
+
+    def test_open_slots_skip_inactive_doctors(self):
+        request = RequestFactory().get('/')
+        self.assertEqual(RESOURCES['slots'].queryset(request).count(), 8)
+        DoctorProfile.objects.filter(pk=self.doctor.pk).update(is_active=False)
+        self.assertEqual(RESOURCES['slots'].queryset(request).count(), 0)
+
+
+class IdempotencyTests(ScheduleTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.calls = 0
+
+    def post(self, view, key='retry-1', **data):
+        request = RequestFactory().post('/appointments/', {'idempotency_key': key, **data})
+        request.user = self.patient.user
+        request.resolver_match = resolve('/appointments/')
+        return idempotent(view)(request)
+
+    def redirecting_view(self, request):
+        self.calls += 1
+        mark_completed(request)
+        return HttpResponseRedirect('/appointments/')
+
+    def test_retry_replays_the_redirect(self):
+        self.post(self.redirecting_view, slot='1')
+        response = self.post(self.redirecting_view, slot='1')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual((response.status_code, response['Location']), (302, '/appointments/'))
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+
+    def test_key_reused_for_other_data_is_rejected(self):
+        self.post(self.redirecting_view, slot='1')
+        self.assertEqual(self.post(self.redirecting_view, slot='2').status_code, 422)
+
+    def test_other_responses_are_not_replayed(self):
+        def form_with_errors(request):
+            self.calls += 1
+            return HttpResponse('Please pick a slot.')
+
+        self.post(form_with_errors)
+        self.assertEqual(self.post(form_with_errors).content, b'Please pick a slot.')
+        self.assertEqual(self.calls, 2)
+
+    def test_unmarked_redirects_are_not_replayed(self):
+        def failed_booking(request):
+            self.calls += 1
+            return HttpResponseRedirect('/book/1/')
+
+        self.post(failed_booking)
+        self.post(failed_booking)
+        self.assertEqual(self.calls, 2)
+
+    def test_retry_after_a_failed_booking_books(self):
+        self.service.doctors.add(self.doctor)
+        self.client.force_login(self.patient.user)
+        url = f'/book/{self.doctor.pk}/'
+        data = {'slot': self.slots[0].pk, 'service': self.service.pk}
+        with mock.patch('health_linkr_app.views.allocate', side_effect=SlotAllocationError('Slot taken')):
+            response = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY='book-1')
+        self.assertEqual(response['Location'], url)
+        self.assertFalse(Appointment.objects.exists())
+
+        response = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY='book-1')
+        self.assertEqual(response['Location'], '/appointments/')
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Appointment.objects.get().slot_id, self.slots[0].pk)
+
+        response = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY='book-1')
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(Appointment.objects.count(), 1)
+
+
+class ReplicaRouterTests(TestCase):
+    databases = {'default', 'replica_1'}
+
+    def queries_on(self, alias, queryset):
+        with CaptureQueriesContext(connections[alias]) as queries:
+            list(queryset)
+        return len(queries)
+
+    def test_reads_use_the_primary_by_default(self):
+        self.assertEqual(self.queries_on('replica_1', Clinic.objects.all()), 0)
+        self.assertEqual(self.queries_on('default', Clinic.objects.all()), 1)
+
+    def test_reads_inside_read_from_replica_use_the_replica(self):
+        with read_from_replica():
+            self.assertEqual(Clinic.objects.all().db, 'replica_1')
+            self.assertEqual(self.queries_on('replica_1', Clinic.objects.all()), 1)
+        self.assertEqual(Clinic.objects.all().db, 'default')
+
+    def test_writes_and_sessions_stay_on_the_primary(self):
+        with read_from_replica():
+            self.assertEqual(router.db_for_write(Clinic), 'default')
+            self.assertEqual(Session.objects.all().db, 'default')
+            self.assertEqual(self.queries_on('replica_1', Session.objects.all()), 0)
+
+    def test_cached_regions_are_filled_from_the_primary(self):
+        region = CacheRegion('replica_test')
+        with read_from_replica():
+            used = region.get_or_set(['clinics'], lambda: Clinic.objects.all().db)
+            self.assertEqual(Clinic.objects.all().db, 'replica_1')
+        self.assertEqual(used, 'default')
+
+
+class ReplicaRoutingMiddlewareTests(TestCase):
+    databases = {'default', 'replica_1'}
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.session = SessionStore()
+
+    def serve(self, method, view):
+        request = getattr(self.factory, method)('/')
+        request.session = self.session
+        middleware = ReplicaRoutingMiddleware(lambda request: view(request))
+        middleware.process_view(request, view, (), {})
+        return middleware(request)
+
+    def test_read_only_view_is_served_from_the_replica(self):
+        response = self.serve('get', _read_only_view)
+        self.assertEqual(response.content, b'replica_1')
+
+    def test_unsafe_request_pins_the_session_to_the_primary(self):
+        self.serve('post', _write_view)
+        self.assertIn(PIN_SESSION_KEY, self.session)
+        response = self.serve('get', _read_only_view)
+        self.assertEqual(response.content, b'default')
+
+    def test_failed_unsafe_request_does_not_pin(self):
+        self.serve('post', lambda request: HttpResponse(status=400))
+        self.assertNotIn(PIN_SESSION_KEY, self.session)
+        self.assertEqual(self.serve('get', _read_only_view).content, b'replica_1')
+
+
+@replica_reads
+def _read_only_view(request):
+    return HttpResponse(Clinic.objects.all().db)
+
+
+def _write_view(request):
+    return HttpResponse(status=302)
@@ -0,0 +1,25 @@
+from django.db import connection
+
+
+def statement_timeout(milliseconds):
+    """Decorator giving a view (function or class) its own statement timeout
+
+    Applied by StatementTimeoutMiddleware; STATEMENT_TIMEOUTS in settings,
+    keyed by URL name, takes precedence.
+    """
+    def decorator(view):
+        view.statement_timeout = milliseconds
+        return view
+    return decorator
+
+
+def set_statement_timeout(milliseconds, using=None):
+    """Set the session statement timeout on PostgreSQL; None restores the connection default"""
+    conn = connection if using is None else using
+    if conn.vendor != 'postgresql':
+        return
+    with conn.cursor() as cursor:
+        if milliseconds is None:
+            cursor.execute('RESET statement_timeout')
+        else:
+            cursor.execute('SELECT set_config(%s, %s, false)', ['statement_timeout', str(int(milliseconds))])
@@ -1,11 +1,16 @@
-from django.urls import path
+from django.urls import path, re_path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, views
 
 urlpatterns = [
   path('', views.home, name='home'),
   path('clinic/<int:clinic_id>/', views.clinic_detail, name='clinic_detail'),
+  path('clinics/', views.clinic_finder, name='clinic_finder'),
+  path('clinics/nearby/', views.nearby_clinics, name='nearby_clinics'),
+  path('search/', views.search, name='search'),
   path('book/<int:doctor_id>/', views.book_appointment, name='book_appointment'),
+  path('book/<int:doctor_id>/waitlist/', views.join_waitlist, name='join_waitlist'),
+  path('slot/<int:slot_id>/hold/', views.hold_slot, name='hold_slot'),
   path('appointments/', views.appointments, name='appointments'),
   path('appointment/<int:appointment_id>/cancel/', views.cancel_appointment, name='cancel_appointment'),
   path('appointment/<int:appointment_id>/reschedule/', views.reschedule_appointment, name='reschedule_appointment'),
@@ -14,6 +19,13 @@ urlpatterns = [
   path('signup/', views.signup, name='signup'),
   path('profile/', views.profile, name='profile'),
   path('profile/password/', views.change_password, name='change_password'),
+  path('api/v1/', api.api_index, name='api_index'),
+  path('api/v1/<str:resource>/', api.api_resource, name='api_list'),
+  path('api/v1/<str:resource>/<int:pk>/', api.api_resource, name='api_detail'),
+  path('internal/cache-metrics/', views.cache_metrics, name='cache_metrics'),
+  path('internal/request-profile/', views.request_profile, name='request_profile'),
+  path('internal/password-hashing/', views.password_hashing_metrics, name='password_hashing_metrics'),
+  re_path(r'^avatars/(?P<digest>[0-9a-f]{64})/(?P<size>[0-9]+)/$', views.profile_photo, name='profile_photo'),
   path('password-reset/', 
       auth_views.PasswordResetView.as_view(template_name='password_reset.html'),
       name='password_reset'
@@ -1,50 +1,167 @@
+import os
+
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.contrib.auth import login, authenticate, update_session_auth_hash
+from django.contrib.auth import login, update_session_auth_hash
 from django.contrib.auth.forms import AuthenticationForm
 from django.urls import reverse_lazy
 from django.views.generic.edit import UpdateView
 from django.utils import timezone
 from django.db import transaction
 from django.db.models import Q
+from django.core.files.storage import default_storage
+from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_POST
+from .passwords import hashing_pool
+from .profiling import report as profiling_report
 from .permissions import admin_required, patient_required, doctor_required, is_admin, is_doctor
 from .models import (
     Clinic, Service, ScheduleSlot, Appointment, DoctorProfile, 
-    PatientProfile, User, SessionLog, Notification
+    PatientProfile, User, SessionLog, Notification, SearchDocument, ClinicAttribute, MediaBlob
 )
 from .forms import (
     AppointmentForm, CustomUserCreationForm, PatientProfileForm,
-    UserProfileUpdateForm, PasswordChangeCustomForm
+    UserProfileUpdateForm, PasswordChangeCustomForm, WaitlistForm, NearbyClinicsForm
+)
+from .caching import (
+    CATALOG_TAG, clinic_pages, clinic_tag, doctor_slots, doctor_tag,
+    patient_appointments, patient_tag, region_metrics, service_catalog
 )
+from .facets import FACET_FIELDS, facet_counts, filter_clinics
+from .geo import nearest_clinics_with_slots
+from .opening_hours import clinics_open_at
+from .search import search_documents
+from .fragments import CARD_INDEX_FIELDS, appointment_cards
+from .routers import replica_reads
+from .timeouts import statement_timeout
+from .allocation import (
+    SlotAllocationError, allocate, contiguous_minutes, find_run, release, service_duration
+)
+from .idempotency import idempotent, mark_completed
+from .holds import held_slot_ids, hold_seconds, is_held_by_other, place_hold, release_hold
+from .images import photo_sizes, variant_name
+from .media import serve_file
+from .storage import blob_name
+from .stats import record_transition
+from .waitlist import fulfil_entries, offer_freed_slots_on_commit
 
+@replica_reads
 def home(request):
-  clinics = Clinic.objects.all()
-  services = Service.objects.all()
-  return render(request, 'home.html', {'clinics': clinics, 'services': services})
+  catalog = service_catalog.get_or_set(
+    ('home',),
+    lambda: {'clinics': list(Clinic.objects.all()), 'services': list(Service.objects.all())},
+    tags=[CATALOG_TAG]
+  )
+  return render(request, 'home.html', catalog)
 
+@replica_reads
 def clinic_detail(request, clinic_id):
-  clinic = get_object_or_404(Clinic, id=clinic_id)
-  doctors = clinic.doctors.all()
-  return render(request, 'clinic_detail.html', {'clinic': clinic, 'doctors': doctors})
+  def load():
+    clinic = get_object_or_404(Clinic, id=clinic_id)
+    return {
+      'clinic': clinic,
+      'doctors': list(clinic.doctors.select_related('user')),
+      'services': list(clinic.get_available_services()),
+    }
+  page = clinic_pages.get_or_set((clinic_id,), load, tags=[clinic_tag(clinic_id)])
+  return render(request, 'clinic_detail.html', page)
+
+@replica_reads
+def clinic_finder(request):
+  selected = {kind: request.GET.getlist(kind) for kind in FACET_FIELDS}
+  open_now = request.GET.get('open_now') == '1'
+  clinics = Clinic.objects.filter(is_active=True)
+  if open_now:
+    clinics = clinics_open_at(timezone.now(), clinics)
+  clinics = filter_clinics(clinics, selected)
+  counts = facet_counts(clinics)
+  facets = [
+    (label, kind, [
+      (key, value, count, value in selected[kind] or key in selected[kind]) for key, value, count in counts[kind]
+    ])
+    for kind, label in ClinicAttribute.KIND_CHOICES
+  ]
+  params = request.GET.copy()
+  params.pop('page', None)
+  return render(request, 'clinic_finder.html', {
+    'page': Paginator(clinics.order_by('name', 'pk'), 20).get_page(request.GET.get('page')),
+    'facets': facets,
+    'open_now': open_now,
+    'querystring': params.urlencode(),
+  })
+
+@replica_reads
+def nearby_clinics(request):
+  form = NearbyClinicsForm(request.GET or None)
+  results = []
+  if form.is_valid():
+    data = form.cleaned_data
+    nearby, earliest = nearest_clinics_with_slots(
+      data['latitude'], data['longitude'], k=data['k'] or 10, max_km=data['max_km'],
+      specialty=data['specialty'], service=data['service']
+    )
+    clinics = Clinic.objects.in_bulk([hit.clinic_id for hit in nearby])
+    results = [
+      {'clinic': clinics[hit.clinic_id], 'distance_km': hit.distance_km, 'next_slot': earliest[hit.clinic_id]}
+      for hit in nearby if hit.clinic_id in clinics
+    ]
+  return render(request, 'nearby_clinics.html', {'form': form, 'results': results})
+
+@replica_reads
+def search(request):
+  query = request.GET.get('q', '').strip()
+  kind = request.GET.get('kind', '')
+  kinds = [kind] if kind in dict(SearchDocument.KIND_CHOICES) else None
+  open_now = request.GET.get('open_now') == '1'
+  results = {SearchDocument.CLINIC: [], SearchDocument.DOCTOR: [], SearchDocument.SERVICE: []}
+  if query:
+    clinic_ids = set(clinics_open_at(timezone.now()).values_list('pk', flat=True)) if open_now else None
+    hits = search_documents(query, kinds=kinds, clinic_ids=clinic_ids, limit=60)
+    querysets = {
+      SearchDocument.CLINIC: Clinic.objects.all(),
+      SearchDocument.DOCTOR: DoctorProfile.objects.select_related('user', 'clinic'),
+      SearchDocument.SERVICE: Service.objects.select_related('clinic'),
+    }
+    for result_kind, queryset in querysets.items():
+      ids = [hit.object_id for hit in hits if hit.kind == result_kind]
+      if ids:
+        objects = queryset.in_bulk(ids)
+        results[result_kind] = [objects[pk] for pk in ids if pk in objects]
+  return render(request, 'search.html', {
+    'query': query, 'kind': kind, 'open_now': open_now,
+    'clinics': results[SearchDocument.CLINIC],
+    'doctors': results[SearchDocument.DOCTOR],
+    'services': results[SearchDocument.SERVICE],
+  })
 
+@replica_reads
 @login_required
 @patient_required
 def appointments(request):
     """View for patients to see their appointments"""
     try:
         patient = request.user.patient_profile
-        appointments = Appointment.objects.filter(
-            patient=patient
-        ).select_related('doctor', 'service', 'slot').order_by('datetime')
-        
         status_filter = request.GET.get('status')
-        if status_filter and status_filter != 'all':
-            appointments = appointments.filter(status=status_filter.upper())
+
+        def load():
+            appointments = Appointment.objects.filter(patient=patient).order_by('datetime')
+            if status_filter and status_filter != 'all':
+                appointments = appointments.filter(status=status_filter.upper())
+            return list(appointments.values_list(*CARD_INDEX_FIELDS))
+
+        # The list holds only what is needed to pick cards; the cards themselves are cached fragments
+        rows = patient_appointments.get_or_set(
+            (patient.id, status_filter or 'all'), load, tags=[patient_tag(patient.id)]
+        )
+        now = timezone.now()
+        appointments = appointment_cards(request, rows, now)
         
         context = {
             'appointments': appointments,
-            'now': timezone.now(),
+            'now': now,
             'status_choices': Appointment.STATUS_CHOICES,
             'current_status': status_filter or 'all'
         }
@@ -54,8 +171,10 @@ def appointments(request):
         messages.error(request, 'Please complete your patient profile first.')
         return redirect('profile')
 
+@statement_timeout(5000)
 @login_required
 @patient_required
+@idempotent
 def book_appointment(request, doctor_id):
     doctor = get_object_or_404(DoctorProfile, id=doctor_id)
     
@@ -68,11 +187,24 @@ def book_appointment(request, doctor_id):
     
     # Get only future slots that are available
     current_time = timezone.now()
-    slots = doctor.schedule_slots.filter(
-        is_booked=False,
-        is_available=True,
-        start_time__gt=current_time
-    ).order_by('start_time')
+    slots = doctor_slots.get_or_set(
+        (doctor.id,),
+        lambda: list(doctor.schedule_slots.filter(
+            is_booked=False,
+            is_available=True,
+            start_time__gt=current_time
+        ).order_by('start_time')),
+        tags=[doctor_tag(doctor.id)]
+    )
+
+    # Hide slots that have started since the listing was cached, and slots
+    # other patients are in the middle of booking
+    held = held_slot_ids(doctor.id, exclude_user=request.user)
+    slots = [slot for slot in slots if slot.start_time > current_time and slot.id not in held]
+    # Free time from each slot, so services longer than one slot only offer starts that fit
+    run_minutes = contiguous_minutes(slots)
+    for slot in slots:
+        slot.run_minutes = run_minutes[slot.id]
     
     # Get available services for this doctor
     services = doctor.services.filter(is_active=True)
@@ -120,6 +252,15 @@ def book_appointment(request, doctor_id):
         except Service.DoesNotExist:
             messages.error(request, 'The selected service is not available.')
             return redirect('book_appointment', doctor_id=doctor_id)
+
+        run = find_run(slot, service_duration(service, slot), exclude_ids=held)
+        if run is None:
+            messages.error(request, f'{service.name} needs {service.duration_minutes} minutes; please choose a start time with enough free time after it.')
+            return redirect('book_appointment', doctor_id=doctor_id)
+
+        if any(is_held_by_other(run_slot.id, request.user) for run_slot in run):
+            messages.error(request, 'The selected time slot is being booked by another patient.')
+            return redirect('book_appointment', doctor_id=doctor_id)
             
         if form.is_valid():
             try:
@@ -127,13 +268,12 @@ def book_appointment(request, doctor_id):
                     appt = form.save(commit=False)
                     appt.patient = patient
                     appt.doctor = doctor
-                    appt.slot = slot
-                    appt.datetime = slot.start_time
                     appt.service = service
-                    appt.save()
+                    allocate(appt, run)
+                    record_transition(appt, None, appt.status)
                     
-                    slot.is_booked = True
-                    slot.save()
+                    transaction.on_commit(lambda: release_hold([run_slot.id for run_slot in run], request.user, doctor.id))
+                    fulfil_entries(patient, doctor)
                     
                     # Notify patient
                     Notification.objects.create(
@@ -150,10 +290,15 @@ def book_appointment(request, doctor_id):
                         title='New Appointment',
                         message=f'New appointment for {service.name} with {patient.full_name} scheduled for {slot.start_time.strftime("%B %d, %Y at %I:%M %p")}'
                     )
+                
+                # Only a committed booking may be replayed to a retry
+                mark_completed(request)
+                messages.success(request, 'Your appointment has been booked successfully.')
+                return redirect('appointments')
                     
-                    messages.success(request, 'Your appointment has been booked successfully.')
-                    return redirect('appointments')
-                    
+            except SlotAllocationError as e:
+                messages.error(request, str(e))
+                return redirect('book_appointment', doctor_id=doctor_id)
             except Exception as e:
                 messages.error(request, 'There was an error booking your appointment. Please try again.')
                 return redirect('book_appointment', doctor_id=doctor_id)
@@ -164,9 +309,61 @@ def book_appointment(request, doctor_id):
         'form': form,
         'doctor': doctor,
         'slots': slots,
-        'services': services
+        'services': services,
+        'waitlist_form': WaitlistForm(doctor=doctor)
     })
 
+@login_required
+@patient_required
+@require_POST
+def join_waitlist(request, doctor_id):
+    doctor = get_object_or_404(DoctorProfile, id=doctor_id)
+    try:
+        patient = request.user.patient_profile
+    except PatientProfile.DoesNotExist:
+        messages.error(request, 'Please complete your patient profile first.')
+        return redirect('profile')
+
+    form = WaitlistForm(request.POST, doctor=doctor)
+    if form.is_valid():
+        entry = form.save(commit=False)
+        entry.patient = patient
+        entry.doctor = doctor
+        entry.save()
+        messages.success(request, 'You have been added to the waitlist. We will notify you if a slot opens up.')
+    else:
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+    return redirect('book_appointment', doctor_id=doctor_id)
+
+@statement_timeout(2000)
+@login_required
+@patient_required
+@require_POST
+def hold_slot(request, slot_id):
+    """Reserve the slots a booking needs for the current patient while they fill in the form
+
+    With a ``service`` the whole run of slots covering its duration is held,
+    otherwise just the selected slot.
+    """
+    slot = get_object_or_404(
+        ScheduleSlot,
+        id=slot_id,
+        is_booked=False,
+        is_available=True,
+        start_time__gt=timezone.now()
+    )
+    service = None
+    if request.POST.get('service'):
+        service = Service.objects.filter(id=request.POST['service'], doctors=slot.doctor_id, is_active=True).first()
+    run = find_run(slot, service_duration(service, slot))
+    if run is None:
+        return JsonResponse({'held': False, 'error': 'There is not enough free time after this slot for the selected service.'}, status=409)
+    if not place_hold(run, request.user):
+        return JsonResponse({'held': False, 'error': 'This slot is being booked by another patient.'}, status=409)
+    return JsonResponse({'held': True, 'slots': [run_slot.id for run_slot in run], 'expires_in': hold_seconds()})
+
 @login_required
 @patient_required
 def cancel_appointment(request, appointment_id):
@@ -183,14 +380,15 @@ def cancel_appointment(request, appointment_id):
     try:
         with transaction.atomic():
             # Update appointment status
+            old_status = appointment.status
             appointment.status = 'CANCELLED'
             appointment.cancellation_reason = request.POST.get('reason', 'Cancelled by patient')
-            appointment.save()
+            appointment.save()  # Frees every slot the appointment occupied
+            record_transition(appointment, old_status, appointment.status)
             
-            # Free up the slot
-            if appointment.slot:
-                appointment.slot.is_booked = False
-                appointment.slot.save()
+            freed_slots = appointment.freed_slots
+            if freed_slots:
+                offer_freed_slots_on_commit(freed_slots)
             
             # Notify the doctor
             Notification.objects.create(
@@ -224,6 +422,10 @@ def reschedule_appointment(request, appointment_id):
         
         try:
             with transaction.atomic():
+                # Free up the old slots first, so the new time may overlap them
+                old_datetime = appointment.datetime
+                freed_slots = release(appointment)
+                
                 # Get the new slot
                 new_slot = ScheduleSlot.objects.select_for_update().get(
                     id=new_slot_id,
@@ -233,19 +435,17 @@ def reschedule_appointment(request, appointment_id):
                     start_time__gt=timezone.now()
                 )
                 
-                # Free up the old slot
-                if appointment.slot:
-                    appointment.slot.is_booked = False
-                    appointment.slot.save()
+                # Claim enough slots from the new start for the service
+                run = find_run(new_slot, service_duration(appointment.service, new_slot))
+                if run is None:
+                    raise SlotAllocationError('There is not enough free time after the selected slot for this service.')
+                allocate(appointment, run)
+                record_transition(appointment, appointment.status, appointment.status, old_datetime)
                 
-                # Update appointment with new slot
-                appointment.slot = new_slot
-                appointment.datetime = new_slot.start_time
-                appointment.save()
-                
-                # Mark new slot as booked
-                new_slot.is_booked = True
-                new_slot.save()
+                claimed = {slot.id for slot in run}
+                freed_slots = [slot for slot in freed_slots if slot.id not in claimed]
+                if freed_slots:
+                    offer_freed_slots_on_commit(freed_slots)
                 
                 # Notify the doctor
                 Notification.objects.create(
@@ -260,6 +460,8 @@ def reschedule_appointment(request, appointment_id):
                 
         except ScheduleSlot.DoesNotExist:
             messages.error(request, 'The selected time slot is no longer available.')
+        except SlotAllocationError as e:
+            messages.error(request, str(e))
         except Exception as e:
             messages.error(request, 'There was an error rescheduling your appointment.')
         
@@ -295,11 +497,9 @@ def signup(request):
             profile.user = user
             profile.save()
             
-            username = user_form.cleaned_data.get('username')
-            raw_password = user_form.cleaned_data.get('password1')
-            # Login the user - this will trigger the user_logged_in signal
-            user = authenticate(username=username, password=raw_password)
-            login(request, user)
+            # Login the user - this will trigger the user_logged_in signal.
+            # The password was just hashed by the form, so skip authenticate()
+            login(request, user, backend='health_linkr_app.passwords.PooledModelBackend')
             messages.success(request, 'Account created successfully!')
             return redirect('home')
     else:
@@ -359,3 +559,42 @@ def change_password(request):
         form = PasswordChangeCustomForm(request.user)
     return render(request, 'change_password.html', {'form': form})
 
+def profile_photo(request, digest, size):
+    """Serve a resized profile photo variant with long-lived cache headers"""
+    size = int(size)
+    if size not in photo_sizes():
+        raise Http404
+    path = os.path.join(settings.MEDIA_ROOT, variant_name(digest, size))
+    if os.path.exists(path):
+        return serve_file(request, path, etag=f'{digest}-{size}', max_age=31536000, immutable=True)
+
+    # Variants are still being generated; serve the original briefly
+    name = MediaBlob.objects.filter(digest=digest, ref_count__gt=0).values_list('name', flat=True).first()
+    if not name:
+        raise Http404
+    return serve_file(request, default_storage.path(name), etag=digest, max_age=60)
+
+def media_blob(request, digest, ext=''):
+    """Serve a content-addressed media file; the content hash doubles as the ETag"""
+    path = os.path.join(settings.MEDIA_ROOT, blob_name(digest, ext or ''))
+    if not os.path.exists(path):
+        raise Http404
+    return serve_file(request, path, etag=digest, max_age=31536000, immutable=True)
+
+@login_required
+@admin_required
+def cache_metrics(request):
+    """Hit/miss counters of the view cache regions in this process"""
+    return JsonResponse(region_metrics())
+
+@login_required
+@admin_required
+def password_hashing_metrics(request):
+    """Queueing counters of the password hashing pool in this process"""
+    return JsonResponse(hashing_pool.metrics())
+
+@login_required
+@admin_required
+def request_profile(request):
+    """Per-view request timings and duplicate queries from the profiling middleware"""
+    return JsonResponse(profiling_report())
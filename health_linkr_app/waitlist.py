@@ -0,0 +1,154 @@
+import heapq
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+
+from .allocation import contiguous_minutes, free_slots, iter_runs, service_duration
+from .holds import place_hold
+from .models import Notification, ScheduleSlot, WaitlistEntry
+
+logger = logging.getLogger(__name__)
+
+
+def offer_seconds():
+    return getattr(settings, 'WAITLIST_OFFER_SECONDS', 3600)
+
+
+def _assign(slots, entries, free):
+    """Match freed slots to waitlist entries for one doctor
+
+    Sweeps slots in start order; entries whose window has opened sit in a heap
+    ordered by (priority, registration time), and entries whose window has
+    closed are dropped lazily when they reach the top. An entry is only
+    offered a slot starting a run of back-to-back ``free`` slots long enough
+    for its service; entries needing more stay queued for later slots.
+    Returns (slot, run, entry) triples with no slot in two runs.
+    """
+    free = list(free)
+    free_minutes = contiguous_minutes(free)
+    position = {slot.pk: index for index, slot in enumerate(free)}
+    entries = sorted(entries, key=lambda e: e.window_start)
+    heap = []
+    offered_patients = set()
+    taken = set()
+    assignments = []
+    i = 0
+    for slot in sorted(slots, key=lambda s: s.start_time):
+        while i < len(entries) and entries[i].window_start <= slot.start_time:
+            entry = entries[i]
+            heapq.heappush(heap, (-entry.priority, entry.created_at, entry.pk, entry))
+            i += 1
+        if slot.pk in taken or slot.pk not in position:
+            continue
+        too_long = []
+        while heap:
+            item = heapq.heappop(heap)
+            entry = item[3]
+            duration = service_duration(entry.service, slot)
+            if entry.window_end < slot.start_time + duration or entry.patient_id in offered_patients:
+                # Windows only close as the sweep moves forward, so drop it for good
+                continue
+            if free_minutes[slot.pk] * 60 < duration.total_seconds():
+                too_long.append(item)
+                continue
+            run = next(iter_runs(free[position[slot.pk]:], duration))
+            taken.update(run_slot.pk for run_slot in run)
+            offered_patients.add(entry.patient_id)
+            assignments.append((slot, run, entry))
+            break
+        for item in too_long:
+            heapq.heappush(heap, item)
+    return assignments
+
+
+def offer_freed_slots(slots):
+    """Offer freed slots to the best waitlisted patients in one batched pass
+
+    Returns the number of offers made.
+    """
+    now = timezone.now()
+    slot_ids = [slot.pk for slot in slots if slot is not None]
+    slots = list(ScheduleSlot.objects.filter(
+        pk__in=slot_ids, is_booked=False, is_available=True, start_time__gt=now
+    ).select_related('doctor__user'))
+    if not slots:
+        return 0
+
+    stale_offer = now - timedelta(seconds=offer_seconds())
+    entries = WaitlistEntry.objects.filter(
+        Q(status=WaitlistEntry.ACTIVE) | Q(status=WaitlistEntry.OFFERED, offered_at__lt=stale_offer),
+        doctor_id__in={slot.doctor_id for slot in slots},
+        window_start__lte=max(slot.start_time for slot in slots),
+        window_end__gte=min(slot.end_time for slot in slots),
+    ).select_related('patient__user', 'service')
+
+    by_doctor = defaultdict(list)
+    for entry in entries:
+        by_doctor[entry.doctor_id].append(entry)
+    slots_by_doctor = defaultdict(list)
+    for slot in slots:
+        slots_by_doctor[slot.doctor_id].append(slot)
+
+    offered = []
+    notifications = []
+    for doctor_id, doctor_slots in slots_by_doctor.items():
+        doctor_entries = by_doctor.get(doctor_id, [])
+        if not doctor_entries:
+            continue
+        # Runs may continue into slots that were already free
+        longest = max(service_duration(entry.service, doctor_slots[0]) for entry in doctor_entries)
+        free = free_slots(doctor_id, after=min(slot.start_time for slot in doctor_slots) - timedelta(microseconds=1))
+        free = free.filter(start_time__lt=max(slot.start_time for slot in doctor_slots) + longest)
+        for slot, run, entry in _assign(doctor_slots, doctor_entries, free):
+            # Keep every slot of the run for the patient while they respond
+            if not place_hold(run, entry.patient.user, ttl=offer_seconds()):
+                continue
+            entry.status = WaitlistEntry.OFFERED
+            entry.offered_slot = slot
+            entry.offered_at = now
+            offered.append(entry)
+            service = f' for {entry.service.name}' if entry.service else ''
+            notifications.append(Notification(
+                user=entry.patient.user,
+                type='IN_APP',
+                title='Appointment Slot Available',
+                message=f'A slot{service} with Dr. {slot.doctor.user.get_full_name()} opened up on '
+                        f'{slot.start_time.strftime("%B %d, %Y at %I:%M %p")}. It is reserved for you for '
+                        f'{offer_seconds() // 60} minutes: {reverse("book_appointment", args=[doctor_id])}'
+            ))
+
+    WaitlistEntry.objects.bulk_update(offered, ['status', 'offered_slot', 'offered_at'])
+    Notification.objects.bulk_create(notifications)
+    return len(offered)
+
+
+def offer_freed_slots_on_commit(slots):
+    """Offer freed slots once the current transaction commits
+
+    The cancellation has already been committed when the offers run, so a
+    failure here is logged rather than raised back at the caller.
+    """
+    slots = list(slots)
+
+    def offer():
+        try:
+            offer_freed_slots(slots)
+        except Exception:
+            logger.exception('Failed to offer freed slots %s', [slot.pk for slot in slots if slot is not None])
+
+    transaction.on_commit(offer)
+
+
+def fulfil_entries(patient, doctor):
+    """Close a patient's waitlist entries for a doctor once they have booked"""
+    WaitlistEntry.objects.filter(
+        patient=patient,
+        doctor=doctor,
+        status__in=[WaitlistEntry.ACTIVE, WaitlistEntry.OFFERED]
+    ).update(status=WaitlistEntry.FULFILLED)